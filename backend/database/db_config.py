@@ -17,8 +17,10 @@ def init_db(app):
     # Connection pool settings for production
     # По принципу Database Optimizer: "Use Connection Pooling"
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-        'pool_size': 10,
-        'max_overflow': 20,
+        # Запрос держит соединение и пока ждёт Marzban — пул должен вмещать
+        # потоки/greenlet'ы воркера (см. gunicorn.conf.py)
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
         'pool_recycle': 3600,
         'pool_pre_ping': True,
         'connect_args': {
@@ -3,5 +3,10 @@
 from database.models.user_model import User
 from database.models.payment_model import Payment
 from database.models.connection_log_model import ConnectionLog
+from database.models.sync_state_model import SyncState
+from database.models.stats_model import StatsCounter, RevenueBucket
+from database.models.broadcast_model import Broadcast
+from database.models.notification_model import NotificationOutbox
+from database.models.payment_event_model import PaymentEvent
 
-__all__ = ['User', 'Payment', 'ConnectionLog']
+__all__ = ['User', 'Payment', 'ConnectionLog', 'SyncState', 'StatsCounter', 'RevenueBucket', 'Broadcast', 'NotificationOutbox', 'PaymentEvent']
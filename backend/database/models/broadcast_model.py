@@ -0,0 +1,52 @@
+"""Broadcast progress model for PostgreSQL database"""
+
+from database.db_config import db
+from datetime import datetime
+
+
+class Broadcast(db.Model):
+    """
+    Прогресс рассылки бота (bot/utils/broadcast.py). Получатели перебираются
+    по возрастанию users.id, last_user_id — водяной знак: все id <= него уже
+    обработаны, с него прерванная рассылка продолжается.
+
+    owner/heartbeat_at — аренда: рассылку отправляет один процесс бота, другой
+    забирает её, только когда heartbeat устарел (BROADCAST_LEASE_SECONDS).
+    """
+    __tablename__ = 'broadcasts'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    text = db.Column(db.Text, nullable=False)
+    exclude_admins = db.Column(db.Boolean, default=True, nullable=False)
+    # pending → running → done | cancelled
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    last_user_id = db.Column(db.BigInteger, default=0, nullable=False)
+    total = db.Column(db.Integer, nullable=True)
+    sent = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    blocked = db.Column(db.Integer, default=0, nullable=False)
+    owner = db.Column(db.String(100), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_broadcasts_status', 'status'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'last_user_id': self.last_user_id,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
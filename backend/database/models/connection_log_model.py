@@ -5,6 +5,7 @@ from datetime import datetime
 
 
 class ConnectionLog(db.Model):
+    # После миграции 005 — дневные RANGE-партиции по timestamp (PK в БД: id, timestamp), см. database/partitions.py
     __tablename__ = 'connection_logs'
 
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
@@ -38,15 +39,14 @@ class ConnectionLog(db.Model):
 
     @classmethod
     def add_log(cls, user_id, connected=True, ip_address=None, user_agent=None):
-        log = cls(
-            user_id=user_id,
-            connected=connected,
+        """Событие уходит в буфер ConnectionLogWriter, а не в транзакцию запроса"""
+        from services.connection_log_writer import connection_log_writer
+        connection_log_writer.enqueue(
+            user_id,
             ip_address=ip_address,
-            user_agent=user_agent
+            user_agent=user_agent,
+            connected=connected
         )
-        db.session.add(log)
-        db.session.commit()
-        return log
 
     @classmethod
     def cleanup_old_logs(cls, days=30):
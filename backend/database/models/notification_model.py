@@ -0,0 +1,55 @@
+"""Outbound notification queue model for PostgreSQL database"""
+
+from database.db_config import db
+from datetime import datetime
+
+
+class NotificationOutbox(db.Model):
+    """
+    Очередь исходящих Telegram-уведомлений. Строка добавляется в той же
+    транзакции, что и изменение подписки; отправляет её scripts/notification_dispatcher.py.
+
+    Пока строка в работе у диспетчера, available_at сдвинут на время аренды —
+    если диспетчер упал, строку после этого заберёт следующий.
+    """
+    __tablename__ = 'notification_outbox'
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.BigInteger, nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    # pending → sent | failed
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index(
+            'idx_notification_outbox_pending', 'available_at', 'id',
+            postgresql_where=db.text("status = 'pending'")
+        ),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'kind': self.kind,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'available_at': self.available_at.isoformat() if self.available_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+    @classmethod
+    def enqueue(cls, user_id, kind, **payload):
+        """Добавляет уведомление в текущую сессию (коммит — на вызывающей стороне)"""
+        notification = cls(user_id=user_id, kind=kind, payload=payload)
+        db.session.add(notification)
+        return notification
@@ -0,0 +1,97 @@
+"""YooKassa webhook events model for PostgreSQL database"""
+
+from database.db_config import db
+from datetime import datetime
+
+
+class PaymentEvent(db.Model):
+    """
+    Принятые webhook-и YooKassa. Уникальность (payment_id, event) отсекает
+    повторные доставки одной проверкой индекса; обработку выполняет
+    services/payment_event_processor.py.
+    """
+    __tablename__ = 'payment_events'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    payment_id = db.Column(db.String(100), nullable=False)
+    event = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=True)
+    # pending → processed | ignored | failed
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('payment_id', 'event', name='uq_payment_events_payment_event'),
+        db.Index(
+            'idx_payment_events_pending', 'available_at', 'id',
+            postgresql_where=db.text("status = 'pending'")
+        ),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'payment_id': self.payment_id,
+            'event': self.event,
+            'status': self.status,
+            'attempts': self.attempts,
+            'available_at': self.available_at.isoformat() if self.available_at else None,
+            'last_error': self.last_error,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
+
+    @classmethod
+    def record(cls, payment_id, event, payload=None):
+        """
+        INSERT ... ON CONFLICT DO NOTHING. True — событие новое, False — повторная
+        доставка. Коммит — на вызывающей стороне
+        """
+        if db.session.get_bind().dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        now = datetime.utcnow()
+        statement = insert(cls).values(
+            payment_id=payment_id,
+            event=event,
+            payload=payload,
+            status='pending',
+            attempts=0,
+            available_at=now,
+            received_at=now
+        ).on_conflict_do_nothing(index_elements=['payment_id', 'event'])
+        return db.session.execute(statement).rowcount == 1
+
+    @classmethod
+    def record_many(cls, payment_ids, event, payload=None):
+        """
+        Одно событие для нескольких платежей одним INSERT ... ON CONFLICT DO NOTHING.
+        Возвращает число новых событий. Коммит — на вызывающей стороне
+        """
+        if not payment_ids:
+            return 0
+        if db.session.get_bind().dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        now = datetime.utcnow()
+        statement = insert(cls).values([
+            {
+                'payment_id': payment_id,
+                'event': event,
+                'payload': payload,
+                'status': 'pending',
+                'attempts': 0,
+                'available_at': now,
+                'received_at': now
+            }
+            for payment_id in payment_ids
+        ]).on_conflict_do_nothing(index_elements=['payment_id', 'event'])
+        return db.session.execute(statement).rowcount
@@ -21,11 +21,16 @@ class Payment(db.Model):
     confirmation_url = db.Column(db.Text, nullable=True)
     test = db.Column(db.Boolean, default=False)
     stars_amount = db.Column(db.Integer, default=0)
+    # Момент, когда по платежу продлили подписку: повторная активация не проходит
+    activated_at = db.Column(db.DateTime, nullable=True)
 
     __table_args__ = (
         db.Index('idx_payments_user_id', 'user_id'),
         db.Index('idx_payments_status', 'status'),
         db.Index('idx_payments_yookassa_id', 'yookassa_payment_id'),
+        # Keyset-пагинация /api/payments: (created_at, id) и выборка по пользователю
+        db.Index('idx_payments_created_at_id', 'created_at', 'id'),
+        db.Index('idx_payments_user_created_at_id', 'user_id', 'created_at', 'id'),
     )
 
     def to_dict(self):
@@ -43,7 +48,8 @@ class Payment(db.Model):
             'yookassa_status': self.yookassa_status,
             'confirmation_url': self.confirmation_url,
             'test': self.test,
-            'stars_amount': self.stars_amount
+            'stars_amount': self.stars_amount,
+            'activated_at': self.activated_at.isoformat() if self.activated_at else None
         }
 
     def update_status(self, new_status):
@@ -58,6 +64,17 @@ class Payment(db.Model):
         self.confirmation_url = confirmation_url
         self.updated_at = datetime.utcnow()
 
+    @classmethod
+    def claim_activation(cls, payment_id):
+        """
+        Атомарно помечает платёж активированным. False — подписку по нему уже продлили
+        (повторный webhook, replay). Коммит — вместе с продлением, на вызывающей стороне
+        """
+        return cls.query.filter(
+            cls.id == payment_id,
+            cls.activated_at.is_(None)
+        ).update({cls.activated_at: datetime.utcnow()}, synchronize_session=False) == 1
+
     @classmethod
     def get_by_user_id(cls, user_id):
         return cls.query.filter_by(user_id=user_id).all()
@@ -0,0 +1,142 @@
+"""Stats rollup models for PostgreSQL database"""
+
+from collections import defaultdict
+from decimal import Decimal
+from datetime import datetime
+
+from database.db_config import db
+from database.models.user_model import User
+from database.models.payment_model import Payment
+
+
+class StatsCounter(db.Model):
+    """Счётчики /api/stats: users_total, users_active, payments_total, revenue_total"""
+    __tablename__ = 'stats_counters'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RevenueBucket(db.Model):
+    """Почасовая выручка по оплаченным платежам (время — payments.updated_at)"""
+    __tablename__ = 'revenue_hourly'
+
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    payments_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'bucket_start': self.bucket_start.isoformat(),
+            'revenue': float(self.revenue),
+            'payments_count': self.payments_count
+        }
+
+
+def hour_bucket(timestamp):
+    return (timestamp or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+
+
+def _old_value(obj, attribute):
+    """Значение атрибута до изменений в текущей сессии"""
+    history = db.inspect(obj).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None if history.added else getattr(obj, attribute)
+
+
+def _collect_stats_deltas(session, flush_context, instances):
+    counters = defaultdict(Decimal)
+    buckets = defaultdict(lambda: [Decimal(0), 0])
+
+    def add_revenue(amount, timestamp, sign):
+        amount = Decimal(str(amount or 0)) * sign
+        counters['revenue_total'] += amount
+        bucket = buckets[hour_bucket(timestamp)]
+        bucket[0] += amount
+        bucket[1] += sign
+
+    for obj in session.new:
+        if isinstance(obj, User):
+            counters['users_total'] += 1
+            if obj.deleted_at is None:
+                counters['users_active'] += 1
+        elif isinstance(obj, Payment):
+            counters['payments_total'] += 1
+            if obj.paid:
+                add_revenue(obj.amount, obj.updated_at, 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            counters['users_total'] -= 1
+            if _old_value(obj, 'deleted_at') is None:
+                counters['users_active'] -= 1
+        elif isinstance(obj, Payment):
+            counters['payments_total'] -= 1
+            if _old_value(obj, 'paid'):
+                add_revenue(_old_value(obj, 'amount'), _old_value(obj, 'updated_at'), -1)
+
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            was_active = _old_value(obj, 'deleted_at') is None
+            if was_active != (obj.deleted_at is None):
+                counters['users_active'] += 1 if not was_active else -1
+        elif isinstance(obj, Payment):
+            was_paid, old_amount = bool(_old_value(obj, 'paid')), _old_value(obj, 'amount')
+            if was_paid == bool(obj.paid) and old_amount == obj.amount:
+                continue
+            if was_paid:
+                add_revenue(old_amount, _old_value(obj, 'updated_at'), -1)
+            if obj.paid:
+                # updated_at выставляется в update_status; onupdate сработает только при flush
+                add_revenue(obj.amount, datetime.utcnow(), 1)
+
+    counters = {name: delta for name, delta in counters.items() if delta}
+    buckets = {start: values for start, values in buckets.items() if values[0] or values[1]}
+    if counters or buckets:
+        session.info['stats_deltas'] = (counters, buckets)
+
+
+def _apply_stats_deltas(session, flush_context):
+    """Дельты пишутся в той же транзакции, что и изменения пользователей/платежей"""
+    deltas = session.info.pop('stats_deltas', None)
+    if not deltas:
+        return
+    counters, buckets = deltas
+    connection = session.connection()
+    now = datetime.utcnow()
+
+    # UPDATE, а не upsert: пока счётчики не засеяны полным пересчётом, дельты не копим
+    if counters:
+        connection.execute(
+            db.text(
+                "UPDATE stats_counters SET value = value + :delta, updated_at = :now WHERE name = :name"
+            ).bindparams(db.bindparam('delta', type_=StatsCounter.value.type)),
+            [{'name': name, 'delta': delta, 'now': now} for name, delta in counters.items()]
+        )
+    if buckets:
+        connection.execute(
+            db.text(
+                "INSERT INTO revenue_hourly (bucket_start, revenue, payments_count) "
+                "VALUES (:bucket_start, :revenue, :payments_count) "
+                "ON CONFLICT (bucket_start) DO UPDATE SET "
+                "revenue = revenue_hourly.revenue + EXCLUDED.revenue, "
+                "payments_count = revenue_hourly.payments_count + EXCLUDED.payments_count"
+            ).bindparams(db.bindparam('revenue', type_=RevenueBucket.revenue.type)),
+            [
+                {'bucket_start': start, 'revenue': revenue, 'payments_count': count}
+                for start, (revenue, count) in buckets.items()
+            ]
+        )
+
+
+def _discard_stats_deltas(session, previous_transaction):
+    session.info.pop('stats_deltas', None)
+
+
+db.event.listen(db.session, 'before_flush', _collect_stats_deltas)
+db.event.listen(db.session, 'after_flush', _apply_stats_deltas)
+db.event.listen(db.session, 'after_soft_rollback', _discard_stats_deltas)
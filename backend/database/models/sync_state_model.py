@@ -0,0 +1,28 @@
+"""Sync state model for PostgreSQL database"""
+
+from database.db_config import db
+from datetime import datetime
+
+
+class SyncState(db.Model):
+    __tablename__ = 'sync_state'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_full_sync_at = db.Column(db.DateTime, nullable=True)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'last_full_sync_at': self.last_full_sync_at.isoformat() if self.last_full_sync_at else None,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None
+        }
+
+    @classmethod
+    def get_or_create(cls, name):
+        state = cls.query.filter_by(name=name).first()
+        if not state:
+            state = cls(name=name)
+            db.session.add(state)
+        return state
@@ -20,9 +20,21 @@ class User(db.Model):
     subscription_url = db.Column(db.Text, nullable=True)
     vpn_key_generated = db.Column(db.Boolean, default=False)
     deleted_at = db.Column(db.DateTime, nullable=True)
+    # Watermark для инкрементальной синхронизации с Marzban:
+    # billing_updated_at двигается при изменении биллинга, marzban_synced_at — после push
+    billing_updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=True)
+    marzban_synced_at = db.Column(db.DateTime, nullable=True)
+    # Сброс устройств (/reset-device): воркеры перечитывают IP пользователя из connection_logs
+    devices_reset_at = db.Column(db.DateTime, nullable=True)
 
     __table_args__ = (
         db.Index('idx_users_deleted_at', 'deleted_at'),
+        # Окно напоминаний об истечении и сортировка /api/admin/users по сроку подписки
+        db.Index('idx_users_subscription_end_date', 'subscription_end_date', 'id'),
+        db.Index(
+            'idx_users_marzban_sync_pending', 'id',
+            postgresql_where=db.text('marzban_synced_at IS NULL OR billing_updated_at > marzban_synced_at')
+        ),
     )
 
     def to_dict(self):
@@ -58,6 +70,16 @@ class User(db.Model):
     def is_deleted(self):
         return self.deleted_at is not None
 
+    @classmethod
+    def invalidate_subscription_url(cls, user_ids):
+        """Сбрасывает сохранённую ссылку подписки — следующее чтение пойдёт в Marzban (коммит — на вызывающей стороне)"""
+        if not user_ids:
+            return 0
+        return cls.query.filter(
+            cls.id.in_(user_ids),
+            cls.subscription_url.isnot(None)
+        ).update({cls.subscription_url: None, cls.vpn_key_generated: False}, synchronize_session='fetch')
+
     @classmethod
     def get_active_users(cls):
         return cls.query.filter_by(deleted_at=None).all()
@@ -65,3 +87,13 @@ class User(db.Model):
     @classmethod
     def get_deleted_users(cls):
         return cls.query.filter(cls.deleted_at.isnot(None)).all()
+
+
+def _touch_billing(target, value, oldvalue, initiator):
+    if value != oldvalue:
+        target.billing_updated_at = datetime.utcnow()
+
+
+# Любое изменение срока подписки, лимита или удаление ставит пользователя в очередь синхронизации
+for _attribute in (User.subscription_end_date, User.data_limit_gb, User.deleted_at):
+    db.event.listen(_attribute, 'set', _touch_billing)
@@ -0,0 +1,100 @@
+"""Дневные RANGE-партиции connection_logs (PostgreSQL)"""
+
+import logging
+from datetime import datetime, timedelta, date
+
+from database.db_config import db
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'connection_logs'
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+
+
+def partition_name(day: date) -> str:
+    return f"{PARENT_TABLE}_p{day.strftime('%Y%m%d')}"
+
+
+def is_partitioned() -> bool:
+    """True, если connection_logs уже переведена на декларативное партиционирование"""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return bool(db.session.execute(
+        db.text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {'table': PARENT_TABLE}
+    ).scalar())
+
+
+def list_partitions() -> dict:
+    """{день: имя партиции} для всех дневных партиций (без default)"""
+    rows = db.session.execute(db.text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(:table)
+    """), {'table': PARENT_TABLE}).scalars()
+
+    partitions = {}
+    prefix = f'{PARENT_TABLE}_p'
+    for name in rows:
+        if name.startswith(prefix):
+            try:
+                partitions[datetime.strptime(name[len(prefix):], '%Y%m%d').date()] = name
+            except ValueError:
+                continue
+    return partitions
+
+
+def create_partition(day: date, commit: bool = True) -> bool:
+    """
+    Партиция [day, day + 1). С commit=False выполняется в текущей транзакции
+    (для миграции) и ошибки не перехватываются.
+    """
+    name = partition_name(day)
+    statement = db.text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+    )
+    if not commit:
+        db.session.execute(statement)
+        return True
+
+    try:
+        db.session.execute(statement)
+        db.session.commit()
+        return True
+    except Exception as e:
+        # Например, строки за этот день уже лежат в default-партиции
+        db.session.rollback()
+        logger.warning(f"Failed to create partition {name}: {e}")
+        return False
+
+
+def ensure_partitions(days_ahead: int = 7, start: date = None) -> list:
+    """Создаёт недостающие партиции от start (по умолчанию сегодня) на days_ahead дней вперёд"""
+    existing = list_partitions()
+    start = start or datetime.utcnow().date()
+    end = datetime.utcnow().date() + timedelta(days=days_ahead)
+
+    created = []
+    day = start
+    while day <= end:
+        if day not in existing and create_partition(day):
+            created.append(partition_name(day))
+        day += timedelta(days=1)
+    return created
+
+
+def drop_partitions_before(cutoff: datetime) -> list:
+    """
+    Удаляет партиции, целиком лежащие до cutoff: DROP TABLE вместо DELETE —
+    без построчного WAL и последующего VACUUM.
+    """
+    dropped = []
+    for day, name in sorted(list_partitions().items()):
+        if datetime.combine(day + timedelta(days=1), datetime.min.time()) > cutoff:
+            continue
+        db.session.execute(db.text(f"DROP TABLE IF EXISTS {name}"))
+        db.session.commit()
+        dropped.append(name)
+    return dropped
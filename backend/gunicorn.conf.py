@@ -0,0 +1,56 @@
+"""
+Gunicorn config for server:app
+
+    gunicorn -c gunicorn.conf.py server:app
+
+Views are synchronous and I/O-bound (Marzban, YooKassa, Postgres), so one slow
+outbound call must not hold a whole process:
+
+- gthread (default) — GUNICORN_THREADS threads per worker, ~1 MB each;
+- gevent — GUNICORN_WORKER_CONNECTIONS greenlets per worker. requests, urllib3
+  and yookassa become cooperative after monkey-patching, psycopg2 via psycogreen.
+  The asyncio Marzban adapter (MARZBAN_CLIENT=async) is not gevent-safe, so the
+  requests-based client is forced.
+- sync — one request per worker (the old --workers 3 --threads 1 setup).
+
+A request keeps its DB connection while it waits on Marzban: keep
+workers x concurrency within DB_POOL_SIZE + DB_MAX_OVERFLOW per worker.
+Throughput under injected Marzban latency: scripts/load_test.py --compare.
+"""
+
+import os
+import logging
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8080')
+workers = int(os.getenv('GUNICORN_WORKERS', '3'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '8')) if worker_class == 'gthread' else 1
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+keepalive = 5
+graceful_timeout = 30
+
+logger = logging.getLogger('gunicorn.error')
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+
+    # psycopg2 ждёт сокет через gevent, а не блокирует весь воркер
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+    if os.getenv('MARZBAN_CLIENT', 'sync').lower() == 'async':
+        logger.warning("MARZBAN_CLIENT=async is not gevent-safe, using the requests client")
+        os.environ['MARZBAN_CLIENT'] = 'sync'
+
+
+def worker_exit(server, worker):
+    # Дописываем буфер connection_logs, пока воркер ещё цел (atexit остаётся запасным вариантом)
+    try:
+        from services.connection_log_writer import connection_log_writer
+        connection_log_writer.shutdown()
+    except Exception as e:
+        logger.error(f"Error flushing connection logs on worker exit: {e}")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Миграция: watermark для инкрементальной синхронизации с Marzban"""
+
+import sys
+import os
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from database.models.sync_state_model import SyncState
+from sqlalchemy import text
+
+
+def migrate_add_marzban_sync_watermark():
+    print("🔄 Добавление watermark для синхронизации Marzban...")
+
+    with app.app_context():
+        try:
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('users')]
+
+            # Шаг 1: Колонки watermark
+            print("\n📝 Шаг 1: Колонки billing_updated_at и marzban_synced_at...")
+            if 'billing_updated_at' not in columns:
+                db.session.execute(text("ALTER TABLE users ADD COLUMN billing_updated_at TIMESTAMP DEFAULT NOW()"))
+                db.session.commit()
+                print("   ✅ Колонка billing_updated_at добавлена")
+            else:
+                print("   ℹ️  Колонка billing_updated_at уже существует")
+
+            if 'marzban_synced_at' not in columns:
+                db.session.execute(text("ALTER TABLE users ADD COLUMN marzban_synced_at TIMESTAMP"))
+                db.session.commit()
+                print("   ✅ Колонка marzban_synced_at добавлена")
+            else:
+                print("   ℹ️  Колонка marzban_synced_at уже существует")
+
+            # Шаг 2: Частичный индекс очереди синхронизации
+            print("\n📝 Шаг 2: Частичный индекс idx_users_marzban_sync_pending...")
+            db.session.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_users_marzban_sync_pending ON users(id)
+                WHERE marzban_synced_at IS NULL OR billing_updated_at > marzban_synced_at
+            """))
+            db.session.commit()
+            print("   ✅ Индекс создан")
+
+            # Шаг 3: Таблица sync_state
+            print("\n📝 Шаг 3: Таблица sync_state...")
+            SyncState.__table__.create(bind=db.engine, checkfirst=True)
+            print("   ✅ Таблица sync_state готова")
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+            print("\nℹ️  Первый запуск /api/sync/marzban выполнит полную сверку")
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    success = migrate_add_marzban_sync_watermark()
+    sys.exit(0 if success else 1)
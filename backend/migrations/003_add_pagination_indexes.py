@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Миграция: индексы для keyset-пагинации /api/payments"""
+
+import sys
+import os
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from sqlalchemy import text
+
+
+def migrate_add_pagination_indexes():
+    print("🔄 Добавление индексов для keyset-пагинации...")
+
+    with app.app_context():
+        try:
+            # Шаг 1: Индекс по (created_at, id) для общего списка платежей
+            print("\n📝 Шаг 1: Индекс idx_payments_created_at_id...")
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_payments_created_at_id ON payments(created_at, id)"
+            ))
+            db.session.commit()
+            print("   ✅ Индекс создан")
+
+            # Шаг 2: Индекс по (user_id, created_at, id) для платежей пользователя
+            print("\n📝 Шаг 2: Индекс idx_payments_user_created_at_id...")
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_payments_user_created_at_id ON payments(user_id, created_at, id)"
+            ))
+            db.session.commit()
+            print("   ✅ Индекс создан")
+
+            # Шаг 3: Статистика для оценки total через pg_class.reltuples
+            print("\n📝 Шаг 3: ANALYZE users, payments...")
+            db.session.execute(text("ANALYZE users"))
+            db.session.execute(text("ANALYZE payments"))
+            db.session.commit()
+            print("   ✅ Статистика обновлена")
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    success = migrate_add_pagination_indexes()
+    sys.exit(0 if success else 1)
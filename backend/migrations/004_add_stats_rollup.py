@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Миграция: таблицы stats rollup для /api/stats"""
+
+import sys
+import os
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from database.models.stats_model import StatsCounter, RevenueBucket
+from services.stats_service import StatsService
+
+
+def migrate_add_stats_rollup():
+    print("🔄 Добавление stats rollup...")
+
+    with app.app_context():
+        try:
+            # Шаг 1: Таблицы счётчиков и почасовой выручки
+            print("\n📝 Шаг 1: Таблицы stats_counters и revenue_hourly...")
+            StatsCounter.__table__.create(bind=db.engine, checkfirst=True)
+            RevenueBucket.__table__.create(bind=db.engine, checkfirst=True)
+            print("   ✅ Таблицы готовы")
+
+            # Шаг 2: Засев счётчиков точным пересчётом
+            print("\n📝 Шаг 2: Пересчёт счётчиков...")
+            result = StatsService().recompute()
+            if result['status'] != 'success':
+                raise RuntimeError(result['message'])
+            print(f"   ✅ {result['counters']}, часовых бакетов: {result['buckets']}")
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    success = migrate_add_stats_rollup()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Миграция: дневное RANGE-партиционирование connection_logs по timestamp
+
+Usage:
+    python migrations/005_partition_connection_logs.py [days]
+
+Arguments:
+    days - сколько дней логов перенести в новую таблицу (по умолчанию 30, как в cleanup_logs.py)
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from database import partitions
+from sqlalchemy import text
+
+
+def migrate_partition_connection_logs(days=30):
+    print("🔄 Партиционирование connection_logs...")
+
+    with app.app_context():
+        try:
+            if db.engine.dialect.name != 'postgresql':
+                print("   ℹ️  Не PostgreSQL — пропускаем")
+                return True
+
+            if partitions.is_partitioned():
+                print("   ℹ️  connection_logs уже партиционирована")
+                created = partitions.ensure_partitions(days_ahead=7)
+                print(f"   ✅ Создано недостающих партиций: {len(created)}")
+                return True
+
+            cutoff = datetime.utcnow() - timedelta(days=days)
+
+            # Шаг 1: Старая таблица уходит в connection_logs_legacy, sequence сохраняем
+            print("\n📝 Шаг 1: Переименование connection_logs → connection_logs_legacy...")
+            sequence = db.session.execute(text(
+                "SELECT pg_get_serial_sequence('connection_logs', 'id')"
+            )).scalar()
+            db.session.execute(text("ALTER TABLE connection_logs RENAME TO connection_logs_legacy"))
+            db.session.execute(text("ALTER INDEX IF EXISTS idx_connection_logs_user_id RENAME TO idx_connection_logs_legacy_user_id"))
+            db.session.execute(text("ALTER INDEX IF EXISTS idx_connection_logs_timestamp RENAME TO idx_connection_logs_legacy_timestamp"))
+            if sequence:
+                db.session.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+            else:
+                sequence = 'connection_logs_id_seq'
+                db.session.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {sequence}"))
+                db.session.execute(text(
+                    f"SELECT setval('{sequence}', COALESCE((SELECT MAX(id) FROM connection_logs_legacy), 0) + 1, false)"
+                ))
+            print(f"   ✅ Sequence: {sequence}")
+
+            # Шаг 2: Партиционированная таблица (ключ партиционирования входит в PK)
+            print("\n📝 Шаг 2: Создание партиционированной connection_logs...")
+            db.session.execute(text(f"""
+                CREATE TABLE connection_logs (
+                    id BIGINT NOT NULL DEFAULT nextval('{sequence}'),
+                    user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
+                    connected BOOLEAN NOT NULL,
+                    ip_address VARCHAR(45),
+                    user_agent VARCHAR(500),
+                    PRIMARY KEY (id, timestamp)
+                ) PARTITION BY RANGE (timestamp)
+            """))
+            db.session.execute(text("CREATE INDEX idx_connection_logs_user_id ON connection_logs(user_id)"))
+            db.session.execute(text("CREATE INDEX idx_connection_logs_timestamp ON connection_logs(timestamp)"))
+            print("   ✅ Таблица создана")
+
+            # Шаг 3: Дневные партиции за период хранения + неделя вперёд, default — для остального
+            print("\n📝 Шаг 3: Создание партиций...")
+            day = cutoff.date()
+            last_day = datetime.utcnow().date() + timedelta(days=7)
+            count = 0
+            while day <= last_day:
+                partitions.create_partition(day, commit=False)
+                day += timedelta(days=1)
+                count += 1
+            db.session.execute(text(
+                f"CREATE TABLE {partitions.DEFAULT_PARTITION} PARTITION OF connection_logs DEFAULT"
+            ))
+            print(f"   ✅ Дневных партиций: {count} + default")
+
+            # Шаг 4: Перенос логов за период хранения
+            print(f"\n📝 Шаг 4: Перенос логов за последние {days} дней...")
+            moved = db.session.execute(text("""
+                INSERT INTO connection_logs (id, user_id, timestamp, connected, ip_address, user_agent)
+                SELECT id, user_id, timestamp, connected, ip_address, user_agent
+                FROM connection_logs_legacy
+                WHERE timestamp >= :cutoff
+            """), {'cutoff': cutoff}).rowcount
+            print(f"   ✅ Перенесено записей: {moved}")
+
+            # Шаг 5: Удаление старой таблицы
+            print("\n📝 Шаг 5: Удаление connection_logs_legacy...")
+            db.session.execute(text("DROP TABLE connection_logs_legacy"))
+            db.session.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY connection_logs.id"))
+            db.session.commit()
+            db.session.execute(text("ANALYZE connection_logs"))
+            db.session.commit()
+            print("   ✅ Готово")
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+            print("\nℹ️  Дальше партиции создаёт и удаляет scripts/cleanup_logs.py")
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    success = migrate_partition_connection_logs(days)
+    sys.exit(0 if success else 1)
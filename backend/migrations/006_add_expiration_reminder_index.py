@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Миграция: индекс для выборки истекающих подписок (напоминания)"""
+
+import sys
+import os
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from sqlalchemy import text
+
+
+def migrate_add_expiration_reminder_index():
+    print("🔄 Добавление индекса для напоминаний об истечении подписки...")
+
+    with app.app_context():
+        try:
+            # Шаг 1: Индекс по (subscription_end_date, id) — окно 0–3 дня без полного скана users
+            print("\n📝 Шаг 1: Индекс idx_users_subscription_end_date...")
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_users_subscription_end_date ON users(subscription_end_date, id)"
+            ))
+            db.session.commit()
+            print("   ✅ Индекс создан")
+
+            # Шаг 2: Обновляем статистику планировщика
+            print("\n📝 Шаг 2: ANALYZE users...")
+            db.session.execute(text("ANALYZE users"))
+            db.session.commit()
+            print("   ✅ Статистика обновлена")
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    success = migrate_add_expiration_reminder_index()
+    sys.exit(0 if success else 1)
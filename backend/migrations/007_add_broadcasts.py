@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Миграция: таблица broadcasts для возобновляемых рассылок бота"""
+
+import sys
+import os
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from database.models.broadcast_model import Broadcast
+
+
+def migrate_add_broadcasts():
+    print("🔄 Добавление таблицы broadcasts...")
+
+    with app.app_context():
+        try:
+            # Шаг 1: Таблица прогресса рассылок
+            print("\n📝 Шаг 1: Таблица broadcasts...")
+            Broadcast.__table__.create(bind=db.engine, checkfirst=True)
+            print("   ✅ Таблица готова")
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    success = migrate_add_broadcasts()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Миграция: журнал webhook-событий payment_events и payments.activated_at"""
+
+import sys
+import os
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from database.models.payment_event_model import PaymentEvent
+from sqlalchemy import text
+
+
+def migrate_add_payment_events():
+    print("🔄 Добавление идемпотентной обработки webhook-ов YooKassa...")
+
+    with app.app_context():
+        try:
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('payments')]
+
+            # Шаг 1: Колонка activated_at
+            print("\n📝 Шаг 1: Колонка payments.activated_at...")
+            if 'activated_at' not in columns:
+                db.session.execute(text("ALTER TABLE payments ADD COLUMN activated_at TIMESTAMP"))
+                db.session.commit()
+                print("   ✅ Колонка activated_at добавлена")
+            else:
+                print("   ℹ️  Колонка activated_at уже существует")
+
+            # Шаг 2: Уже оплаченные платежи считаем активированными — replay их не продлит
+            print("\n📝 Шаг 2: Заполнение activated_at для оплаченных платежей...")
+            result = db.session.execute(text(
+                "UPDATE payments SET activated_at = COALESCE(updated_at, created_at, NOW()) "
+                "WHERE paid = TRUE AND activated_at IS NULL"
+            ))
+            db.session.commit()
+            print(f"   ✅ Обновлено платежей: {result.rowcount}")
+
+            # Шаг 3: Таблица событий с уникальным (payment_id, event)
+            print("\n📝 Шаг 3: Таблица payment_events...")
+            PaymentEvent.__table__.create(bind=db.engine, checkfirst=True)
+            print("   ✅ Таблица готова")
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    success = migrate_add_payment_events()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Миграция: NOTIFY payment_status при смене payments.status (для /api/payment/wait)"""
+
+import sys
+import os
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from sqlalchemy import text
+
+
+def migrate_add_payment_status_notify():
+    print("🔄 Добавление уведомлений о смене статуса платежа...")
+
+    with app.app_context():
+        try:
+            # Шаг 1: Функция триггера — id платежа в канал payment_status
+            print("\n📝 Шаг 1: Функция notify_payment_status()...")
+            db.session.execute(text("""
+                CREATE OR REPLACE FUNCTION notify_payment_status() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('payment_status', NEW.id::text);
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            """))
+            db.session.commit()
+            print("   ✅ Функция создана")
+
+            # Шаг 2: Триггер только на реальную смену статуса
+            print("\n📝 Шаг 2: Триггер payments_status_notify...")
+            db.session.execute(text("DROP TRIGGER IF EXISTS payments_status_notify ON payments"))
+            db.session.execute(text("""
+                CREATE TRIGGER payments_status_notify
+                AFTER UPDATE OF status ON payments
+                FOR EACH ROW
+                WHEN (OLD.status IS DISTINCT FROM NEW.status)
+                EXECUTE FUNCTION notify_payment_status()
+            """))
+            db.session.commit()
+            print("   ✅ Триггер создан")
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    success = migrate_add_payment_status_notify()
+    sys.exit(0 if success else 1)
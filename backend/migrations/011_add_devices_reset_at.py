@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Миграция: users.devices_reset_at — сброс устройств виден всем воркерам gunicorn"""
+
+import sys
+import os
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from sqlalchemy import text
+
+
+def migrate_add_devices_reset_at():
+    print("🔄 Добавление users.devices_reset_at...")
+
+    with app.app_context():
+        try:
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('users')]
+
+            # Шаг 1: Колонка devices_reset_at
+            print("\n📝 Шаг 1: Колонка users.devices_reset_at...")
+            if 'devices_reset_at' not in columns:
+                db.session.execute(text("ALTER TABLE users ADD COLUMN devices_reset_at TIMESTAMP"))
+                db.session.commit()
+                print("   ✅ Колонка devices_reset_at добавлена")
+            else:
+                print("   ℹ️  Колонка devices_reset_at уже существует")
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    success = migrate_add_devices_reset_at()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Миграция: аренда рассылок (broadcasts.owner, broadcasts.heartbeat_at)"""
+
+import sys
+import os
+
+sys.path.insert(0, '/app')
+
+from server import app
+from database.db_config import db
+from sqlalchemy import text
+
+
+def migrate_add_broadcast_lease():
+    print("🔄 Добавление аренды рассылок...")
+
+    with app.app_context():
+        try:
+            inspector = db.inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('broadcasts')]
+
+            # Шаг 1: Колонки owner и heartbeat_at
+            print("\n📝 Шаг 1: Колонки broadcasts.owner, broadcasts.heartbeat_at...")
+            for column, column_type in (('owner', 'VARCHAR(100)'), ('heartbeat_at', 'TIMESTAMP')):
+                if column not in columns:
+                    db.session.execute(text(f"ALTER TABLE broadcasts ADD COLUMN {column} {column_type}"))
+                    print(f"   ✅ Колонка {column} добавлена")
+                else:
+                    print(f"   ℹ️  Колонка {column} уже существует")
+            db.session.commit()
+
+            print("\n" + "="*50)
+            print("✅ Миграция успешно выполнена!")
+            print("="*50)
+
+        except Exception as e:
+            print(f"\n❌ Ошибка при выполнении миграции: {e}")
+            import traceback
+            traceback.print_exc()
+            db.session.rollback()
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    success = migrate_add_broadcast_lease()
+    sys.exit(0 if success else 1)
@@ -4,13 +4,14 @@ from database.models.payment_model import Payment as PaymentModel
 from database.db_config import db
 from datetime import datetime
 from models.user import User
+from utils.request_context import load_payment
 import uuid
 
 
 class Payment:
     @staticmethod
     def get_by_id(payment_id):
-        return PaymentModel.query.filter_by(id=payment_id).first()
+        return load_payment(payment_id)
 
     @staticmethod
     def create(data):
@@ -4,12 +4,13 @@ from database.models.user_model import User as UserModel
 from database.models.connection_log_model import ConnectionLog
 from database.db_config import db
 from datetime import datetime, timedelta
+from utils.request_context import load_user
 
 
 class User:
     @staticmethod
     def get_by_id(user_id):
-        return UserModel.query.filter_by(id=user_id).first()
+        return load_user(user_id)
 
     @staticmethod
     def create(data):
@@ -17,7 +18,7 @@ class User:
         if not user_id:
             raise ValueError("User ID is required")
 
-        existing_user = UserModel.query.filter_by(id=user_id).first()
+        existing_user = load_user(user_id)
         if existing_user:
             return existing_user
 
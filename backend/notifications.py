@@ -26,6 +26,37 @@ BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def payment_success_message(amount: float = 0, days: int = 0) -> str:
+    return (
+        "✅ **Оплата прошла успешно! VPVKS**\n\n"
+        f"💰 Сумма: {amount}₽\n"
+        f"📅 Подписка продлена на {days} дн.\n\n"
+        "Спасибо за оплату! Ваш VPN доступен.\n\n"
+        "🔑 Открыть ключи: /app"
+    )
+
+
+def subscription_activated_message(days_added: int = None) -> str:
+    if days_added:
+        return (
+            f"✅ Ваша подписка продлена на {days_added} дней!\n\n"
+            "🔒 Теперь вы можете использовать VPN без ограничений.\n\n"
+            "Для проверки статуса подписки используйте команду /status"
+        )
+    return (
+        "✅ Ваша подписка активирована!\n\n"
+        "🔒 Теперь вы можете использовать VPN без ограничений.\n\n"
+        "Для проверки статуса подписки используйте команду /status"
+    )
+
+
+# Тексты для очереди notification_outbox: kind → (сборка текста из payload, parse_mode)
+NOTIFICATION_KINDS = {
+    'payment_success': (lambda payload: payment_success_message(payload.get('amount', 0), payload.get('days', 0)), 'Markdown'),
+    'subscription_activated': (lambda payload: subscription_activated_message(payload.get('days_added')), None),
+}
+
+
 class NotificationService:
     def __init__(self):
         if not TELEGRAM_AVAILABLE:
@@ -47,13 +78,7 @@ class NotificationService:
             
         logger.info(f"Attempting to send payment success notification to user {user_id}")
         try:
-            message = (
-                "✅ **Оплата прошла успешно! VPVKS**\n\n"
-                f"💰 Сумма: {amount}₽\n"
-                f"📅 Подписка продлена на {days} дн.\n\n"
-                "Спасибо за оплату! Ваш VPN доступен.\n\n"
-                "🔑 Открыть ключи: /app"
-            )
+            message = payment_success_message(amount, days)
 
             await self.bot.send_message(
                 chat_id=user_id,
@@ -72,24 +97,19 @@ class NotificationService:
             
         logger.info(f"Attempting to send subscription activated notification to user {user_id}, days added: {days_added}")
         try:
-            if days_added:
-                message = (
-                    f"✅ Ваша подписка продлена на {days_added} дней!\n\n"
-                    "🔒 Теперь вы можете использовать VPN без ограничений.\n\n"
-                    "Для проверки статуса подписки используйте команду /status"
-                )
-            else:
-                message = (
-                    "✅ Ваша подписка активирована!\n\n"
-                    "🔒 Теперь вы можете использовать VPN без ограничений.\n\n"
-                    "Для проверки статуса подписки используйте команду /status"
-                )
-
+            message = subscription_activated_message(days_added)
             await self.bot.send_message(chat_id=user_id, text=message)
             logger.info(f"Subscription activated notification sent to user {user_id}")
         except Exception as e:
             logger.error(f"Error sending subscription activated notification to user {user_id}: {e}")
 
+    async def deliver(self, user_id: int, kind: str, payload: dict):
+        """Отправка уведомления из очереди; ошибки Telegram пробрасываются диспетчеру"""
+        if self.bot is None:
+            raise RuntimeError("Telegram not available")
+        build, parse_mode = NOTIFICATION_KINDS[kind]
+        await self.bot.send_message(chat_id=user_id, text=build(payload), parse_mode=parse_mode)
+
 # Global instance of notification service
 notification_service = NotificationService()
 
@@ -12,6 +12,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from services.vpn_service import VPNService
 from services.payment_service import PaymentService
 from services.business_logic_service import BusinessLogicService
+from services.fingerprint_tracker import fingerprint_tracker
+from services.connection_log_writer import connection_log_writer
 from models.user import User
 from database.db_config import db
 from database.models.user_model import User as UserModel
@@ -21,7 +23,7 @@ from utils.limiter import limiter
 from schemas import validate_json
 from schemas.user_schemas import (
     CreateUserSchema, UpdateUserAdminSchema,
-    CheckFingerprintSchema, ConnectVpnSchema
+    CheckFingerprintSchema, ConnectVpnSchema, ExpirationRemindersSentSchema
 )
 from schemas.payment_schemas import (
     CreatePaymentSchema, CreateTopupPaymentSchema, ManualPaymentSchema
@@ -122,7 +124,7 @@ def vpn_status(user_id):
 @limiter.limit("20 per minute")
 def get_vpn_key(user_id):
     try:
-        user = UserModel.query.filter_by(id=user_id).first()
+        user = User.get_by_id(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
@@ -141,17 +143,14 @@ def get_vpn_key(user_id):
             })
 
         logger.info(f"🔑 Generating new subscription URL for user {user_id}")
-        result = vpn_service.create_marzban_user(user_id, 'standard')
+        # Передаём уже загруженного пользователя — ensure_user_provisioned сохраняет ссылку сам
+        result = vpn_service.ensure_user_provisioned(user_id, user=user)
 
         if result.get('status') == 'success':
-            subscription_url = result.get('subscription_url')
-            user.subscription_url = subscription_url
-            user.vpn_key_generated = True
-            db.session.commit()
             logger.info(f"✅ Saved subscription URL for user {user_id}")
             return jsonify({
                 'status': 'success',
-                'subscription_url': subscription_url,
+                'subscription_url': result.get('subscription_url'),
                 'key_generated': True
             })
         return jsonify({
@@ -172,27 +171,24 @@ def check_fingerprint():
         ip = request.validated_data['ip']
         user_agent = request.validated_data.get('user_agent')
 
-        user = UserModel.query.filter_by(id=user_id).first()
+        user = User.get_by_id(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
-        cutoff_time = datetime.utcnow() - timedelta(hours=24)
-        recent_logs = ConnectionLog.query.filter(
-            ConnectionLog.user_id == user_id,
-            ConnectionLog.timestamp >= cutoff_time
-        ).all()
-
-        unique_ips = set(log.ip_address for log in recent_logs if log.ip_address)
-
-        if ip not in unique_ips:
-            if len(unique_ips) >= 2:
-                logger.warning(f"⚠️ Подозрительная активность: user_{user_id} подключился с {len(unique_ips) + 1} разных IP за 24ч")
-                return jsonify({
-                    'status': 'warning',
-                    'message': 'Обнаружено подключение с нового устройства. Если это не вы — обратитесь в поддержку.'
-                }), 403
+        # Политика прежняя (не больше 2 разных IP за 24ч), но без загрузки логов в ORM
+        allowed, unique_ips_count, new_ip = fingerprint_tracker.check(user_id, ip, user.devices_reset_at)
+        if not allowed:
+            logger.warning(f"⚠️ Подозрительная активность: user_{user_id} подключился с {unique_ips_count + 1} разных IP за 24ч")
+            return jsonify({
+                'status': 'warning',
+                'message': 'Обнаружено подключение с нового устройства. Если это не вы — обратитесь в поддержку.'
+            }), 403
 
-        ConnectionLog.add_log(user_id, connected=True, ip_address=ip, user_agent=user_agent)
+        # Новый IP сразу в БД: по нему решают остальные воркеры (трекер в памяти)
+        connection_log_writer.enqueue(
+            user_id, ip_address=ip, user_agent=user_agent,
+            sync=new_ip and not fingerprint_tracker.shared
+        )
         logger.info(f"🔒 Подключение для user_{user_id} с IP {ip}")
 
         return jsonify({'status': 'ok', 'message': 'Подключение записано'})
@@ -204,12 +200,16 @@ def check_fingerprint():
 @routes_bp.route('/api/users/<int:user_id>/reset-device', methods=['POST'])
 def reset_device(user_id):
     try:
-        user = UserModel.query.filter_by(id=user_id).first()
+        user = User.get_by_id(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
+        # Сначала дописываем отложенные логи, иначе они вернулись бы после удаления
+        connection_log_writer.flush()
         ConnectionLog.query.filter_by(user_id=user_id).delete()
+        user.devices_reset_at = datetime.utcnow()
         db.session.commit()
+        fingerprint_tracker.reset(user_id)
         logger.info(f"🔄 Сброшен fingerprint для user_{user_id}")
         return jsonify({'status': 'success', 'message': 'Устройство сброшено'})
     except Exception as e:
@@ -226,6 +226,37 @@ def check_payment(payment_id):
         return jsonify({'error': str(e)}), 500
 
 
+@routes_bp.route('/api/payment/wait/<payment_id>', methods=['GET'])
+def wait_payment(payment_id):
+    """
+    Long-poll статуса платежа: отвечает, когда статус отличается от ?status=
+    (или текущего) либо стал финальным, иначе через ?timeout= сек (не больше 25).
+    Будится триггером payments через LISTEN/NOTIFY.
+    """
+    try:
+        from services.payment_status_listener import payment_status_listener, PAYMENT_WAIT_RETRY_AFTER
+        from services.payment_service import FINAL_PAYMENT_STATES
+
+        timeout = request.args.get('timeout', 25, type=float)
+        result = payment_status_listener.wait_for_status(payment_id, request.args.get('status'), timeout)
+        if result['status'] is None:
+            return jsonify({'error': 'Payment not found'}), 404
+
+        response = {
+            'payment_id': payment_id,
+            'status': result['status'],
+            'changed': result['changed'],
+            'final': result['status'] in FINAL_PAYMENT_STATES
+        }
+        if not result['waited'] and not result['changed'] and not response['final']:
+            # Все слоты ожидания заняты — клиент повторит запрос позже
+            response['retry_after'] = PAYMENT_WAIT_RETRY_AFTER
+        return jsonify(response)
+    except Exception as e:
+        logger.error(f"Error waiting for payment {payment_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @routes_bp.route('/api/payment/confirm/<payment_id>', methods=['POST'])
 def confirm_payment(payment_id):
     try:
@@ -304,22 +335,21 @@ def payment_webhook():
         if not payment_id:
             return jsonify({'error': 'payment_id is required'}), 400
 
+        if not event:
+            return jsonify({'error': 'event is required'}), 400
+
         logger.info(f"Received YooKassa webhook: {event} for payment {payment_id}")
 
-        if event == 'payment.succeeded':
-            result = business_service.handle_successful_payment(payment_id)
-            if result.get('status') == 'success':
-                user_id = result.get('user_id')
-                days_added = result.get('days_added', 30)
-                if user_id:
-                    try:
-                        from notifications import send_subscription_activated_notification_sync
-                        send_subscription_activated_notification_sync(user_id, days_added)
-                    except Exception as e:
-                        print(f"Error sending notification to user {user_id}: {e}")
-                        logger.error(f"Error sending notification to user {user_id}: {e}")
-        return jsonify({'status': 'ok'})
+        # Только запись события: повторная доставка — одна проверка уникального индекса.
+        # Активацию выполняет PaymentEventProcessor (scripts/background_worker.py)
+        from database.models.payment_event_model import PaymentEvent
+        is_new = PaymentEvent.record(payment_id, event, data)
+        db.session.commit()
+        if not is_new:
+            logger.info(f"ℹ️ Повторный webhook {event} для платежа {payment_id}")
+        return jsonify({'status': 'ok', 'duplicate': not is_new})
     except Exception as e:
+        db.session.rollback()
         print(f"Error processing webhook: {str(e)}")
         logger.error(f"Error processing webhook: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -327,25 +357,11 @@ def payment_webhook():
 
 @routes_bp.route('/api/stats', methods=['GET'])
 def get_stats():
+    """Счётчики из stats rollup; точный пересчёт — scripts/refresh_stats.py"""
     try:
-        from database.db_config import db
-        from sqlalchemy import func
-
-        total_users = db.session.query(func.count(UserModel.id)).scalar()
-        active_users = db.session.query(func.count(UserModel.id)).filter(
-            UserModel.deleted_at.is_(None)
-        ).scalar()
-        total_payments = db.session.query(func.count(PaymentModel.id)).scalar()
-        total_revenue = db.session.query(func.sum(PaymentModel.amount)).filter(
-            PaymentModel.paid.is_(True)
-        ).scalar() or 0
+        from services.stats_service import StatsService
 
-        return jsonify({
-            'total_users': total_users,
-            'active_users': active_users,
-            'total_payments': total_payments,
-            'total_revenue': float(total_revenue)
-        })
+        return jsonify(StatsService().get_stats())
     except Exception as e:
         print(f"Error getting stats: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -353,17 +369,34 @@ def get_stats():
 
 @routes_bp.route('/api/users', methods=['GET'])
 def get_users():
+    """
+    Список пользователей: keyset-пагинация по id (?limit=&cursor=).
+
+    ?page= оставлен для старых клиентов (OFFSET + COUNT). Точный total — только
+    с ?count=exact, иначе оценка из pg_class.
+    """
     try:
         from sqlalchemy import func as sql_func
+        from utils.pagination import encode_cursor, decode_cursor, get_limit, approximate_count, exact_count
 
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
-        per_page = min(per_page, 200)  # Max 200 per page
+        legacy_page = request.args.get('page', type=int)
+        per_page = get_limit(request.args)
 
-        # Query users with pagination
         users_query = UserModel.query.order_by(UserModel.id)
-        total_users = users_query.count()
-        users = users_query.offset((page - 1) * per_page).limit(per_page).all()
+        if legacy_page:
+            total_users = users_query.count()
+            users = users_query.offset((legacy_page - 1) * per_page).limit(per_page).all()
+            has_next = legacy_page * per_page < total_users
+        else:
+            cursor = request.args.get('cursor')
+            if cursor:
+                try:
+                    users_query = users_query.filter(UserModel.id > decode_cursor(cursor)['id'])
+                except (ValueError, KeyError):
+                    return jsonify({'error': 'Invalid cursor'}), 400
+            users = users_query.limit(per_page + 1).all()
+            has_next = len(users) > per_page
+            users = users[:per_page]
 
         # Single query for all payment aggregates (fixes N+1)
         user_ids = [u.id for u in users]
@@ -399,18 +432,32 @@ def get_users():
             }
             users_list.append(user_info)
 
-        total_pages = (total_users + per_page - 1) // per_page if total_users > 0 else 0
-
-        return jsonify({
-            'users': users_list,
-            'pagination': {
-                'page': page,
+        if legacy_page:
+            total_pages = (total_users + per_page - 1) // per_page if total_users > 0 else 0
+            pagination = {
+                'page': legacy_page,
                 'per_page': per_page,
                 'total': total_users,
                 'pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1
+                'has_next': has_next,
+                'has_prev': legacy_page > 1
+            }
+        else:
+            if request.args.get('count') == 'exact':
+                total, total_is_estimate = exact_count(UserModel.__table__), False
+            else:
+                total, total_is_estimate = approximate_count(UserModel.__tablename__)
+            pagination = {
+                'limit': per_page,
+                'next_cursor': encode_cursor({'id': users[-1].id}) if has_next and users else None,
+                'has_next': has_next,
+                'total': total,
+                'total_is_estimate': total_is_estimate
             }
+
+        return jsonify({
+            'users': users_list,
+            'pagination': pagination
         })
     except Exception as e:
         print(f"Error getting users: {str(e)}")
@@ -419,24 +466,42 @@ def get_users():
 
 @routes_bp.route('/api/payments', methods=['GET'])
 def get_payments():
+    """
+    Список платежей (новые первыми): keyset-пагинация по (created_at, id), ?limit=&cursor=.
+
+    ?page= оставлен для старых клиентов (OFFSET + COUNT). Точный total — только
+    с ?count=exact; для выборки по ?user_id= без него total не считается.
+    """
     try:
-        user_id = request.args.get('user_id')
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
-        per_page = min(per_page, 200)  # Max 200 per page
+        from utils.pagination import encode_cursor, decode_cursor, get_limit, keyset_condition, approximate_count
+
+        user_id = request.args.get('user_id', type=int)
+        legacy_page = request.args.get('page', type=int)
+        per_page = get_limit(request.args)
 
+        query = PaymentModel.query
         if user_id:
-            # Payments for specific user with pagination
-            query = PaymentModel.query.filter_by(user_id=int(user_id)).order_by(
-                PaymentModel.created_at.desc()
-            )
-            total = query.count()
-            payments = query.offset((page - 1) * per_page).limit(per_page).all()
+            query = query.filter_by(user_id=user_id)
+        query = query.order_by(PaymentModel.created_at.desc(), PaymentModel.id.desc())
+
+        if legacy_page:
+            total = query.order_by(None).count()
+            payments = query.offset((legacy_page - 1) * per_page).limit(per_page).all()
+            has_next = legacy_page * per_page < total
         else:
-            # All payments with pagination
-            query = PaymentModel.query.order_by(PaymentModel.created_at.desc())
-            total = query.count()
-            payments = query.offset((page - 1) * per_page).limit(per_page).all()
+            cursor = request.args.get('cursor')
+            if cursor:
+                try:
+                    position = decode_cursor(cursor)
+                    query = query.filter(keyset_condition(
+                        PaymentModel.created_at, position['created_at'], PaymentModel.id, position['id'],
+                        descending=True
+                    ))
+                except (ValueError, KeyError):
+                    return jsonify({'error': 'Invalid cursor'}), 400
+            payments = query.limit(per_page + 1).all()
+            has_next = len(payments) > per_page
+            payments = payments[:per_page]
 
         payments_list = []
         for payment in payments:
@@ -452,18 +517,39 @@ def get_payments():
                 'stars_amount': payment.stars_amount
             })
 
-        total_pages = (total + per_page - 1) // per_page if total > 0 else 0
-
-        return jsonify({
-            'payments': payments_list,
-            'pagination': {
-                'page': page,
+        if legacy_page:
+            total_pages = (total + per_page - 1) // per_page if total > 0 else 0
+            pagination = {
+                'page': legacy_page,
                 'per_page': per_page,
                 'total': total,
                 'pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1
+                'has_next': has_next,
+                'has_prev': legacy_page > 1
             }
+        else:
+            if request.args.get('count') == 'exact':
+                total, total_is_estimate = query.order_by(None).count(), False
+            elif not user_id:
+                total, total_is_estimate = approximate_count(PaymentModel.__tablename__)
+            else:
+                total, total_is_estimate = None, True
+
+            next_cursor = None
+            if has_next and payments:
+                last = payments[-1]
+                next_cursor = encode_cursor({'created_at': last.created_at, 'id': last.id})
+            pagination = {
+                'limit': per_page,
+                'next_cursor': next_cursor,
+                'has_next': has_next,
+                'total': total,
+                'total_is_estimate': total_is_estimate
+            }
+
+        return jsonify({
+            'payments': payments_list,
+            'pagination': pagination
         })
     except Exception as e:
         print(f"Error getting payments: {str(e)}")
@@ -472,34 +558,176 @@ def get_payments():
 
 @routes_bp.route('/api/admin/users', methods=['GET'])
 def get_admin_users():
+    """
+    Список пользователей для админки одним запросом.
+
+    Агрегаты платежей и подключений за 24ч считаются сгруппированными подзапросами,
+    пагинация — keyset по (sort, id): ?limit=&cursor=&sort=&order=.
+    Фильтры: ?status=active|inactive|deleted, ?search= (id или username), ?has_payments=1.
+    """
     try:
-        users = User.get_all_users()
-        users_list = []
+        from sqlalchemy import func as sql_func
+        from utils.pagination import (
+            encode_cursor, decode_cursor, get_limit, keyset_condition, approximate_count, exact_count
+        )
 
-        for user in users:
-            user_payments = Payment.get_payments_by_user(user.id)
-            total_spent = sum(float(p.amount) for p in user_payments if p.paid)
-            payment_count = len(user_payments)
+        limit = get_limit(request.args)
+        sort = request.args.get('sort', 'id')
+        order = request.args.get('order', 'desc' if sort != 'id' else 'asc')
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': 'order must be asc or desc'}), 400
+        descending = order == 'desc'
+
+        now = datetime.utcnow()
+        epoch = datetime(1970, 1, 1)
+
+        payment_stats = db.session.query(
+            PaymentModel.user_id.label('user_id'),
+            sql_func.count(PaymentModel.id).label('payment_count'),
+            sql_func.sum(db.case((PaymentModel.paid.is_(True), PaymentModel.amount), else_=0)).label('total_spent')
+        ).group_by(PaymentModel.user_id).subquery()
+
+        recent_logs = db.session.query(
+            ConnectionLog.user_id.label('user_id'),
+            sql_func.count(ConnectionLog.id).label('recent_connections')
+        ).filter(
+            ConnectionLog.timestamp >= now - timedelta(hours=24)
+        ).group_by(ConnectionLog.user_id).subquery()
+
+        payment_count = sql_func.coalesce(payment_stats.c.payment_count, 0)
+        total_spent = sql_func.coalesce(payment_stats.c.total_spent, 0)
+        recent_connections = sql_func.coalesce(recent_logs.c.recent_connections, 0)
+
+        # NULL-значения приводим к константе, чтобы keyset-сравнение было однозначным
+        sort_columns = {
+            'id': None,
+            'created_at': sql_func.coalesce(UserModel.created_at, epoch),
+            'subscription_end_date': sql_func.coalesce(UserModel.subscription_end_date, epoch),
+            'total_spent': total_spent,
+            'payment_count': payment_count,
+            'recent_connections': recent_connections,
+        }
+        if sort not in sort_columns:
+            return jsonify({'error': f"sort must be one of: {', '.join(sort_columns)}"}), 400
+        sort_expr = sort_columns[sort]
+
+        query = db.session.query(
+            UserModel.id,
+            UserModel.username,
+            UserModel.subscription_end_date,
+            UserModel.created_at,
+            UserModel.is_tester,
+            UserModel.deleted_at,
+            payment_count.label('payment_count'),
+            total_spent.label('total_spent'),
+            recent_connections.label('recent_connections')
+        ).outerjoin(
+            payment_stats, payment_stats.c.user_id == UserModel.id
+        ).outerjoin(
+            recent_logs, recent_logs.c.user_id == UserModel.id
+        )
 
-            cutoff_time = datetime.utcnow() - timedelta(hours=24)
-            recent_logs_count = ConnectionLog.query.filter(
-                ConnectionLog.user_id == user.id,
-                ConnectionLog.timestamp >= cutoff_time
-            ).count()
+        status = request.args.get('status')
+        filtered = bool(status)
+        if status == 'active':
+            query = query.filter(
+                UserModel.deleted_at.is_(None),
+                db.or_(UserModel.is_tester.is_(True), UserModel.subscription_end_date >= now)
+            )
+        elif status == 'inactive':
+            query = query.filter(
+                UserModel.deleted_at.is_(None),
+                db.or_(UserModel.is_tester.is_(False), UserModel.is_tester.is_(None)),
+                db.or_(UserModel.subscription_end_date.is_(None), UserModel.subscription_end_date < now)
+            )
+        elif status == 'deleted':
+            query = query.filter(UserModel.deleted_at.isnot(None))
+        elif status:
+            return jsonify({'error': 'status must be active, inactive or deleted'}), 400
+
+        search = (request.args.get('search') or '').strip()
+        if search:
+            if search.isdigit():
+                query = query.filter(db.or_(UserModel.id == int(search), UserModel.username.ilike(f'%{search}%')))
+            else:
+                query = query.filter(UserModel.username.ilike(f'%{search}%'))
+            filtered = True
+
+        if request.args.get('has_payments') in ('1', 'true'):
+            query = query.filter(payment_stats.c.payment_count > 0)
+            filtered = True
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            if position.get('sort') != sort or position.get('order') != order or 'id' not in position:
+                return jsonify({'error': 'Cursor does not match sort/order'}), 400
+            query = query.filter(keyset_condition(
+                sort_expr, position.get('value'), UserModel.id, position['id'], descending
+            ))
+
+        order_by = [UserModel.id.desc() if descending else UserModel.id.asc()]
+        if sort_expr is not None:
+            order_by.insert(0, sort_expr.desc() if descending else sort_expr.asc())
+
+        rows = query.order_by(*order_by).limit(limit + 1).all()
+        has_next = len(rows) > limit
+        rows = rows[:limit]
 
-            user_info = {
-                'id': user.id,
-                'username': user.username,
-                'subscription_status': 'active' if user.is_subscription_active() else 'inactive',
-                'subscription_end_date': user.subscription_end_date.isoformat() if user.subscription_end_date else None,
-                'created_at': user.created_at.isoformat(),
-                'total_spent': round(total_spent, 2),
-                'payment_count': payment_count,
-                'recent_connections': recent_logs_count
+        users_list = []
+        for row in rows:
+            is_active = bool(row.is_tester) or (
+                row.subscription_end_date is not None and row.subscription_end_date >= now
+            )
+            users_list.append({
+                'id': row.id,
+                'username': row.username,
+                'subscription_status': 'active' if is_active else 'inactive',
+                'subscription_end_date': row.subscription_end_date.isoformat() if row.subscription_end_date else None,
+                'created_at': row.created_at.isoformat() if row.created_at else None,
+                'total_spent': round(float(row.total_spent or 0), 2),
+                'payment_count': row.payment_count,
+                'recent_connections': row.recent_connections,
+                'deleted': row.deleted_at is not None
+            })
+
+        next_cursor = None
+        if has_next and rows:
+            last = rows[-1]
+            sort_values = {
+                'created_at': last.created_at or epoch,
+                'subscription_end_date': last.subscription_end_date or epoch,
+                'total_spent': last.total_spent,
+                'payment_count': last.payment_count,
+                'recent_connections': last.recent_connections,
             }
-            users_list.append(user_info)
+            next_cursor = encode_cursor({
+                'sort': sort, 'order': order, 'id': last.id, 'value': sort_values.get(sort)
+            })
 
-        return jsonify({'users': users_list})
+        # Точный COUNT только по ?count=exact; без фильтров — оценка из статистики планировщика
+        if request.args.get('count') == 'exact':
+            total, total_is_estimate = exact_count(query.order_by(None).subquery()), False
+        elif not filtered:
+            total, total_is_estimate = approximate_count(UserModel.__tablename__)
+        else:
+            total, total_is_estimate = None, True
+
+        return jsonify({
+            'users': users_list,
+            'pagination': {
+                'limit': limit,
+                'sort': sort,
+                'order': order,
+                'next_cursor': next_cursor,
+                'has_next': has_next,
+                'total': total,
+                'total_is_estimate': total_is_estimate
+            }
+        })
     except Exception as e:
         print(f"Error getting admin users: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -606,6 +834,19 @@ def get_system_info():
         return jsonify({'error': str(e)}), 500
 
 
+@routes_bp.route('/api/admin/payments/reconcile', methods=['GET'])
+def get_payment_reconcile_metrics():
+    """Задержка оплата → активация и хвост платежей, ждущих сверки с YooKassa"""
+    try:
+        from services.payment_reconciler import PaymentReconciler
+
+        hours = min(max(request.args.get('hours', 24, type=int), 1), 24 * 7)
+        return jsonify(PaymentReconciler().metrics(hours))
+    except Exception as e:
+        logger.error(f"Error in get_payment_reconcile_metrics: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
 @routes_bp.route('/api/admin/vpn/servers', methods=['GET'])
 def get_vpn_servers():
     try:
@@ -659,6 +900,16 @@ def get_marzban_subscription_route(user_id):
         return jsonify({'error': str(e)}), 500
 
 
+@routes_bp.route('/api/marzban/reissue/<int:user_id>', methods=['POST'])
+def reissue_marzban_key_route(user_id):
+    try:
+        result = vpn_service.reissue_marzban_key(user_id)
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in reissue_marzban_key_route: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @routes_bp.route('/api/marzban/remove/<int:user_id>', methods=['POST'])
 def remove_marzban_user_route(user_id):
     try:
@@ -675,7 +926,7 @@ def delete_user(user_id):
         from database.db_config import db
         from database.models.payment_model import Payment as PaymentModel
 
-        user = UserModel.query.filter_by(id=user_id).first()
+        user = User.get_by_id(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
@@ -719,13 +970,44 @@ def marzban_webhook():
 @routes_bp.route('/api/sync/marzban', methods=['POST'])
 def sync_marzban_endpoint():
     try:
-        result = vpn_service.sync_all_users_with_marzban()
+        mode = request.args.get('mode', 'auto')
+        if mode not in ('auto', 'delta', 'full'):
+            return jsonify({'status': 'error', 'message': 'mode must be one of: auto, delta, full'}), 400
+
+        result = vpn_service.sync_all_users_with_marzban(mode)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in sync_marzban_endpoint: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@routes_bp.route('/api/notifications/expiring', methods=['GET'])
+def get_expiring_reminders():
+    """Пользователи, которым сегодня нужно напоминание об истечении подписки"""
+    try:
+        from services.reminder_service import ReminderService
+
+        return jsonify(ReminderService().get_due_reminders())
+    except Exception as e:
+        logger.error(f"Error in get_expiring_reminders: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@routes_bp.route('/api/notifications/expiring/sent', methods=['POST'])
+@validate_json(ExpirationRemindersSentSchema)
+def mark_expiring_reminders_sent():
+    """Отметка отправленных напоминаний одним UPDATE"""
+    try:
+        from services.reminder_service import ReminderService
+
+        data = request.validated_data
+        result = ReminderService().mark_reminded(data['user_ids'], data['date'])
+        return jsonify(result), 200 if result['status'] == 'success' else 500
+    except Exception as e:
+        logger.error(f"Error in mark_expiring_reminders_sent: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
 @routes_bp.route('/api/vpn/choose', methods=['GET'])
 def choose_vpn_type():
     try:
@@ -29,3 +29,9 @@ class CheckFingerprintSchema(Schema):
 class ConnectVpnSchema(Schema):
     """Schema for POST /api/vpn/connect and /api/vpn/disconnect"""
     user_id = fields.Integer(required=True, strict=True)
+
+
+class ExpirationRemindersSentSchema(Schema):
+    """Schema for POST /api/notifications/expiring/sent"""
+    user_ids = fields.List(fields.Integer(strict=True), required=True, validate=validate.Length(max=10000))
+    date = fields.Date(load_default=None, allow_none=True)
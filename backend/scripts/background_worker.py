@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Фоновый обработчик контейнера backend: один процесс вместо нескольких,
+чтобы уложиться в лимит памяти контейнера
+- события YooKassa из payment_events (PaymentEventProcessor, отдельный поток)
+- исходящие Telegram-уведомления из notification_outbox (NotificationDispatcher)
+- сверка зависших платежей с YooKassa (PaymentReconciler, отдельный поток)
+
+Usage:
+    python scripts/background_worker.py
+"""
+
+import os
+import sys
+import asyncio
+import threading
+
+# Добавляем путь к backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Импортируем Flask app для context
+from server import app
+from services.notification_queue import NotificationDispatcher
+from services.payment_event_processor import PaymentEventProcessor
+from services.payment_reconciler import PaymentReconciler
+
+
+def run_payment_events(poll_interval: float):
+    # Свой app context — своя сессия SQLAlchemy, отдельная от диспетчера уведомлений
+    with app.app_context():
+        PaymentEventProcessor().run_forever(poll_interval)
+
+
+def run_payment_reconciler():
+    with app.app_context():
+        PaymentReconciler().run_forever()
+
+
+async def main():
+    poll_interval = float(os.getenv('NOTIFICATION_POLL_INTERVAL', '1'))
+    threading.Thread(
+        target=run_payment_events, args=(poll_interval,), name="payment-events", daemon=True
+    ).start()
+    threading.Thread(
+        target=run_payment_reconciler, name="payment-reconciler", daemon=True
+    ).start()
+
+    with app.app_context():
+        print("⚙️ Фоновый обработчик запущен: payment_events, notification_outbox, сверка платежей")
+        await NotificationDispatcher().run_forever(poll_interval)
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("🛑 Фоновый обработчик остановлен")
@@ -19,15 +19,51 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Импортируем Flask app для context
 from server import app
-from database.models.connection_log_model import ConnectionLog
 from database.db_config import db
+from database import partitions
+
+
+def delete_in_batches(cutoff_date, table='connection_logs', batch_size=10000):
+    """
+    Set-based удаление пачками по ctid — для установок без партиционирования
+    и для строк, попавших в default-партицию. Каждая пачка — отдельная транзакция.
+
+    ctid уникален только внутри одной физической таблицы, поэтому для
+    партиционированной установки сюда передаётся сама default-партиция.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        statement = db.text(f"""
+            DELETE FROM {table}
+            WHERE ctid = ANY(ARRAY(
+                SELECT ctid FROM {table} WHERE timestamp < :cutoff LIMIT :batch_size
+            ))
+        """)
+    else:
+        statement = db.text(f"""
+            DELETE FROM {table}
+            WHERE rowid IN (SELECT rowid FROM {table} WHERE timestamp < :cutoff LIMIT :batch_size)
+        """)
+
+    deleted_count = 0
+    while True:
+        deleted = db.session.execute(statement, {'cutoff': cutoff_date, 'batch_size': batch_size}).rowcount
+        db.session.commit()
+        deleted_count += deleted
+        if deleted < batch_size:
+            break
+    return deleted_count
+
 
 def cleanup_old_logs(days=30):
     """
     Удаление старых connection logs
 
+    Для партиционированной таблицы: создаём партиции на неделю вперёд и удаляем
+    старые партиции целиком (DROP TABLE). Остаток (default-партиция или
+    непартиционированная таблица) — пакетный DELETE по ctid.
+
     :param days: Хранить логи за последние N дней
-    :return: Количество удалённых записей
+    :return: Количество удалённых записей (без учёта удалённых партиций)
     """
     print("=" * 60)
     print(f"🗑️  Очистка connection logs старше {days} дней")
@@ -36,36 +72,18 @@ def cleanup_old_logs(days=30):
     try:
         cutoff_date = datetime.utcnow() - timedelta(days=days)
 
-        # Считаем количество записей до очистки
-        total_before = ConnectionLog.query.count()
-        print(f"\n📊 Записей до очистки: {total_before}")
-
-        # Удаляем пакетами по 1000 записей для избежания блокировок
-        deleted_count = 0
-        batch_size = 1000
-
-        while True:
-            # Находим старые записи
-            old_logs = ConnectionLog.query.filter(
-                ConnectionLog.timestamp < cutoff_date
-            ).limit(batch_size).all()
-
-            if not old_logs:
-                break
-
-            # Удаляем пакет
-            for log in old_logs:
-                db.session.delete(log)
-
-            db.session.commit()
-            deleted_count += len(old_logs)
+        table = 'connection_logs'
+        if partitions.is_partitioned():
+            table = partitions.DEFAULT_PARTITION
+            created = partitions.ensure_partitions(days_ahead=7)
+            print(f"\n📅 Создано партиций: {len(created)}")
 
-            if len(old_logs) < batch_size:
-                break
+            dropped = partitions.drop_partitions_before(cutoff_date)
+            print(f"🗂️  Удалено партиций: {len(dropped)}" + (f" ({dropped[0]} … {dropped[-1]})" if dropped else ""))
+        else:
+            print("\nℹ️  Таблица не партиционирована — пакетный DELETE")
 
-        # Считаем количество записей после очистки
-        total_after = ConnectionLog.query.count()
-        print(f"📊 Записей после очистки: {total_after}")
+        deleted_count = delete_in_batches(cutoff_date, table=table)
         print(f"✅ Удалено записей: {deleted_count}")
 
         print("\n" + "=" * 60)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Диспетчер исходящих Telegram-уведомлений (таблица notification_outbox)
+В контейнере backend работает внутри scripts/background_worker.py; отдельно —
+для ручного запуска и разбора очереди
+
+Usage:
+    python scripts/notification_dispatcher.py [--once]
+
+Arguments:
+    --once - обработать одну пачку и выйти
+"""
+
+import os
+import sys
+import asyncio
+
+# Добавляем путь к backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Импортируем Flask app для context
+from server import app
+from services.notification_queue import NotificationDispatcher
+
+
+async def main(once: bool = False):
+    dispatcher = NotificationDispatcher()
+    with app.app_context():
+        if once:
+            processed = await dispatcher.dispatch_batch()
+            print(f"✅ Обработано уведомлений: {processed}")
+            return
+        print("📤 Диспетчер уведомлений запущен")
+        await dispatcher.run_forever(float(os.getenv('NOTIFICATION_POLL_INTERVAL', '1')))
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main(once='--once' in sys.argv[1:]))
+    except KeyboardInterrupt:
+        print("🛑 Диспетчер уведомлений остановлен")
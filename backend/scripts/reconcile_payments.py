@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Разовая сверка зависших платежей с YooKassa (то же делает scripts/background_worker.py
+каждые PAYMENT_RECONCILE_INTERVAL сек). Оплаченные платежи получают событие
+payment.succeeded — подписку продлит обработчик payment_events
+
+Usage:
+    python scripts/reconcile_payments.py                    # сверить платежи старше PAYMENT_RECONCILE_MIN_AGE
+    python scripts/reconcile_payments.py --min-age 0        # включая только что созданные
+    python scripts/reconcile_payments.py --metrics          # задержка оплата → активация за 24 ч
+"""
+
+import os
+import sys
+import json
+import argparse
+
+# Добавляем путь к backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Импортируем Flask app для context
+from server import app
+from services.payment_reconciler import PaymentReconciler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconcile stale pending payments with YooKassa')
+    parser.add_argument('--min-age', type=int, help='минимальный возраст платежа, сек')
+    parser.add_argument('--max-age', type=int, help='максимальный возраст платежа, сек')
+    parser.add_argument('--metrics', action='store_true', help='только показать метрики')
+    parser.add_argument('--hours', type=int, default=24, help='окно метрик, часов')
+    args = parser.parse_args()
+
+    with app.app_context():
+        reconciler = PaymentReconciler(min_age=args.min_age, max_age=args.max_age)
+        result = reconciler.metrics(args.hours) if args.metrics else reconciler.run_once()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if result['status'] == 'success' else 1)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Точный пересчёт stats rollup (stats_counters, revenue_hourly)
+Запускается ежедневно вместе с cleanup_logs.py и исправляет расхождения
+от изменений в обход ORM (raw SQL, ручные правки в БД)
+
+Usage:
+    python scripts/refresh_stats.py
+"""
+
+import os
+import sys
+
+# Добавляем путь к backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Импортируем Flask app для context
+from server import app
+from services.stats_service import StatsService
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        result = StatsService().recompute()
+
+    if result['status'] == 'success':
+        print(f"✅ Статистика пересчитана: {result['counters']}, часовых бакетов: {result['buckets']}")
+    else:
+        print(f"❌ Ошибка пересчёта статистики: {result['message']}")
+
+    sys.exit(0 if result['status'] == 'success' else 1)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Повторная обработка webhook-событий YooKassa: возвращает события в очередь,
+их подберёт scripts/background_worker.py. Активация идемпотентна
+(payments.activated_at), поэтому повтор уже обработанного платежа безопасен
+
+Usage:
+    python scripts/replay_payment_events.py                  # все события со статусом failed
+    python scripts/replay_payment_events.py --payment <id>   # все события платежа
+    python scripts/replay_payment_events.py --id 12 15       # конкретные события
+    python scripts/replay_payment_events.py --list           # показать failed-события
+"""
+
+import os
+import sys
+import argparse
+
+# Добавляем путь к backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Импортируем Flask app для context
+from server import app
+from database.models.payment_event_model import PaymentEvent
+from services.payment_event_processor import PaymentEventProcessor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay YooKassa webhook events')
+    parser.add_argument('--payment', help='ID платежа')
+    parser.add_argument('--id', type=int, nargs='+', help='ID событий')
+    parser.add_argument('--list', action='store_true', help='только показать failed-события')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.list:
+            events = PaymentEvent.query.filter_by(status='failed').order_by(PaymentEvent.id).all()
+            for event in events:
+                print(f"#{event.id} {event.event} {event.payment_id} попыток: {event.attempts} — {event.last_error}")
+            print(f"Всего failed-событий: {len(events)}")
+            sys.exit(0)
+
+        result = PaymentEventProcessor.replay(event_ids=args.id, payment_id=args.payment)
+
+    if result['status'] == 'success':
+        print(f"✅ Возвращено в очередь событий: {result['replayed']}")
+    else:
+        print(f"❌ Ошибка: {result['message']}")
+
+    sys.exit(0 if result['status'] == 'success' else 1)
@@ -23,6 +23,8 @@ CORS(app, resources={r"/api/*": {"origins": [o.strip() for o in allowed_origins.
 # Rate Limiting
 from utils.limiter import limiter
 from utils.error_handler import register_error_handlers
+# RATELIMIT_ENABLED=false — только для нагрузочного теста (scripts/load_test.py)
+app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() != 'false'
 limiter.init_app(app)
 register_error_handlers(app)
 
@@ -40,6 +42,9 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from database.db_config import init_db, db
 init_db(app)
 
+from utils.request_context import init_request_context
+init_request_context(app)
+
 from routes import routes_bp
 app.register_blueprint(routes_bp)
 
@@ -0,0 +1,311 @@
+"""Async Marzban API client (httpx) + синхронный адаптер для Flask-кода"""
+
+import os
+import asyncio
+import logging
+import threading
+import time
+
+import httpx
+
+from services.marzban_client import (
+    MarzbanClient, marzban_circuit_breaker, marzban_circuit_open, build_subscription_url
+)
+from services.marzban_token import get_token_provider
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AsyncMarzbanClient:
+    """
+    Асинхронная версия MarzbanClient с теми же методами и форматом ответов.
+
+    Один httpx.AsyncClient с keep-alive пулом на экземпляр, количество одновременных
+    запросов ограничено семафором (MARZBAN_MAX_CONCURRENCY). Логин защищён тем же
+    marzban_circuit_breaker, что и в синхронном клиенте.
+    """
+
+    def __init__(self, max_concurrency: int = None):
+        self.base_url = os.getenv('MARZBAN_URL', 'http://host.docker.internal:8000')
+        self.username = os.getenv('MARZBAN_ADMIN', 'admin')
+        self.password = os.getenv('MARZBAN_PASSWORD')
+        self.tokens = get_token_provider(self.base_url, self.username)
+        self.max_concurrency = max_concurrency or int(os.getenv('MARZBAN_MAX_CONCURRENCY', '20'))
+
+        self._client = None
+        self._semaphore = None
+        self._token_lock = None
+
+        if not self.password:
+            logger.warning("MARZBAN_PASSWORD not set. Marzban integration will not work.")
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        # Клиент и примитивы создаются лениво — они привязаны к работающему event loop
+        if self._client is None:
+            pool_size = int(os.getenv('MARZBAN_POOL_SIZE', '10'))
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(10.0),
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size,
+                    keepalive_expiry=30
+                ),
+                transport=httpx.AsyncHTTPTransport(retries=3, verify=True),
+                follow_redirects=False
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._token_lock = asyncio.Lock()
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Запрос с повтором на 429/5xx (backoff 1s, 2s, 4s), как Retry в синхронном клиенте"""
+        client = self._ensure_client()
+        for attempt in range(4):
+            async with self._semaphore:
+                response = await client.request(method, path, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == 3:
+                response.raise_for_status()
+                return response
+            await asyncio.sleep(2 ** attempt)
+
+    async def _login(self) -> str:
+        response = await self._send(
+            "POST", "/api/admin/token",
+            data={"username": self.username, "password": self.password}
+        )
+        return response.json()["access_token"]
+
+    async def get_token(self):
+        # Общий с другими процессами токен (marzban_token); файловый lock берётся в потоке executor'а
+        token = self.tokens.cached()
+        if token:
+            return token
+
+        self._ensure_client()
+        async with self._token_lock:
+            # Другой корутин или процесс мог обновить токен, пока мы ждали lock
+            token = self.tokens.cached()
+            if token:
+                return token
+
+            stale = self.tokens.cached(min_ttl=0)
+            if marzban_circuit_open():
+                logger.error("Error getting Marzban token: circuit breaker is open")
+                return stale
+
+            acquired = await asyncio.to_thread(self.tokens.acquire, stale is None)
+            if not acquired:
+                return stale
+
+            try:
+                token = self.tokens.cached()
+                if token:
+                    return token
+
+                error = None
+                try:
+                    token = await self._login()
+                except Exception as e:
+                    error = e
+
+                def report():
+                    if error:
+                        raise error
+                    return token
+
+                try:
+                    token = marzban_circuit_breaker.call(report)
+                    self.tokens.store(token)
+                    return token
+                except Exception as e:
+                    logger.error(f"Error getting Marzban token: {e}")
+                    return stale
+            finally:
+                self.tokens.release()
+
+    async def _authorized(self, method: str, path: str, **kwargs) -> httpx.Response:
+        token = await self.get_token()
+        if not token:
+            raise RuntimeError("Failed to get token")
+        try:
+            return await self._send(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 401:
+                raise
+            # Сбрасываем только отклонённый токен и один раз повторяем со свежим
+            self.tokens.invalidate(token)
+            token = await self.get_token()
+            if not token:
+                raise
+            return await self._send(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+
+    async def create_user(self, username: str, data_limit: int, expire_days: int,
+                          protocols: dict = None, inbounds: dict = None, expire: int = None) -> dict:
+        if protocols is None:
+            protocols = {"vless": {}, "trojan": {}}
+
+        payload = {
+            "username": username,
+            "proxies": protocols,
+            "data_limit": data_limit,
+            "inbounds": inbounds or {
+                "vless": ["VLESS Reality"],
+                "trojan": ["Trojan TLS"]
+            }
+        }
+        if expire is not None and expire > 0:
+            payload["expire"] = int(expire)
+        elif expire_days is not None and expire_days > 0:
+            payload["expire"] = int(time.time()) + (expire_days * 86400)
+
+        try:
+            response = await self._authorized("POST", "/api/user", json=payload)
+            return {"status": "success", "data": response.json()}
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 409:
+                return {"status": "error", "message": f"User {username} already exists"}
+            logger.error(f"HTTP error creating Marzban user: {e}")
+            return {"status": "error", "message": str(e)}
+        except Exception as e:
+            logger.error(f"Error creating Marzban user: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def get_user(self, username: str) -> dict:
+        try:
+            response = await self._authorized("GET", f"/api/user/{username}")
+            return {"status": "success", "data": response.json()}
+        except Exception as e:
+            logger.error(f"Error getting user: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def get_users(self, offset: int = 0, limit: int = 1000) -> dict:
+        try:
+            response = await self._authorized(
+                "GET", "/api/users",
+                params={"offset": offset, "limit": limit},
+                timeout=30
+            )
+            data = response.json()
+            return {"status": "success", "users": data.get("users", []), "total": data.get("total", 0)}
+        except Exception as e:
+            logger.error(f"Error listing users: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def get_many_users(self, usernames: list) -> dict:
+        """Конвейерная загрузка нескольких пользователей через общий пул: username → результат get_user"""
+        results = await asyncio.gather(*(self.get_user(username) for username in usernames))
+        return dict(zip(usernames, results))
+
+    async def get_subscription_url(self, username: str) -> str:
+        try:
+            response = await self._authorized("GET", f"/api/user/{username}")
+            return build_subscription_url(response.json(), self.base_url)
+        except Exception as e:
+            logger.error(f"Error getting subscription URL: {e}")
+            return ""
+
+    async def remove_user(self, username: str) -> dict:
+        try:
+            await self._authorized("DELETE", f"/api/user/{username}")
+            return {"status": "success", "message": f"User {username} removed"}
+        except Exception as e:
+            logger.error(f"Error removing user: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def revoke_subscription(self, username: str) -> dict:
+        try:
+            response = await self._authorized("POST", f"/api/user/{username}/revoke_sub")
+            return {"status": "success", "data": response.json()}
+        except Exception as e:
+            logger.error(f"Error revoking subscription: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def modify_user(self, username: str, data: dict) -> dict:
+        try:
+            response = await self._authorized("PUT", f"/api/user/{username}", json=data)
+            return {"status": "success", "data": response.json()}
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Error modifying user: {e}")
+            return {"status": "error", "message": str(e), "code": e.response.status_code}
+        except Exception as e:
+            logger.error(f"Error modifying user: {e}")
+            return {"status": "error", "message": str(e)}
+
+    async def extend_user(self, username: str, days: int) -> dict:
+        """Продление подписки пользователя в Marzban"""
+        expire_timestamp = int(time.time()) + (days * 86400)
+        try:
+            response = await self._authorized("PUT", f"/api/user/{username}", json={"expire": expire_timestamp})
+            return {"status": "success", "data": response.json()}
+        except Exception as e:
+            logger.error(f"Error extending user: {e}")
+            return {"status": "error", "message": str(e)}
+
+
+class MarzbanClientAdapter:
+    """
+    Синхронный фасад над AsyncMarzbanClient для Flask-кода.
+
+    Все вызовы выполняются в одном фоновом event loop процесса, поэтому потоки
+    gunicorn и пул MarzbanReconciler делят один keep-alive пул соединений.
+    """
+
+    iter_users = MarzbanClient.iter_users
+
+    def __init__(self, client: AsyncMarzbanClient = None, timeout: float = 60):
+        self.client = client or AsyncMarzbanClient()
+        self.base_url = self.client.base_url
+        self.timeout = timeout
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        # Loop стартует лениво — после fork воркера gunicorn, а не в мастер-процессе
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="marzban-async", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result(self.timeout)
+
+    def get_token(self):
+        return self._run(self.client.get_token())
+
+    def create_user(self, username: str, data_limit: int, expire_days: int,
+                    protocols: dict = None, inbounds: dict = None, expire: int = None) -> dict:
+        return self._run(self.client.create_user(username, data_limit, expire_days, protocols, inbounds, expire))
+
+    def get_user(self, username: str) -> dict:
+        return self._run(self.client.get_user(username))
+
+    def get_users(self, offset: int = 0, limit: int = 1000) -> dict:
+        return self._run(self.client.get_users(offset, limit))
+
+    def get_many_users(self, usernames: list) -> dict:
+        return self._run(self.client.get_many_users(usernames))
+
+    def get_subscription_url(self, username: str) -> str:
+        return self._run(self.client.get_subscription_url(username))
+
+    def remove_user(self, username: str) -> dict:
+        return self._run(self.client.remove_user(username))
+
+    def revoke_subscription(self, username: str) -> dict:
+        return self._run(self.client.revoke_subscription(username))
+
+    def modify_user(self, username: str, data: dict) -> dict:
+        return self._run(self.client.modify_user(username, data))
+
+    def extend_user(self, username: str, days: int) -> dict:
+        return self._run(self.client.extend_user(username, days))
@@ -122,6 +122,12 @@ class BusinessLogicService:
             if not user:
                 return {'status': 'error', 'message': 'User not found'}
 
+            # 🔴 ИДЕМПОТЕНТНОСТЬ: платёж продлевает подписку один раз (повторный webhook, replay)
+            from database.models.payment_model import Payment as PaymentModel
+            if not PaymentModel.claim_activation(payment_id):
+                logger.info(f"ℹ️ Платёж {payment_id} уже активирован, пропускаем")
+                return {'status': 'success', 'user_id': user_id, 'already_activated': True}
+
             # Определяем длительность подписки из платежа
             amount = float(payment.get('amount', 0))
             from config.tariffs import get_tariff_by_price
@@ -148,6 +154,10 @@ class BusinessLogicService:
             if tariff:
                 user.data_limit_gb = tariff.get('data_limit_gb', 0)
 
+            # Уведомление — в outbox той же транзакцией, Telegram вызывается вне webhook-а
+            from database.models.notification_model import NotificationOutbox
+            NotificationOutbox.enqueue(user_id, 'subscription_activated', days_added=days_to_add)
+
             # Коммит в БД
             from database.db_config import db
             db.session.commit()
@@ -195,6 +205,8 @@ class BusinessLogicService:
                 'new_expire': user.subscription_end_date.isoformat()
             }
         except Exception as e:
+            from database.db_config import db
+            db.session.rollback()
             logger.error(f"❌ Ошибка активации подписки: {e}")
             return {'status': 'error', 'message': str(e)}
 
@@ -296,6 +308,18 @@ class BusinessLogicService:
                         'message': f'Latest payment is not in a valid state for subscription activation: {latest_payment.status}'
                     }
 
+                # 🔴 ИДЕМПОТЕНТНОСТЬ: по этому платежу подписку уже продлили
+                from database.models.payment_model import Payment as PaymentModel
+                if not PaymentModel.claim_activation(latest_payment.id):
+                    logger.info(f"ℹ️ Платёж {latest_payment.id} уже активирован, пропускаем")
+                    return {
+                        'status': 'success',
+                        'message': 'Subscription already activated for this payment',
+                        'user_id': user_id,
+                        'already_activated': True,
+                        'subscription_end_date': user.subscription_end_date.isoformat() if user.subscription_end_date else None
+                    }
+
                 # Determine subscription duration based on payment amount
                 duration_mapping = {
                     99: 30,   # 1 месяц
@@ -366,6 +390,10 @@ class BusinessLogicService:
                     print(f"Added {latest_payment.stars_amount} stars to user {user_id} balance. New balance: {new_balance}")
                     logger.info(f"Added {latest_payment.stars_amount} stars to user {user_id} balance. New balance: {new_balance}")
 
+                # Уведомление об оплате — в outbox той же транзакцией
+                from database.models.notification_model import NotificationOutbox
+                NotificationOutbox.enqueue(user_id, 'payment_success', amount=amount_float, days=days_to_add)
+
                 # Commit changes to database
                 db.session.commit()
                 print(f"Committed changes to database for user {user_id}. Subscription end date: {user.subscription_end_date}")
@@ -415,16 +443,6 @@ class BusinessLogicService:
                     logger.error(f"❌ Error creating Marzban user: {e}")
                     print(f"❌ Error creating Marzban user: {e}")
 
-                # Send notification to user about subscription activation
-                try:
-                    from notifications import send_payment_success_notification_sync
-                    logger.info(f"Sending payment success notification to user {user_id}")
-                    send_payment_success_notification_sync(user_id, amount_float, days_to_add)
-                    logger.info(f"Payment success notification sent to user {user_id}")
-                except Exception as e:
-                    print(f"Error sending payment notification to user {user_id}: {e}")
-                    logger.error(f"Error sending payment notification to user {user_id}: {e}")
-
                 return {
                     'status': 'success',
                     'message': 'Subscription activated successfully',
@@ -440,6 +458,8 @@ class BusinessLogicService:
                 }
 
         except Exception as e:
+            from database.db_config import db
+            db.session.rollback()
             print(f"Error activating subscription for user {user_id}: {str(e)}")
             logger.error(f"Error activating subscription for user {user_id}: {str(e)}", exc_info=True)
             return {
@@ -0,0 +1,257 @@
+"""Фоновая пакетная запись ConnectionLog"""
+
+import io
+import os
+import csv
+import queue
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('user_id', 'timestamp', 'connected', 'ip_address', 'user_agent')
+# Сколько раз фоновый поток повторяет пачку, которую не удалось записать (БД недоступна)
+CONNECTION_LOG_MAX_RETRIES = int(os.getenv('CONNECTION_LOG_MAX_RETRIES', '10'))
+
+
+class ConnectionLogWriter:
+    """
+    Write-behind буфер connection_logs.
+
+    - async (по умолчанию): строки копятся в ограниченной очереди, фоновый поток
+      пишет их раз в flush_interval секунд или по накоплении batch_size строк —
+      в PostgreSQL через COPY, иначе одним многострочным INSERT;
+    - sync (CONNECTION_LOG_DURABILITY=sync): строка записывается до ответа клиенту.
+
+    Строки остаются в очереди, пока их не заберут на запись: _flush_lock держится
+    только на время drain + запись одной пачки, поэтому flush() ждёт не дольше
+    текущей записи и пишет только то, что было в очереди на момент вызова.
+
+    Если очередь заполнена (max_queue), вызывающий поток сам сбрасывает пачку —
+    память ограничена. Пачка, которую не удалось записать (ошибка БД), уходит
+    в очередь повторов и повторяется фоновым потоком до CONNECTION_LOG_MAX_RETRIES
+    раз; после этого, а также если повторов накопилось больше max_queue строк,
+    она отбрасывается (stats['failed']). shutdown() дописывает остаток при
+    остановке воркера (atexit / хук gunicorn).
+
+    Поток стартует лениво в процессе, который первым вызвал enqueue(), — после
+    fork воркера gunicorn, а не в мастер-процессе.
+
+    Запись идёт через отдельное соединение (db.engine.begin()), а не через
+    db.session: sync-запись, backpressure и flush() вызываются из обработчика
+    запроса и не должны коммитить или откатывать его изменения.
+    """
+
+    def __init__(self, batch_size: int = None, flush_interval: float = None,
+                 max_queue: int = None, durability: str = None):
+        self.batch_size = batch_size or int(os.getenv('CONNECTION_LOG_BATCH_SIZE', '500'))
+        self.flush_interval = flush_interval or float(os.getenv('CONNECTION_LOG_FLUSH_INTERVAL', '1'))
+        self.max_queue = max_queue or int(os.getenv('CONNECTION_LOG_MAX_QUEUE', '10000'))
+        self.durability = durability or os.getenv('CONNECTION_LOG_DURABILITY', 'async')
+        self.stats = {'enqueued': 0, 'written': 0, 'failed': 0, 'batches': 0, 'backpressure': 0}
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        # Потоки gthread и фоновый поток обновляют stats одновременно
+        self._stats_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Будит фоновый поток раньше flush_interval, когда набралась полная пачка
+        self._wakeup = threading.Event()
+        # Пачки, которые не удалось записать: (rows, attempts)
+        self._retries = deque()
+        self._thread = None
+        self._pid = None
+        self._app = None
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            from flask import current_app
+            self._app = current_app._get_current_object()
+            if self._pid != os.getpid():
+                # После fork очередь и lock могли достаться от родителя в любом состоянии
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._flush_lock = threading.Lock()
+                self._stats_lock = threading.Lock()
+                self._wakeup = threading.Event()
+                self._retries = deque()
+                self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="connection-log-writer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, user_id: int, ip_address: str = None, user_agent: str = None,
+                connected: bool = True, timestamp: datetime = None, sync: bool = False):
+        """sync=True — записать до ответа, независимо от CONNECTION_LOG_DURABILITY"""
+        row = {
+            'user_id': user_id,
+            'timestamp': timestamp or datetime.utcnow(),
+            'connected': connected,
+            'ip_address': ip_address,
+            'user_agent': user_agent
+        }
+
+        if sync or self.durability == 'sync':
+            if not self._write([row]):
+                self._ensure_started()
+                self._retry_later([row], attempts=1)
+            return
+
+        self._ensure_started()
+        self._count(enqueued=1)
+        while True:
+            try:
+                self._queue.put_nowait(row)
+                if self._queue.qsize() >= self.batch_size:
+                    self._wakeup.set()
+                return
+            except queue.Full:
+                # Backpressure: буфер полон — запрос сам записывает пачку
+                self._count(backpressure=1)
+                self._write_batch()
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def _drain(self, limit: int = None) -> list:
+        rows = []
+        limit = self.batch_size if limit is None else min(limit, self.batch_size)
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    @staticmethod
+    def _copy(connection, rows: list) -> bool:
+        """COPY FROM STDIN через psycopg2; False, если драйвер его не поддерживает"""
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            if not hasattr(cursor, 'copy_expert'):
+                return False
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                # В CSV-формате COPY пустое поле без кавычек — NULL
+                writer.writerow([
+                    row['user_id'],
+                    row['timestamp'].isoformat(),
+                    'true' if row['connected'] else 'false',
+                    row['ip_address'] if row['ip_address'] is not None else '',
+                    row['user_agent'] if row['user_agent'] is not None else ''
+                ])
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY connection_logs ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+            return True
+        finally:
+            cursor.close()
+
+    def _write(self, rows: list) -> bool:
+        from database.db_config import db
+        from database.models.connection_log_model import ConnectionLog
+
+        try:
+            # Своя транзакция: сессия запроса (db.session) не коммитится и не откатывается
+            with db.engine.begin() as connection:
+                if connection.dialect.name != 'postgresql' or not self._copy(connection, rows):
+                    connection.execute(ConnectionLog.__table__.insert(), rows)
+            self._count(written=len(rows), batches=1)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} connection logs: {e}")
+            return False
+
+    def _retry_later(self, rows: list, attempts: int):
+        """Пачка уходит в очередь повторов; сверх лимитов — отбрасывается"""
+        backlog = sum(len(batch) for batch, _ in list(self._retries))
+        if attempts > CONNECTION_LOG_MAX_RETRIES or backlog + len(rows) > self.max_queue:
+            self._count(failed=len(rows))
+            logger.error(f"Dropped {len(rows)} connection logs after {attempts} failed attempts")
+            return
+        self._retries.append((rows, attempts))
+
+    def _write_batch(self, limit: int = None) -> int:
+        """Одна пачка из очереди: drain и запись под _flush_lock. Возвращает число строк"""
+        with self._flush_lock:
+            rows = self._drain(limit)
+            if rows and not self._write(rows):
+                self._retry_later(rows, attempts=1)
+        return len(rows)
+
+    def _write_retries(self):
+        for _ in range(len(self._retries)):
+            try:
+                rows, attempts = self._retries.popleft()
+            except IndexError:
+                return
+            if not self._write(rows):
+                self._retry_later(rows, attempts + 1)
+                # БД всё ещё недоступна — остальные повторы ждут следующего цикла
+                return
+
+    def pending_ips(self, user_id: int) -> dict:
+        """
+        {ip: время последнего подключения} пользователя из строк, ещё не записанных
+        в БД (очередь и повторы). Снимок без drain и без _flush_lock
+        """
+        with self._queue.mutex:
+            rows = list(self._queue.queue)
+        for batch, _ in list(self._retries):
+            rows.extend(batch)
+
+        ips = {}
+        for row in rows:
+            if row['user_id'] == user_id and row['ip_address'] is not None:
+                ips[row['ip_address']] = max(row['timestamp'], ips.get(row['ip_address'], row['timestamp']))
+        return ips
+
+    def flush(self):
+        """
+        Синхронно записывает строки, которые были в очереди на момент вызова
+        (нужен app context). Строки, добавленные после, остаются фоновому потоку
+        """
+        pending = self._queue.qsize()
+        while pending > 0:
+            written = self._write_batch(limit=pending)
+            if not written:
+                return
+            pending -= written
+
+    def shutdown(self):
+        """Хук graceful shutdown: дописывает буфер до выхода процесса"""
+        if self._app is None or self._pid != os.getpid():
+            return
+        with self._app.app_context():
+            self.flush()
+            self._write_retries()
+        logger.info(f"Connection log writer flushed on shutdown: {self.stats}")
+
+    def _run(self):
+        while True:
+            # Строки копятся в самой очереди, а не в потоке: flush() и backpressure
+            # видят их и не ждут, пока поток наберёт пачку
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    if self._retries:
+                        self._write_retries()
+                    while self._write_batch():
+                        pass
+            except Exception as e:
+                logger.error(f"Connection log writer error: {e}")
+
+
+connection_log_writer = ConnectionLogWriter()
+atexit.register(connection_log_writer.shutdown)
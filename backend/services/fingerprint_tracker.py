@@ -0,0 +1,189 @@
+"""Скользящее окно IP-адресов пользователя для /api/vpn/check-fingerprint"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Политика: не больше MAX_DEVICES разных IP за FINGERPRINT_WINDOW
+FINGERPRINT_WINDOW = timedelta(hours=24)
+MAX_DEVICES = 2
+
+
+def load_recent_ips(user_id: int, cutoff: datetime) -> dict:
+    """{ip: время последнего подключения} из connection_logs — один агрегирующий запрос"""
+    from sqlalchemy import func
+    from database.db_config import db
+    from database.models.connection_log_model import ConnectionLog
+
+    rows = db.session.query(
+        ConnectionLog.ip_address, func.max(ConnectionLog.timestamp)
+    ).filter(
+        ConnectionLog.user_id == user_id,
+        ConnectionLog.timestamp >= cutoff,
+        ConnectionLog.ip_address.isnot(None)
+    ).group_by(ConnectionLog.ip_address).all()
+    return {ip: last_seen for ip, last_seen in rows}
+
+
+def decide(ips: dict, ip: str, now: datetime) -> tuple:
+    """
+    Та же проверка, что была в check_fingerprint: новый IP допускается, только
+    если за окно было меньше MAX_DEVICES разных IP. Возвращает (allowed, distinct_ips).
+    """
+    cutoff = now - FINGERPRINT_WINDOW
+    for known_ip in [known_ip for known_ip, last_seen in ips.items() if last_seen < cutoff]:
+        del ips[known_ip]
+    if ip in ips:
+        return True, len(ips)
+    return len(ips) < MAX_DEVICES, len(ips)
+
+
+class MemoryFingerprintTracker:
+    """
+    Состояние в памяти процесса (LRU по пользователям), прогрев из БД.
+
+    Воркеры gunicorn не видят IP друг друга, поэтому из памяти разрешается только
+    уже известный IP. Любое решение по новому IP принимается по БД: IP пользователя
+    перечитываются из connection_logs (плюс его строки, ещё не записанные из очереди
+    этого воркера), а принятый новый IP записывается сразу (shared = False), чтобы
+    его увидели остальные воркеры. Политика та же, что при проверке по БД на каждый
+    запрос.
+
+    Сброс устройств на другом воркере виден по users.devices_reset_at: состояние,
+    загруженное до сброса (с запасом RESET_GRACE), перечитывается.
+    """
+
+    shared = False
+    RESET_GRACE = timedelta(seconds=5)
+
+    def __init__(self, max_users: int = None):
+        self.max_users = max_users or int(os.getenv('FINGERPRINT_MAX_USERS', '100000'))
+        # user_id → (ips, loaded_at)
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _reload(self, user_id: int, now: datetime) -> dict:
+        from services.connection_log_writer import connection_log_writer
+
+        ips = load_recent_ips(user_id, now - FINGERPRINT_WINDOW)
+        # Новые IP пишутся сразу, в очереди — только повторы (с более свежим временем)
+        for ip, last_seen in connection_log_writer.pending_ips(user_id).items():
+            ips[ip] = max(last_seen, ips.get(ip, last_seen))
+        with self._lock:
+            self._users[user_id] = (ips, now)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return ips
+
+    def check(self, user_id: int, ip: str, reset_at: datetime = None) -> tuple:
+        """(allowed, distinct_ips, new_ip); reset_at — users.devices_reset_at"""
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and (reset_at is None or reset_at < entry[1] - self.RESET_GRACE):
+                ips = entry[0]
+                self._users.move_to_end(user_id)
+                _, distinct = decide(ips, ip, now)
+                if ip in ips:
+                    ips[ip] = now
+                    return True, distinct, False
+
+        # Новый IP: решаем по БД
+        ips = self._reload(user_id, now)
+        with self._lock:
+            new_ip = ip not in ips
+            allowed, distinct = decide(ips, ip, now)
+            if allowed:
+                ips[ip] = now
+        return allowed, distinct, allowed and new_ip
+
+    def reset(self, user_id: int):
+        # Остальные воркеры перечитают состояние по users.devices_reset_at
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+class RedisFingerprintTracker:
+    """
+    Общее для всех воркеров состояние в Redis (хранилище limiter-а): ZSET ip → timestamp
+    на пользователя, проверка и запись — одним Lua-скриптом.
+    """
+
+    shared = True
+
+    CHECK_SCRIPT = """
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        return {-1, 0}
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[3])
+    local known = redis.call('ZSCORE', KEYS[1], ARGV[1])
+    local count = redis.call('ZCARD', KEYS[1])
+    if not known and count >= tonumber(ARGV[4]) then
+        return {0, count}
+    end
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    redis.call('EXPIRE', KEYS[2], ARGV[5])
+    if known then
+        return {1, count, 0}
+    end
+    return {1, count, 1}
+    """
+
+    def __init__(self, url: str):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self._check = self.redis.register_script(self.CHECK_SCRIPT)
+        self.ttl = int(FINGERPRINT_WINDOW.total_seconds())
+
+    @staticmethod
+    def _keys(user_id: int) -> list:
+        return [f"fingerprint:{user_id}", f"fingerprint:{user_id}:warm"]
+
+    def _warm(self, user_id: int, now: datetime):
+        ips = load_recent_ips(user_id, now - FINGERPRINT_WINDOW)
+        ips_key, warm_key = self._keys(user_id)
+        pipe = self.redis.pipeline()
+        if ips:
+            pipe.zadd(ips_key, {ip: last_seen.timestamp() for ip, last_seen in ips.items()})
+            pipe.expire(ips_key, self.ttl)
+        pipe.set(warm_key, 1, ex=self.ttl)
+        pipe.execute()
+
+    def check(self, user_id: int, ip: str, reset_at: datetime = None) -> tuple:
+        """(allowed, distinct_ips, new_ip); reset() общий для всех воркеров, reset_at не нужен"""
+        now = datetime.utcnow()
+        args = [ip, now.timestamp(), (now - FINGERPRINT_WINDOW).timestamp(), MAX_DEVICES, self.ttl]
+
+        result = self._check(keys=self._keys(user_id), args=args)
+        if result[0] == -1:
+            self._warm(user_id, now)
+            result = self._check(keys=self._keys(user_id), args=args)
+        return result[0] == 1, result[1], result[0] == 1 and result[2] == 1
+
+    def reset(self, user_id: int):
+        ips_key, warm_key = self._keys(user_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(ips_key)
+        pipe.set(warm_key, 1, ex=self.ttl)
+        pipe.execute()
+
+
+def create_fingerprint_tracker():
+    """Redis, если FINGERPRINT_STORAGE_URL (по умолчанию RATELIMIT_STORAGE_URL) указывает на redis://"""
+    url = os.getenv('FINGERPRINT_STORAGE_URL', os.getenv('RATELIMIT_STORAGE_URL', 'memory://'))
+    if url.startswith(('redis://', 'rediss://')):
+        try:
+            return RedisFingerprintTracker(url)
+        except ImportError:
+            logger.warning("redis package not installed, falling back to in-memory fingerprint tracker")
+    return MemoryFingerprintTracker()
+
+
+fingerprint_tracker = create_fingerprint_tracker()
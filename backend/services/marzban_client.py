@@ -1,6 +1,7 @@
 """Marzban API client"""
 
 import requests
+import httpx
 import time
 import os
 import logging
@@ -8,19 +9,54 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import pybreaker
 
+from services.marzban_token import get_token_provider
+
 logger = logging.getLogger(__name__)
 
 
+class _OpenedAtListener(pybreaker.CircuitBreakerListener):
+    """Запоминает момент открытия breaker-а (time.monotonic) для marzban_circuit_open()"""
+
+    opened_at = None
+
+    def state_change(self, cb, old_state, new_state):
+        self.opened_at = time.monotonic() if new_state.name == pybreaker.STATE_OPEN else None
+
+
+_breaker_opened_at = _OpenedAtListener()
+
 # Circuit Breaker для Marzban API
-# Открывается после 5 ошибок за 60 секунд, закрывается через 60 секунд
+# Открывается после 5 ошибок за 60 секунд, закрывается через 60 секунд.
+# Ошибки со статусом ответа (4xx) breaker не открывают — ни requests, ни httpx (async-клиент)
 marzban_circuit_breaker = pybreaker.CircuitBreaker(
     fail_max=5,
     reset_timeout=60,
-    exclude=[requests.exceptions.HTTPError],
+    exclude=[requests.exceptions.HTTPError, httpx.HTTPStatusError],
+    listeners=[_breaker_opened_at],
     name='marzban_api',
 )
 
 
+def marzban_circuit_open() -> bool:
+    """Быстрая проверка без сетевого вызова: открыт ли breaker и не истёк ли reset_timeout"""
+    if marzban_circuit_breaker.current_state != pybreaker.STATE_OPEN:
+        return False
+    opened_at = _breaker_opened_at.opened_at
+    return opened_at is not None and time.monotonic() < opened_at + marzban_circuit_breaker.reset_timeout
+
+
+def build_subscription_url(user_data: dict, base_url: str) -> str:
+    """Публичная ссылка подписки из payload пользователя Marzban (без дополнительного запроса)"""
+    subscription_url = (user_data or {}).get('subscription_url', '')
+
+    if subscription_url:
+        if subscription_url.startswith('/'):
+            public_url = os.getenv('MARZBAN_PUBLIC_URL', base_url)
+            return f"{public_url}{subscription_url}"
+        return subscription_url
+    return ""
+
+
 class MarzbanClient:
     def __init__(self):
         # Используем MARZBAN_URL из переменных окружения
@@ -28,8 +64,8 @@ class MarzbanClient:
         self.base_url = os.getenv('MARZBAN_URL', 'http://host.docker.internal:8000')
         self.username = os.getenv('MARZBAN_ADMIN', 'admin')
         self.password = os.getenv('MARZBAN_PASSWORD')
-        self.token = None
-        self.token_expiry = 0
+        # Токен общий для всех процессов (файл + flock), см. marzban_token
+        self.tokens = get_token_provider(self.base_url, self.username)
 
         if not self.password:
             logger.warning("MARZBAN_PASSWORD not set. Marzban integration will not work.")
@@ -42,34 +78,65 @@ class MarzbanClient:
             status_forcelist=[429, 500, 502, 503, 504],
             allowed_methods=["HEAD", "GET", "OPTIONS", "POST", "PUT", "DELETE"]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Пул соединений должен вмещать все потоки синхронизации (см. marzban_sync)
+        pool_size = int(os.getenv('MARZBAN_POOL_SIZE', '10'))
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size
+        )
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
+        self.session.hooks["response"].append(self._retry_on_unauthorized)
+
+    @property
+    def token(self):
+        return self.tokens.cached(min_ttl=0)
+
+    def _login(self) -> str:
+        # Отключаем редиректы, чтобы избежать перехода на HTTPS
+        response = self.session.post(
+            f"{self.base_url}/api/admin/token",
+            data={"username": self.username, "password": self.password},
+            timeout=10,
+            verify=True,  # SSL verification enabled
+            allow_redirects=False
+        )
+        response.raise_for_status()
+        return response.json()["access_token"]
 
     @marzban_circuit_breaker
     def get_token(self):
-        if self.token and time.time() < self.token_expiry:
-            return self.token
-
         try:
-            # Отключаем редиректы, чтобы избежать перехода на HTTPS
-            response = self.session.post(
-                f"{self.base_url}/api/admin/token",
-                data={"username": self.username, "password": self.password},
-                timeout=10,
-                verify=True,  # SSL verification enabled
-                allow_redirects=False
-            )
-            response.raise_for_status()
-            self.token = response.json()["access_token"]
-            self.token_expiry = time.time() + 2300
-            return self.token
+            return self.tokens.get_token(self._login)
         except Exception as e:
             logger.error(f"Error getting Marzban token: {e}")
             return None
 
+    def _retry_on_unauthorized(self, response, **kwargs):
+        """
+        401 на запросе с токеном: сбрасываем именно этот токен (если другой процесс
+        его ещё не заменил) и один раз повторяем запрос со свежим.
+        """
+        request = response.request
+        authorization = request.headers.get("Authorization", "")
+        if response.status_code != 401 or not authorization.startswith("Bearer ") \
+                or request.headers.get("X-Token-Retry"):
+            return response
+
+        self.tokens.invalidate(authorization[len("Bearer "):])
+        token = self.get_token()
+        if not token:
+            return response
+
+        retry = request.copy()
+        retry.headers["Authorization"] = f"Bearer {token}"
+        retry.headers["X-Token-Retry"] = "1"
+        response.close()
+        return self.session.send(retry, **kwargs)
+
     def create_user(self, username: str, data_limit: int, expire_days: int,
-                    protocols: dict = None, inbounds: dict = None) -> dict:
+                    protocols: dict = None, inbounds: dict = None, expire: int = None) -> dict:
         token = self.get_token()
         if not token:
             return {"status": "error", "message": "Failed to get token"}
@@ -92,7 +159,10 @@ class MarzbanClient:
             if inbounds:
                 payload["inbounds"] = inbounds
 
-            if expire_days is not None and expire_days > 0:
+            if expire is not None and expire > 0:
+                # Точный timestamp из БД имеет приоритет над expire_days
+                payload["expire"] = int(expire)
+            elif expire_days is not None and expire_days > 0:
                 import time
                 expire_timestamp = int(time.time()) + (expire_days * 86400)
                 payload["expire"] = expire_timestamp
@@ -132,15 +202,7 @@ class MarzbanClient:
                 allow_redirects=False
             )
             response.raise_for_status()
-            user_data = response.json()
-            subscription_url = user_data.get('subscription_url', '')
-
-            if subscription_url:
-                if subscription_url.startswith('/'):
-                    public_url = os.getenv('MARZBAN_PUBLIC_URL', self.base_url)
-                    return f"{public_url}{subscription_url}"
-                return subscription_url
-            return ""
+            return build_subscription_url(response.json(), self.base_url)
         except Exception as e:
             logger.error(f"Error getting subscription URL: {e}")
             return ""
@@ -165,6 +227,27 @@ class MarzbanClient:
             logger.error(f"Error removing user: {e}")
             return {"status": "error", "message": str(e)}
 
+    def revoke_subscription(self, username: str) -> dict:
+        """Перевыпуск ссылки подписки (POST /api/user/{username}/revoke_sub)"""
+        token = self.get_token()
+        if not token:
+            return {"status": "error", "message": "Failed to get token"}
+
+        try:
+            headers = {"Authorization": f"Bearer {token}"}
+            response = self.session.post(
+                f"{self.base_url}/api/user/{username}/revoke_sub",
+                headers=headers,
+                timeout=10,
+                verify=True,  # SSL verification enabled
+                allow_redirects=False
+            )
+            response.raise_for_status()
+            return {"status": "success", "data": response.json()}
+        except Exception as e:
+            logger.error(f"Error revoking subscription: {e}")
+            return {"status": "error", "message": str(e)}
+
     def modify_user(self, username: str, data: dict) -> dict:
         token = self.get_token()
         if not token:
@@ -182,6 +265,10 @@ class MarzbanClient:
             )
             response.raise_for_status()
             return {"status": "success", "data": response.json()}
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"Error modifying user: {e}")
+            # code: 404 — пользователя нет в Marzban (его можно создать)
+            return {"status": "error", "message": str(e), "code": e.response.status_code}
         except Exception as e:
             logger.error(f"Error modifying user: {e}")
             return {"status": "error", "message": str(e)}
@@ -206,6 +293,50 @@ class MarzbanClient:
             logger.error(f"Error getting user: {e}")
             return {"status": "error", "message": str(e)}
 
+    def get_users(self, offset: int = 0, limit: int = 1000) -> dict:
+        """Постраничная выгрузка пользователей Marzban (GET /api/users)"""
+        token = self.get_token()
+        if not token:
+            return {"status": "error", "message": "Failed to get token"}
+
+        try:
+            headers = {"Authorization": f"Bearer {token}"}
+            response = self.session.get(
+                f"{self.base_url}/api/users",
+                headers=headers,
+                params={"offset": offset, "limit": limit},
+                timeout=30,
+                verify=True,  # SSL verification enabled
+                allow_redirects=False
+            )
+            response.raise_for_status()
+            data = response.json()
+            return {
+                "status": "success",
+                "users": data.get("users", []),
+                "total": data.get("total", 0)
+            }
+        except Exception as e:
+            logger.error(f"Error listing users: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def iter_users(self, page_size: int = 1000):
+        """Генератор страниц пользователей Marzban; бросает RuntimeError при ошибке"""
+        offset = 0
+        while True:
+            page = self.get_users(offset=offset, limit=page_size)
+            if page.get("status") != "success":
+                raise RuntimeError(page.get("message", "Failed to list Marzban users"))
+
+            users = page.get("users", [])
+            if not users:
+                return
+            yield users
+
+            offset += len(users)
+            if len(users) < page_size or offset >= page.get("total", 0):
+                return
+
     def extend_user(self, username: str, days: int) -> dict:
         """Продление подписки пользователя в Marzban"""
         token = self.get_token()
@@ -234,3 +365,23 @@ class MarzbanClient:
         except Exception as e:
             logger.error(f"Error extending user: {e}")
             return {"status": "error", "message": str(e)}
+
+
+_shared_async_client = None
+
+
+def create_marzban_client():
+    """
+    Клиент Marzban для синхронного кода.
+
+    MARZBAN_CLIENT=async — общий на процесс адаптер над AsyncMarzbanClient
+    (один keep-alive пул на все потоки); по умолчанию — MarzbanClient на requests.
+    """
+    global _shared_async_client
+    if os.getenv('MARZBAN_CLIENT', 'sync').lower() != 'async':
+        return MarzbanClient()
+
+    if _shared_async_client is None:
+        from services.async_marzban_client import MarzbanClientAdapter
+        _shared_async_client = MarzbanClientAdapter()
+    return _shared_async_client
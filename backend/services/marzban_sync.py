@@ -0,0 +1,405 @@
+"""Marzban reconciliation engine - пакетная синхронизация PostgreSQL → Marzban"""
+
+import os
+import sys
+import time
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.marzban_client import MarzbanClient, create_marzban_client, build_subscription_url
+
+logger = logging.getLogger(__name__)
+
+# Inbounds по умолчанию — как в VPNService.ensure_user_provisioned
+DEFAULT_INBOUNDS = {
+    "vless": ["VLESS Reality"],
+    "trojan": ["Trojan TLS"]
+}
+
+
+class MarzbanReconciler:
+    """
+    Сверка активных подписчиков из БД с пользователями Marzban.
+
+    Фазы:
+        fetch_marzban — постраничная выгрузка всех пользователей Marzban (GET /api/users)
+        load_db       — один SELECT активных подписчиков (только нужные колонки)
+        diff          — вычисление списка create/modify в памяти
+        apply         — отправка изменений через ограниченный пул потоков
+
+    Весь прогон ограничен бюджетом времени (MARZBAN_SYNC_BUDGET, по умолчанию 45s —
+    меньше таймаута gunicorn). Не успевшие операции откладываются до следующего запуска.
+
+    Обычный запуск инкрементальный (delta): отправляются только пользователи, у которых
+    billing_updated_at новее marzban_synced_at. Полная сверка выполняется, если с прошлой
+    прошло больше MARZBAN_FULL_SYNC_INTERVAL секунд (по умолчанию сутки), или по запросу.
+    """
+
+    STATE_NAME = 'marzban'
+
+    def __init__(self, marzban: MarzbanClient = None, page_size: int = None,
+                 max_workers: int = None, time_budget: float = None):
+        self.marzban = marzban or create_marzban_client()
+        self.page_size = page_size or int(os.getenv('MARZBAN_SYNC_PAGE_SIZE', '1000'))
+        self.max_workers = max_workers or int(os.getenv('MARZBAN_SYNC_WORKERS', '8'))
+        self.time_budget = time_budget or float(os.getenv('MARZBAN_SYNC_BUDGET', '45'))
+        self.full_sync_interval = int(os.getenv('MARZBAN_FULL_SYNC_INTERVAL', '86400'))
+
+    # =========================================================
+    # Фазы
+    # =========================================================
+
+    def fetch_marzban_state(self, deadline: float) -> dict:
+        """username → (expire, data_limit) для всех пользователей Marzban (None — без ограничения)"""
+        state = {}
+        for page in self.marzban.iter_users(self.page_size):
+            for marzban_user in page:
+                state[marzban_user.get("username")] = (marzban_user.get("expire"), marzban_user.get("data_limit"))
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Marzban listing exceeded time budget after {len(state)} users")
+        return state
+
+    def load_db_state(self) -> list:
+        """Активные подписчики одним запросом, без загрузки ORM-объектов"""
+        from database.db_config import db
+        from database.models.user_model import User as UserModel
+
+        return db.session.query(
+            UserModel.id,
+            UserModel.subscription_end_date,
+            UserModel.data_limit_gb
+        ).filter(
+            UserModel.subscription_end_date > datetime.utcnow(),
+            UserModel.deleted_at.is_(None)
+        ).all()
+
+    def load_pending_rows(self) -> list:
+        """Пользователи, чей биллинг изменился после последней успешной отправки в Marzban"""
+        from database.db_config import db
+        from database.models.user_model import User as UserModel
+
+        # Условие совпадает с предикатом частичного индекса idx_users_marzban_sync_pending
+        return db.session.query(
+            UserModel.id,
+            UserModel.subscription_end_date,
+            UserModel.data_limit_gb,
+            UserModel.deleted_at
+        ).filter(
+            db.or_(
+                UserModel.marzban_synced_at.is_(None),
+                UserModel.billing_updated_at > UserModel.marzban_synced_at
+            )
+        ).all()
+
+    def mark_synced(self, run_started: datetime, user_ids: list = None, exclude_ids: list = None):
+        """
+        Одним UPDATE сдвигает watermark. Строки, изменённые после начала прогона
+        (billing_updated_at > run_started), остаются в очереди.
+        """
+        from database.db_config import db
+        from database.models.user_model import User as UserModel
+
+        query = UserModel.query.filter(
+            db.or_(
+                UserModel.marzban_synced_at.is_(None),
+                UserModel.billing_updated_at > UserModel.marzban_synced_at
+            ),
+            db.or_(
+                UserModel.billing_updated_at.is_(None),
+                UserModel.billing_updated_at <= run_started
+            )
+        )
+        if user_ids is not None:
+            if not user_ids:
+                return 0
+            query = query.filter(UserModel.id.in_(user_ids))
+        if exclude_ids:
+            query = query.filter(UserModel.id.notin_(exclude_ids))
+
+        marked = query.update({UserModel.marzban_synced_at: run_started}, synchronize_session=False)
+        db.session.commit()
+        return marked
+
+    def diff(self, db_rows: list, marzban_state: dict) -> tuple:
+        """Возвращает (операции, число уже синхронизированных пользователей)"""
+        operations = []
+        in_sync = 0
+
+        for row in db_rows:
+            username = f"user_{row.id}"
+            db_expire = int(row.subscription_end_date.timestamp())
+            data_limit_bytes = self._data_limit_bytes(row.data_limit_gb)
+
+            if username not in marzban_state:
+                operations.append(("create", username, {
+                    "data_limit": data_limit_bytes,
+                    "expire": db_expire
+                }))
+                continue
+
+            marzban_expire, marzban_data_limit = marzban_state[username]
+            changes = {}
+            # Если в БД дата больше, чем в Marzban — продлеваем
+            if marzban_expire and marzban_expire > 0 and db_expire > marzban_expire:
+                changes["expire"] = db_expire
+            # Лимит трафика: 0 и None в Marzban — безлимит
+            if data_limit_bytes != (marzban_data_limit or 0):
+                changes["data_limit"] = data_limit_bytes
+
+            if changes:
+                operations.append(("modify", username, changes))
+            else:
+                in_sync += 1
+
+        return operations, in_sync
+
+    @staticmethod
+    def _data_limit_bytes(data_limit_gb) -> int:
+        """Лимит трафика из БД в байтах, 0 = безлимитный трафик"""
+        return int(data_limit_gb * 1024**3) if data_limit_gb and data_limit_gb > 0 else 0
+
+    def _create(self, username: str, data: dict) -> dict:
+        return self.marzban.create_user(
+            username=username,
+            data_limit=data["data_limit"],
+            expire_days=None,
+            protocols={"vless": {}, "trojan": {}},
+            inbounds=DEFAULT_INBOUNDS,
+            expire=data["expire"]
+        )
+
+    def _apply_one(self, operation: tuple) -> dict:
+        action, username, data = operation
+        if action == "create":
+            return self._create(username, data)
+        if action == "push":
+            # Delta-режим: состояние Marzban не читаем — сначала обновляем (срок и лимит
+            # трафика), создаём, только если пользователя в Marzban нет (404). Другие
+            # ошибки (breaker, таймаут) оставляют пользователя в очереди
+            result = self.marzban.modify_user(username, {
+                "expire": data["expire"],
+                "data_limit": data["data_limit"]
+            })
+            if result.get("status") == "success" or result.get("code") != 404:
+                return result
+            result = self._create(username, data)
+            result["recreated"] = True
+            return result
+        return self.marzban.modify_user(username, data)
+
+    def apply(self, operations: list, deadline: float) -> dict:
+        """Выполняет операции в пуле потоков; новые задачи не запускаются после дедлайна"""
+        # created: username → subscription_url из ответа Marzban (записывается в БД после пула)
+        stats = {"created": 0, "updated": 0, "errors": 0, "deferred": 0, "failed": [], "created_urls": {}}
+        if not operations:
+            return stats
+
+        # Прогреваем токен в основном потоке, чтобы воркеры не логинились одновременно
+        self.marzban.get_token()
+
+        pending = iter(operations)
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="marzban-sync") as executor:
+            def submit_next():
+                if time.monotonic() > deadline:
+                    return False
+                operation = next(pending, None)
+                if operation is None:
+                    return False
+                in_flight[executor.submit(self._apply_one, operation)] = operation
+                return True
+
+            for _ in range(self.max_workers):
+                if not submit_next():
+                    break
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    action, username, _ = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"status": "error", "message": str(e)}
+
+                    if result.get("status") == "success":
+                        stats["created" if action == "create" else "updated"] += 1
+                        if action == "create" or result.get("recreated"):
+                            stats["created_urls"][username] = build_subscription_url(
+                                result.get("data"), self.marzban.base_url
+                            )
+                    else:
+                        stats["errors"] += 1
+                        stats["failed"].append(username)
+                        logger.warning(f"Failed to {action} user {username}: {result.get('message')}")
+
+                    submit_next()
+
+        deferred = [operation[1] for operation in pending]
+        stats["deferred"] = len(deferred)
+        stats["failed"].extend(deferred)
+        return stats
+
+    @staticmethod
+    def _user_ids(usernames: list) -> list:
+        return [int(username[len("user_"):]) for username in usernames]
+
+    def store_created(self, created_urls: dict):
+        """
+        Ссылки подписки созданных в Marzban пользователей — в users.subscription_url,
+        как при create_marzban_user (одним UPDATE по первичному ключу). Если ссылки
+        в ответе нет, сохранённая сбрасывается — следующее чтение пойдёт в Marzban.
+        """
+        from database.db_config import db
+        from database.models.user_model import User as UserModel
+
+        if not created_urls:
+            return
+        stored = [
+            {'id': user_id, 'subscription_url': url, 'vpn_key_generated': True}
+            for user_id, url in zip(self._user_ids(list(created_urls)), created_urls.values()) if url
+        ]
+        if stored:
+            db.session.execute(db.update(UserModel), stored)
+        missing = [username for username, url in created_urls.items() if not url]
+        UserModel.invalidate_subscription_url(self._user_ids(missing))
+        db.session.commit()
+
+    # =========================================================
+    # Запуск
+    # =========================================================
+
+    def run(self, mode: str = 'auto') -> dict:
+        """mode: 'auto' (delta + периодическая полная сверка), 'delta' или 'full'"""
+        from database.db_config import db
+        from database.models.sync_state_model import SyncState
+
+        state = SyncState.get_or_create(self.STATE_NAME)
+        if mode == 'auto':
+            full_due = (
+                state.last_full_sync_at is None
+                or (datetime.utcnow() - state.last_full_sync_at).total_seconds() > self.full_sync_interval
+            )
+            mode = 'full' if full_due else 'delta'
+
+        run_started = datetime.utcnow()
+        result = self.run_full(run_started) if mode == 'full' else self.run_delta(run_started)
+        result["mode"] = mode
+
+        state = SyncState.get_or_create(self.STATE_NAME)
+        state.last_run_at = run_started
+        if mode == 'full' and result.get("status") == "success" and not result.get("deferred"):
+            state.last_full_sync_at = run_started
+        db.session.commit()
+
+        return result
+
+    # =========================================================
+    # Инкрементальный прогон
+    # =========================================================
+
+    def run_delta(self, run_started: datetime) -> dict:
+        started = time.monotonic()
+        deadline = started + self.time_budget
+        timings = {}
+
+        rows = self.load_pending_rows()
+        timings["load_db"] = round(time.monotonic() - started, 3)
+
+        phase_start = time.monotonic()
+        operations = []
+        for row in rows:
+            # Неактивных пользователей в Marzban не отправляем (как и при полной сверке)
+            if row.deleted_at is not None or not row.subscription_end_date or row.subscription_end_date <= run_started:
+                continue
+            operations.append(("push", f"user_{row.id}", {
+                "data_limit": self._data_limit_bytes(row.data_limit_gb),
+                "expire": int(row.subscription_end_date.timestamp())
+            }))
+        timings["diff"] = round(time.monotonic() - phase_start, 3)
+
+        phase_start = time.monotonic()
+        stats = self.apply(operations, deadline)
+        timings["apply"] = round(time.monotonic() - phase_start, 3)
+
+        # Сдвигаем watermark для всех обработанных строк, кроме неудачных и отложенных
+        pending_ids = [row.id for row in rows]
+        self.mark_synced(run_started, user_ids=pending_ids, exclude_ids=self._user_ids(stats["failed"]))
+        self.store_created(stats["created_urls"])
+        timings["total"] = round(time.monotonic() - started, 3)
+
+        logger.info(
+            f"Delta sync completed: {len(rows)} changed users, {len(operations)} pushed, "
+            f"{stats['errors']} errors, {stats['deferred']} deferred, timings={timings}"
+        )
+
+        return {
+            "status": "success",
+            "synced_count": stats["created"] + stats["updated"],
+            "errors_count": stats["errors"],
+            "total_users": len(rows),
+            "updated": stats["created"] + stats["updated"],
+            "created": stats["created"],
+            "modified": stats["updated"],
+            "deferred": stats["deferred"],
+            "timings": timings
+        }
+
+    # =========================================================
+    # Полный прогон
+    # =========================================================
+
+    def run_full(self, run_started: datetime) -> dict:
+        started = time.monotonic()
+        deadline = started + self.time_budget
+        timings = {}
+
+        def mark(phase, since):
+            timings[phase] = round(time.monotonic() - since, 3)
+            return time.monotonic()
+
+        phase_start = started
+        try:
+            marzban_state = self.fetch_marzban_state(deadline)
+        except Exception as e:
+            mark("fetch_marzban", phase_start)
+            logger.error(f"Marzban sync aborted during fetch: {e}")
+            return {"status": "error", "message": str(e), "timings": timings}
+        phase_start = mark("fetch_marzban", phase_start)
+
+        db_rows = self.load_db_state()
+        phase_start = mark("load_db", phase_start)
+
+        operations, in_sync = self.diff(db_rows, marzban_state)
+        phase_start = mark("diff", phase_start)
+
+        stats = self.apply(operations, deadline)
+        phase_start = mark("apply", phase_start)
+
+        self.mark_synced(run_started, exclude_ids=self._user_ids(stats["failed"]))
+        self.store_created(stats["created_urls"])
+        mark("mark_synced", phase_start)
+        timings["total"] = round(time.monotonic() - started, 3)
+
+        synced_count = in_sync + stats["created"] + stats["updated"]
+        logger.info(
+            f"Sync completed: {len(db_rows)} active users, {len(marzban_state)} in Marzban, "
+            f"{stats['created']} created, {stats['updated']} updated, {stats['errors']} errors, "
+            f"{stats['deferred']} deferred, timings={timings}"
+        )
+
+        return {
+            "status": "success",
+            "synced_count": synced_count,
+            "errors_count": stats["errors"],
+            "total_users": len(db_rows),
+            "updated": stats["created"] + stats["updated"],
+            "created": stats["created"],
+            "modified": stats["updated"],
+            "deferred": stats["deferred"],
+            "timings": timings
+        }
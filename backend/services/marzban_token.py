@@ -0,0 +1,187 @@
+"""Общий admin-токен Marzban для всех воркеров gunicorn и скриптов"""
+
+import os
+import json
+import time
+import base64
+import logging
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: только кэш внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Если в JWT нет exp — прежний срок жизни токена
+DEFAULT_TOKEN_TTL = 2300
+
+
+def token_expires_at(token: str) -> float:
+    """Срок действия из claim exp JWT (без проверки подписи)"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+        if exp:
+            return float(exp)
+    except Exception:
+        pass
+    return time.time() + DEFAULT_TOKEN_TTL
+
+
+class MarzbanTokenProvider:
+    """
+    Токен хранится в файле MARZBAN_TOKEN_CACHE и копии в памяти процесса.
+
+    Обновление — single-flight: логинится только тот, кто взял flock на
+    <cache>.lock, остальные ждут его результата или, пока старый токен ещё
+    действует, продолжают работать с ним. Токен обновляется заранее, за
+    MARZBAN_TOKEN_REFRESH_MARGIN секунд до exp.
+    """
+
+    def __init__(self, key: str, path: str = None, refresh_margin: int = None):
+        self.key = key
+        self.path = path or os.getenv(
+            'MARZBAN_TOKEN_CACHE',
+            os.path.join(tempfile.gettempdir(), 'marzban_token.json')
+        )
+        self.refresh_margin = refresh_margin if refresh_margin is not None else int(
+            os.getenv('MARZBAN_TOKEN_REFRESH_MARGIN', '300')
+        )
+        self._token = None
+        self._expires_at = 0
+        self._thread_lock = threading.Lock()
+        self._lock_file = None
+
+    # =========================================================
+    # Кэш
+    # =========================================================
+
+    def _read_file(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None, 0
+        if data.get('key') != self.key:
+            return None, 0
+        return data.get('token'), float(data.get('expires_at', 0))
+
+    def _write_file(self, token: str, expires_at: float):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'key': self.key, 'token': token, 'expires_at': expires_at}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write Marzban token cache {self.path}: {e}")
+
+    def cached(self, min_ttl: float = None):
+        """Токен, действующий ещё хотя бы min_ttl секунд (по умолчанию — refresh_margin)"""
+        if min_ttl is None:
+            min_ttl = self.refresh_margin
+        deadline = time.time() + min_ttl
+
+        if self._token and self._expires_at > deadline:
+            return self._token
+
+        token, expires_at = self._read_file()
+        if token and expires_at > deadline:
+            self._token, self._expires_at = token, expires_at
+            return token
+        return None
+
+    def store(self, token: str):
+        self._token = token
+        self._expires_at = token_expires_at(token)
+        self._write_file(token, self._expires_at)
+
+    def invalidate(self, token: str):
+        """Сбрасывает токен, только если это именно отклонённый токен (другой процесс мог уже обновить)"""
+        if self._token == token:
+            self._token, self._expires_at = None, 0
+
+        file_token, _ = self._read_file()
+        if file_token == token:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    # =========================================================
+    # Блокировка обновления
+    # =========================================================
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+
+        try:
+            self._lock_file = open(f"{self.path}.lock", 'a')
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(self._lock_file.fileno(), flags)
+            return True
+        except OSError as e:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+            self._thread_lock.release()
+            if blocking:
+                raise
+            logger.debug(f"Marzban token refresh already in progress: {e}")
+            return False
+
+    def release(self):
+        if self._lock_file is not None:
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            finally:
+                self._lock_file.close()
+                self._lock_file = None
+        self._thread_lock.release()
+
+    def get_token(self, login) -> str:
+        """Токен из кэша либо single-flight логин через login() -> access_token"""
+        token = self.cached()
+        if token:
+            return token
+
+        # Старый токен ещё действует — не ждём чужого обновления
+        stale = self.cached(min_ttl=0)
+        if not self.acquire(blocking=stale is None):
+            return stale
+
+        try:
+            token = self.cached()
+            if token:
+                return token
+            try:
+                token = login()
+            except Exception as e:
+                if stale:
+                    logger.warning(f"Marzban token refresh failed, using current token: {e}")
+                    return stale
+                raise
+            self.store(token)
+            return token
+        finally:
+            self.release()
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_token_provider(base_url: str, username: str) -> MarzbanTokenProvider:
+    """Один провайдер на (base_url, admin) в процессе — клиенты делят копию токена в памяти"""
+    key = f"{username}@{base_url}"
+    with _providers_lock:
+        if key not in _providers:
+            _providers[key] = MarzbanTokenProvider(key)
+        return _providers[key]
@@ -0,0 +1,149 @@
+"""Диспетчер очереди notification_outbox: пакетная отправка с повторами"""
+
+import os
+import sys
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', '50'))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '5'))
+# Сколько строка остаётся за диспетчером, прежде чем её сможет забрать другой
+NOTIFICATION_LEASE_SECONDS = 120
+NOTIFICATION_RETRY_BASE_SECONDS = 30
+
+
+class NotificationDispatcher:
+    """
+    Забирает пачку готовых к отправке строк (FOR UPDATE SKIP LOCKED — несколько
+    диспетчеров не пересекаются), продлевает аренду и коммитит: транзакция
+    короткая, Telegram вызывается уже вне её. Результаты пачки пишутся одним коммитом.
+
+    Ошибка отправки — повтор с экспоненциальной задержкой (RetryAfter — через
+    указанное Telegram время), после NOTIFICATION_MAX_ATTEMPTS или если бот
+    заблокирован — status='failed'.
+    """
+
+    def __init__(self, batch_size: int = None, max_attempts: int = None):
+        self.batch_size = batch_size or NOTIFICATION_BATCH_SIZE
+        self.max_attempts = max_attempts or NOTIFICATION_MAX_ATTEMPTS
+        self._service = None
+
+    @property
+    def service(self):
+        if self._service is None:
+            from notifications import notification_service
+            self._service = notification_service
+        return self._service
+
+    def claim_batch(self) -> list:
+        from database.db_config import db
+        from database.models.notification_model import NotificationOutbox
+
+        now = datetime.utcnow()
+        try:
+            notifications = NotificationOutbox.query.filter(
+                NotificationOutbox.status == 'pending',
+                NotificationOutbox.available_at <= now
+            ).order_by(
+                NotificationOutbox.available_at, NotificationOutbox.id
+            ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+            lease_until = now + timedelta(seconds=NOTIFICATION_LEASE_SECONDS)
+            for notification in notifications:
+                notification.attempts += 1
+                notification.available_at = lease_until
+            claimed = [
+                (notification.id, notification.user_id, notification.kind, dict(notification.payload or {}), notification.attempts)
+                for notification in notifications
+            ]
+            db.session.commit()
+            return claimed
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error claiming notifications: {e}")
+            return []
+
+    async def _send(self, user_id: int, kind: str, payload: dict):
+        """None при успехе, иначе (ошибка, задержка до повтора или None — без повтора)"""
+        from telegram.error import RetryAfter, Forbidden, BadRequest
+
+        try:
+            await self.service.deliver(user_id, kind, payload)
+            return None
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            return str(e), retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+        except (Forbidden, BadRequest, KeyError) as e:
+            return str(e) or type(e).__name__, None
+        except Exception as e:
+            return str(e) or type(e).__name__, 0
+
+    def record_results(self, results: list):
+        from database.db_config import db
+        from database.models.notification_model import NotificationOutbox
+
+        now = datetime.utcnow()
+        try:
+            by_id = {
+                notification.id: notification
+                for notification in NotificationOutbox.query.filter(
+                    NotificationOutbox.id.in_([item[0] for item in results])
+                ).all()
+            }
+            for notification_id, attempts, error in results:
+                notification = by_id.get(notification_id)
+                if notification is None:
+                    continue
+                if error is None:
+                    notification.status = 'sent'
+                    notification.sent_at = now
+                    notification.last_error = None
+                    continue
+
+                message, delay = error
+                notification.last_error = message[:1000]
+                if delay is None or attempts >= self.max_attempts:
+                    notification.status = 'failed'
+                    logger.error(f"❌ Уведомление {notification_id} для user_{notification.user_id} не доставлено: {message}")
+                else:
+                    delay = max(delay, NOTIFICATION_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+                    notification.available_at = now + timedelta(seconds=delay)
+            db.session.commit()
+        except Exception as e:
+            # Аренда истечёт, и пачку заберут заново
+            db.session.rollback()
+            logger.error(f"Error recording notification results: {e}")
+
+    async def dispatch_batch(self) -> int:
+        """
+        Одна пачка: claim → параллельная отправка → запись результатов.
+        Запросы к БД короткие и выполняются в потоке цикла — других задач у него нет.
+        """
+        batch = self.claim_batch()
+        if not batch:
+            return 0
+
+        errors = await asyncio.gather(*(
+            self._send(user_id, kind, payload) for _, user_id, kind, payload, _ in batch
+        ))
+        results = [(item[0], item[4], error) for item, error in zip(batch, errors)]
+        self.record_results(results)
+
+        sent = sum(1 for error in errors if error is None)
+        logger.info(f"📤 Уведомления: отправлено {sent}, с ошибкой {len(batch) - sent}")
+        return len(batch)
+
+    async def run_forever(self, poll_interval: float = 1.0):
+        while True:
+            try:
+                processed = await self.dispatch_batch()
+            except Exception as e:
+                logger.error(f"Notification dispatcher error: {e}", exc_info=True)
+                processed = 0
+            if processed < self.batch_size:
+                await asyncio.sleep(poll_interval)
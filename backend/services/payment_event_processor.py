@@ -0,0 +1,155 @@
+"""Асинхронная обработка webhook-событий YooKassa из таблицы payment_events"""
+
+import os
+import sys
+import time
+import logging
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_EVENT_BATCH_SIZE = int(os.getenv('PAYMENT_EVENT_BATCH_SIZE', '20'))
+PAYMENT_EVENT_MAX_ATTEMPTS = int(os.getenv('PAYMENT_EVENT_MAX_ATTEMPTS', '5'))
+# Сколько событие остаётся за обработчиком, прежде чем его сможет забрать другой
+PAYMENT_EVENT_LEASE_SECONDS = 300
+PAYMENT_EVENT_RETRY_BASE_SECONDS = 30
+
+
+class PaymentEventProcessor:
+    """
+    Webhook только записывает (payment_id, event) и сразу отвечает YooKassa,
+    активация выполняется здесь:
+
+    - события забираются пачкой через FOR UPDATE SKIP LOCKED с арендой
+      (available_at сдвигается вперёд) — несколько обработчиков не пересекаются;
+    - payment.succeeded → BusinessLogicService.handle_successful_payment, которая
+      продлевает подписку не больше одного раза на платёж (payments.activated_at);
+    - ошибка — повтор с экспоненциальной задержкой, после PAYMENT_EVENT_MAX_ATTEMPTS
+      событие получает status='failed' и ждёт scripts/replay_payment_events.py.
+    """
+
+    HANDLED_EVENTS = ('payment.succeeded',)
+
+    def __init__(self, batch_size: int = None, max_attempts: int = None):
+        self.batch_size = batch_size or PAYMENT_EVENT_BATCH_SIZE
+        self.max_attempts = max_attempts or PAYMENT_EVENT_MAX_ATTEMPTS
+        self._business_service = None
+
+    @property
+    def business_service(self):
+        if self._business_service is None:
+            from services.business_logic_service import BusinessLogicService
+            self._business_service = BusinessLogicService()
+        return self._business_service
+
+    def claim_batch(self) -> list:
+        from database.db_config import db
+        from database.models.payment_event_model import PaymentEvent
+
+        now = datetime.utcnow()
+        try:
+            events = PaymentEvent.query.filter(
+                PaymentEvent.status == 'pending',
+                PaymentEvent.available_at <= now
+            ).order_by(
+                PaymentEvent.available_at, PaymentEvent.id
+            ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+            lease_until = now + timedelta(seconds=PAYMENT_EVENT_LEASE_SECONDS)
+            for event in events:
+                event.attempts += 1
+                event.available_at = lease_until
+            claimed = [(event.id, event.payment_id, event.event, event.attempts) for event in events]
+            db.session.commit()
+            return claimed
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error claiming payment events: {e}")
+            return []
+
+    def _handle(self, payment_id: str, event: str) -> dict:
+        if event not in self.HANDLED_EVENTS:
+            return {'status': 'ignored'}
+        return self.business_service.handle_successful_payment(payment_id)
+
+    def _finish(self, event_id: int, attempts: int, result: dict):
+        from database.db_config import db
+        from database.models.payment_event_model import PaymentEvent
+
+        event = db.session.get(PaymentEvent, event_id)
+        if event is None:
+            return
+        now = datetime.utcnow()
+        if result.get('status') in ('success', 'ignored'):
+            event.status = 'processed' if result['status'] == 'success' else 'ignored'
+            event.processed_at = now
+            event.last_error = None
+        else:
+            event.last_error = str(result.get('message') or result.get('error') or result)[:1000]
+            if attempts >= self.max_attempts:
+                event.status = 'failed'
+                logger.error(f"❌ Событие {event.event} для платежа {event.payment_id} не обработано: {event.last_error}")
+            else:
+                event.available_at = now + timedelta(seconds=PAYMENT_EVENT_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        db.session.commit()
+
+    def process_batch(self) -> int:
+        from database.db_config import db
+
+        batch = self.claim_batch()
+        for event_id, payment_id, event, attempts in batch:
+            try:
+                result = self._handle(payment_id, event)
+            except Exception as e:
+                db.session.rollback()
+                result = {'status': 'error', 'message': str(e)}
+
+            try:
+                self._finish(event_id, attempts, result)
+            except Exception as e:
+                # Аренда истечёт, и событие заберут заново — активация идемпотентна
+                db.session.rollback()
+                logger.error(f"Error recording payment event {event_id}: {e}")
+
+            logger.info(f"💳 Событие {event} для платежа {payment_id}: {result.get('status')}")
+        return len(batch)
+
+    def run_forever(self, poll_interval: float = 1.0):
+        while True:
+            try:
+                processed = self.process_batch()
+            except Exception as e:
+                logger.error(f"Payment event processor error: {e}", exc_info=True)
+                processed = 0
+            if processed < self.batch_size:
+                time.sleep(poll_interval)
+
+    @staticmethod
+    def replay(event_ids: list = None, payment_id: str = None, status: str = 'failed') -> dict:
+        """Возвращает события в очередь: по id, по платежу или все со статусом status"""
+        from database.db_config import db
+        from database.models.payment_event_model import PaymentEvent
+
+        try:
+            query = PaymentEvent.query
+            if event_ids:
+                query = query.filter(PaymentEvent.id.in_(event_ids))
+            elif payment_id:
+                query = query.filter(PaymentEvent.payment_id == payment_id)
+            else:
+                query = query.filter(PaymentEvent.status == status)
+
+            replayed = query.update({
+                PaymentEvent.status: 'pending',
+                PaymentEvent.attempts: 0,
+                PaymentEvent.available_at: datetime.utcnow(),
+                PaymentEvent.last_error: None
+            }, synchronize_session=False)
+            db.session.commit()
+            return {"status": "success", "replayed": replayed}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error replaying payment events: {e}")
+            return {"status": "error", "message": str(e)}
@@ -0,0 +1,281 @@
+"""Сверка зависших платежей с YooKassa на случай потерянного webhook-а"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger(__name__)
+
+# Платёж моложе этого ещё ждёт свой webhook — не тратим на него запрос к YooKassa
+PAYMENT_RECONCILE_MIN_AGE = int(os.getenv('PAYMENT_RECONCILE_MIN_AGE', '300'))
+# Старше — брошенная оплата, YooKassa давно её отменила
+PAYMENT_RECONCILE_MAX_AGE = int(os.getenv('PAYMENT_RECONCILE_MAX_AGE', str(3 * 86400)))
+PAYMENT_RECONCILE_INTERVAL = int(os.getenv('PAYMENT_RECONCILE_INTERVAL', '300'))
+PAYMENT_RECONCILE_CONCURRENCY = int(os.getenv('PAYMENT_RECONCILE_CONCURRENCY', '4'))
+# Запросов к YooKassa в секунду на все потоки сверки
+PAYMENT_RECONCILE_RATE = float(os.getenv('PAYMENT_RECONCILE_RATE', '5'))
+PAYMENT_RECONCILE_PAGE_SIZE = 100
+
+PENDING_PAYMENT_STATES = ('pending', 'waiting_for_capture')
+
+
+class RateLimiter:
+    """Не больше rate вызовов acquire() в секунду на все потоки (равномерно, без всплесков)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class PaymentReconciler:
+    """
+    Периодически проходит по платежам, застрявшим без активации:
+
+    - pending / waiting_for_capture старше PAYMENT_RECONCILE_MIN_AGE — статус
+      запрашивается в YooKassa в PAYMENT_RECONCILE_CONCURRENCY потоков с общим
+      лимитом PAYMENT_RECONCILE_RATE запросов/сек;
+    - succeeded без activated_at (статус обновил /api/payment/check, а webhook
+      потерялся) — YooKassa уже подтвердила оплату, запрос не нужен.
+
+    Платежи читаются страницами по (created_at, id), изменения применяются на
+    страницу целиком одной транзакцией: изменившиеся платежи через ORM (хуки
+    статистики срабатывают) и одно INSERT событий payment.succeeded в payment_events.
+    Активацию выполняет PaymentEventProcessor — тот же путь, что и для webhook-а,
+    поэтому платёж продлевает подписку один раз, даже если webhook придёт позже.
+    """
+
+    def __init__(self, min_age: int = None, max_age: int = None,
+                 concurrency: int = None, rate: float = None, page_size: int = None):
+        self.min_age = PAYMENT_RECONCILE_MIN_AGE if min_age is None else min_age
+        self.max_age = max_age or PAYMENT_RECONCILE_MAX_AGE
+        self.concurrency = concurrency or PAYMENT_RECONCILE_CONCURRENCY
+        self.rate_limiter = RateLimiter(PAYMENT_RECONCILE_RATE if rate is None else rate)
+        self.page_size = page_size or PAYMENT_RECONCILE_PAGE_SIZE
+
+    def stream_candidates(self, now: datetime = None):
+        """Страницы (id, yookassa_payment_id, status, created_at) по keyset (created_at, id)"""
+        from sqlalchemy import and_, or_
+        from database.db_config import db
+        from database.models.payment_model import Payment
+
+        now = now or datetime.utcnow()
+        base = db.session.query(
+            Payment.id, Payment.yookassa_payment_id, Payment.status, Payment.created_at
+        ).filter(
+            Payment.created_at < now - timedelta(seconds=self.min_age),
+            Payment.created_at >= now - timedelta(seconds=self.max_age),
+            Payment.activated_at.is_(None),
+            or_(
+                Payment.status.in_(PENDING_PAYMENT_STATES),
+                and_(Payment.status == 'succeeded', Payment.paid.is_(True))
+            )
+        )
+
+        last = None
+        while True:
+            query = base
+            if last is not None:
+                query = query.filter(or_(
+                    Payment.created_at > last[0],
+                    and_(Payment.created_at == last[0], Payment.id > last[1])
+                ))
+            rows = query.order_by(Payment.created_at, Payment.id).limit(self.page_size).all()
+            # Транзакция не держится, пока идут запросы к YooKassa
+            db.session.commit()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.page_size:
+                return
+            last = (rows[-1].created_at, rows[-1].id)
+
+    def _fetch_status(self, row):
+        from yookassa import Payment as YooPayment
+
+        self.rate_limiter.acquire()
+        payment = YooPayment.find_one(row.yookassa_payment_id or row.id)
+        return payment.status, bool(payment.paid)
+
+    def check_page(self, rows, pool) -> tuple:
+        """
+        Статусы YooKassa для страницы: {payment_id: (status, paid)} и число ошибок.
+        Тестовые mock_-платежи в YooKassa не существуют и пропускаются
+        """
+        statuses = {}
+        futures = {}
+        for row in rows:
+            if row.status == 'succeeded':
+                statuses[row.id] = ('succeeded', True)
+            elif not row.id.startswith('mock_'):
+                futures[row.id] = pool.submit(self._fetch_status, row)
+
+        errors = 0
+        for payment_id, future in futures.items():
+            try:
+                statuses[payment_id] = future.result()
+            except Exception as e:
+                errors += 1
+                logger.warning(f"Reconcile: YooKassa lookup failed for {payment_id}: {e}")
+        return statuses, errors
+
+    @staticmethod
+    def apply(rows, statuses: dict) -> dict:
+        """
+        Переходы страницы одной транзакцией: изменившиеся платежи одним SELECT ... FOR UPDATE
+        и изменение через ORM (update_status) — хуки статистики (stats_model) учитывают
+        выручку так же, как при webhook-е; затем события payment.succeeded одним INSERT
+        """
+        from database.db_config import db
+        from database.models.payment_model import Payment
+        from database.models.payment_event_model import PaymentEvent
+
+        current = {row.id: row.status for row in rows}
+        changed = {
+            payment_id: (status, paid) for payment_id, (status, paid) in statuses.items()
+            if status != current.get(payment_id)
+        }
+        succeeded = [payment_id for payment_id, (status, _) in statuses.items() if status == 'succeeded']
+
+        result = {'updated': 0, 'succeeded': 0, 'canceled': 0}
+        try:
+            if changed:
+                # Условие по статусу: не перетираем то, что успел записать webhook
+                payments = Payment.query.filter(
+                    Payment.id.in_(list(changed)),
+                    Payment.status.in_(PENDING_PAYMENT_STATES)
+                ).with_for_update().all()
+                for payment in payments:
+                    status, paid = changed[payment.id]
+                    payment.update_status(status)
+                    payment.paid = paid
+                    payment.yookassa_status = status
+                    result['updated'] += 1
+                    if status in ('canceled', 'cancelled'):
+                        result['canceled'] += 1
+
+            result['succeeded'] = PaymentEvent.record_many(
+                succeeded, 'payment.succeeded', payload={'source': 'reconciler'}
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if result['updated']:
+            from services.payment_service import yookassa_status_cache
+            for payment_id in changed:
+                yookassa_status_cache.invalidate(payment_id)
+        return result
+
+    def run_once(self) -> dict:
+        started = time.monotonic()
+        now = datetime.utcnow()
+        stats = {'checked': 0, 'updated': 0, 'succeeded': 0, 'canceled': 0, 'errors': 0,
+                 'max_recovered_lag': 0}
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="reconcile") as pool:
+                for rows in self.stream_candidates(now):
+                    statuses, errors = self.check_page(rows, pool)
+                    stats['checked'] += len(rows)
+                    stats['errors'] += errors
+                    try:
+                        applied = self.apply(rows, statuses)
+                    except Exception as e:
+                        stats['errors'] += len(statuses)
+                        logger.error(f"Reconcile: error applying payment transitions: {e}")
+                        continue
+                    for key in ('updated', 'succeeded', 'canceled'):
+                        stats[key] += applied[key]
+
+                    if applied['succeeded']:
+                        created = [row.created_at for row in rows if statuses.get(row.id, ('',))[0] == 'succeeded']
+                        lag = int((now - min(created)).total_seconds())
+                        stats['max_recovered_lag'] = max(stats['max_recovered_lag'], lag)
+        except Exception as e:
+            logger.error(f"Payment reconciler error: {e}", exc_info=True)
+            stats['status'] = 'error'
+            stats['message'] = str(e)
+
+        stats.setdefault('status', 'success')
+        stats['seconds'] = round(time.monotonic() - started, 2)
+        if stats['succeeded'] or stats['updated'] or stats['errors']:
+            logger.info(f"🔁 Сверка платежей: {stats}")
+        return stats
+
+    def run_forever(self, interval: int = None):
+        interval = interval or PAYMENT_RECONCILE_INTERVAL
+        while True:
+            self.run_once()
+            time.sleep(interval)
+
+    def metrics(self, hours: int = 24) -> dict:
+        """
+        Задержка между созданием платежа и продлением подписки (activated_at)
+        за последние hours часов, и хвост ещё не сверенных платежей.
+        """
+        from sqlalchemy import func
+        from database.db_config import db
+        from database.models.payment_model import Payment
+        from database.models.payment_event_model import PaymentEvent
+
+        now = datetime.utcnow()
+        rows = db.session.query(Payment.created_at, Payment.activated_at).filter(
+            Payment.activated_at >= now - timedelta(hours=hours),
+            Payment.created_at.isnot(None)
+        ).all()
+        lags = sorted(max(0.0, (activated - created).total_seconds()) for created, activated in rows)
+
+        def percentile(p):
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))], 1) if lags else None
+
+        pending_count, oldest = db.session.query(func.count(Payment.id), func.min(Payment.created_at)).filter(
+            Payment.status.in_(PENDING_PAYMENT_STATES),
+            Payment.created_at < now - timedelta(seconds=self.min_age),
+            Payment.created_at >= now - timedelta(seconds=self.max_age)
+        ).one()
+        unactivated = Payment.query.filter(
+            Payment.status == 'succeeded',
+            Payment.paid.is_(True),
+            Payment.activated_at.is_(None),
+            Payment.created_at >= now - timedelta(seconds=self.max_age)
+        ).count()
+        recovered = PaymentEvent.query.filter(
+            PaymentEvent.event == 'payment.succeeded',
+            PaymentEvent.received_at >= now - timedelta(hours=hours),
+            PaymentEvent.payload['source'].as_string() == 'reconciler'
+        ).count()
+        db.session.commit()
+
+        return {
+            'status': 'success',
+            'window_hours': hours,
+            'activated': len(lags),
+            'activation_lag_seconds': {
+                'p50': percentile(0.50),
+                'p95': percentile(0.95),
+                'p99': percentile(0.99),
+                'max': round(lags[-1], 1) if lags else None
+            },
+            'recovered_by_reconciler': recovered,
+            'stale_pending': pending_count,
+            'oldest_stale_pending_age_seconds': int((now - oldest).total_seconds()) if oldest else None,
+            'succeeded_not_activated': unactivated
+        }
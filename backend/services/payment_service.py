@@ -13,12 +13,20 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database.db_config import db
 from models.payment import Payment as PaymentModel
 from models.user import User
+from utils.ttl_cache import TTLCache
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FINAL_PAYMENT_STATES = ('succeeded', 'canceled', 'cancelled', 'refunded')
+
+# Статус платежа в YooKassa для опроса страницами оплаты
+YOOKASSA_STATUS_CACHE_TTL = float(os.getenv('YOOKASSA_STATUS_CACHE_TTL', '5'))
+yookassa_status_cache = TTLCache(ttl=YOOKASSA_STATUS_CACHE_TTL, maxsize=4096)
+
+
 class PaymentService:
     def __init__(self):
         shop_id = os.getenv('YOOKASSA_SHOP_ID')
@@ -170,66 +178,68 @@ class PaymentService:
                 'status': 'failed'
             }
 
+    @staticmethod
+    def _local_payment_info(local_payment):
+        return {
+            'id': local_payment.id,
+            'status': local_payment.status,
+            'amount': float(local_payment.amount),
+            'currency': local_payment.currency,
+            'description': local_payment.description,
+            'created_at': local_payment.created_at.isoformat(),
+            'paid': local_payment.paid,
+            'test': local_payment.test
+        }
+
     def check_payment_status(self, payment_id):
-        """Check payment status via YooKassa"""
+        """
+        Check payment status: final states straight from the DB, the rest via YooKassa.
+
+        Страницы оплаты опрашивают /api/payment/check в цикле — запросы к YooKassa
+        по одному платежу объединяются и кэшируются на YOOKASSA_STATUS_CACHE_TTL сек
+        (в пределах процесса gunicorn).
+        """
         try:
             # First, try to get the payment from our database
             local_payment = PaymentModel.get_by_id(payment_id)
-            
-            # Then, get the latest status from YooKassa
-            yookassa_payment = YooPayment.find_one(payment_id)
-            
-            # Update our local database with the latest status only if the payment hasn't been finalized
-            # We don't want to override a 'succeeded' status with 'pending' due to timing issues
+
+            # Финальный статус больше не меняется — YooKassa не нужна
+            if local_payment and local_payment.status in FINAL_PAYMENT_STATES:
+                return self._local_payment_info(local_payment)
+
+            # Then, get the latest status from YooKassa (one request per payment per TTL)
+            yookassa_payment = yookassa_status_cache.get_or_load(
+                payment_id, lambda: YooPayment.find_one(payment_id)
+            )
+
             if local_payment:
-                # Only update if the local status is not already a final state
-                final_states = ['succeeded', 'canceled', 'refunded']
-                if local_payment.status not in final_states:
+                if local_payment.status != yookassa_payment.status or local_payment.paid != yookassa_payment.paid:
                     local_payment.status = yookassa_payment.status
                     local_payment.paid = yookassa_payment.paid
                     db.session.commit()
                     logger.info(f"Updated local payment status for {payment_id} from YooKassa: {yookassa_payment.status}")
-                else:
-                    logger.info(f"Local payment status for {payment_id} is already final: {local_payment.status}, not updating from YooKassa")
-            else:
-                # If payment doesn't exist locally, create it (might happen if webhook didn't arrive yet)
-                logger.warning(f"Payment {payment_id} not found locally, creating from YooKassa data")
-            
-            logger.info(f"Checked payment status for {payment_id}")
-            
-            # Return detailed payment information
-            # If we have a local payment with a final status, return that info
-            # Otherwise return info from YooKassa
-            if local_payment and local_payment.status in ['succeeded', 'canceled', 'refunded']:
-                # Use local payment data for final statuses
-                payment_info = {
-                    'id': local_payment.id,
-                    'status': local_payment.status,
-                    'amount': float(local_payment.amount),
-                    'currency': local_payment.currency,
-                    'description': local_payment.description,
-                    'created_at': local_payment.created_at.isoformat(),
-                    'paid': local_payment.paid,
-                    'test': local_payment.test
-                }
-                logger.info(f"Returning local payment data for {payment_id} with final status: {local_payment.status}")
+
+                if local_payment.status in FINAL_PAYMENT_STATES:
+                    yookassa_status_cache.invalidate(payment_id)
+                    logger.info(f"Returning local payment data for {payment_id} with final status: {local_payment.status}")
+                    return self._local_payment_info(local_payment)
             else:
-                # Use YooKassa data for non-final statuses
-                payment_info = {
-                    'id': yookassa_payment.id,
-                    'status': yookassa_payment.status,
-                    'amount': float(yookassa_payment.amount.value),
-                    'currency': yookassa_payment.amount.currency,
-                    'description': yookassa_payment.description,
-                    'created_at': yookassa_payment.created_at,
-                    'paid': yookassa_payment.paid,
-                    'test': getattr(yookassa_payment, 'test', False),
-                    'payment_method': yookassa_payment.payment_method.type if yookassa_payment.payment_method else None,
-                    'receipt_registration': getattr(yookassa_payment, 'receipt_registration', None)
-                }
-                logger.info(f"Returning YooKassa payment data for {payment_id}: {yookassa_payment.status}")
-            
-            return payment_info
+                # Webhook ещё не пришёл или платёж создан не нами
+                logger.warning(f"Payment {payment_id} not found locally, returning YooKassa data")
+
+            # Use YooKassa data for non-final statuses
+            return {
+                'id': yookassa_payment.id,
+                'status': yookassa_payment.status,
+                'amount': float(yookassa_payment.amount.value),
+                'currency': yookassa_payment.amount.currency,
+                'description': yookassa_payment.description,
+                'created_at': yookassa_payment.created_at,
+                'paid': yookassa_payment.paid,
+                'test': getattr(yookassa_payment, 'test', False),
+                'payment_method': yookassa_payment.payment_method.type if yookassa_payment.payment_method else None,
+                'receipt_registration': getattr(yookassa_payment, 'receipt_registration', None)
+            }
         except Exception as e:
             logger.error(f"Error checking payment status for {payment_id}: {str(e)}")
             return {'error': str(e), 'status': 'error'}
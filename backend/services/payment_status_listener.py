@@ -0,0 +1,186 @@
+"""Ожидание смены статуса платежа через PostgreSQL LISTEN/NOTIFY"""
+
+import os
+import time
+import select
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который триггер payments_status_notify шлёт id платежа (миграция 010)
+PAYMENT_STATUS_CHANNEL = 'payment_status'
+PAYMENT_WAIT_MAX_TIMEOUT = 25
+# Клиент сверх лимита ожиданий повторяет запрос не раньше, чем прежний опрос /check
+PAYMENT_WAIT_RETRY_AFTER = 10
+
+
+def _default_max_waiters() -> int:
+    """
+    Ожидающий запрос занимает поток (гринлет) gunicorn, но не соединение с БД:
+    gthread — все потоки воркера, кроме двух для обычных запросов; gevent — половина
+    worker_connections; sync-воркер ждать не может, клиенты получают retry_after.
+    Параметры — те же переменные, что читает gunicorn.conf.py
+    """
+    worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+    if worker_class == 'gthread':
+        return max(1, int(os.getenv('GUNICORN_THREADS', '8')) - 2)
+    if worker_class == 'gevent':
+        return int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100')) // 2
+    return 0
+
+
+# Ожидающий запрос занимает поток gunicorn — сверх лимита отвечаем сразу с retry_after
+PAYMENT_WAIT_MAX_WAITERS = int(os.getenv('PAYMENT_WAIT_MAX_WAITERS') or _default_max_waiters())
+# Интервал перепроверки статуса из БД: с LISTEN — страховка от пропущенного
+# уведомления, без него (нет LISTEN_DATABASE_URL, обрыв) — основной механизм
+LISTEN_RECHECK_SECONDS = 10
+FALLBACK_RECHECK_SECONDS = 3
+
+
+class PaymentStatusListener:
+    """
+    Один поток на процесс gunicorn держит отдельное соединение с LISTEN
+    payment_status и будит запросы /api/payment/wait, ждущие этот платёж.
+
+    LISTEN требует сессионного соединения, поэтому LISTEN_DATABASE_URL должен
+    указывать на PostgreSQL напрямую, а не на pgbouncer в режиме transaction
+    (NOTIFY из триггера через pgbouncer доставляется нормально).
+
+    Поток стартует лениво в воркере — после fork, а не в мастер-процессе.
+    """
+
+    def __init__(self, dsn: str = None, max_waiters: int = None):
+        self.dsn = dsn if dsn is not None else os.getenv('LISTEN_DATABASE_URL', '')
+        self.max_waiters = PAYMENT_WAIT_MAX_WAITERS if max_waiters is None else max_waiters
+        self.connected = False
+        self.stats = {'notifications': 0, 'waits': 0, 'rejected': 0, 'reconnects': 0}
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        if not self.dsn:
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._waiters = {}
+            self.connected = False
+            self._thread = threading.Thread(target=self._run, name="payment-status-listener", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn, connect_timeout=10)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {PAYMENT_STATUS_CHANNEL}")
+                self.connected = True
+                backoff = 1
+                logger.info(f"👂 LISTEN {PAYMENT_STATUS_CHANNEL} (pid {os.getpid()})")
+                # Пока слушателя не было, уведомления могли потеряться — пусть все перепроверят
+                self._wake_all()
+
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.stats['notifications'] += 1
+                        self._wake(notify.payload)
+            except Exception as e:
+                self.connected = False
+                self.stats['reconnects'] += 1
+                logger.error(f"Payment status listener error: {e}, reconnecting in {backoff}s")
+                self._wake_all()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _wake(self, payment_id: str):
+        with self._lock:
+            events = list(self._waiters.get(payment_id, ()))
+        for event in events:
+            event.set()
+
+    def _wake_all(self):
+        with self._lock:
+            events = [event for events in self._waiters.values() for event in events]
+        for event in events:
+            event.set()
+
+    @staticmethod
+    def _current_status(payment_id: str):
+        from database.db_config import db
+        from database.models.payment_model import Payment as PaymentModel
+
+        status = db.session.execute(
+            db.select(PaymentModel.status).where(PaymentModel.id == payment_id)
+        ).scalar_one_or_none()
+        # Соединение возвращается в пул — ожидание не держит соединение с БД
+        db.session.close()
+        return status
+
+    def wait_for_status(self, payment_id: str, known_status: str = None, timeout: float = PAYMENT_WAIT_MAX_TIMEOUT) -> dict:
+        """
+        Ждёт, пока статус платежа станет отличным от known_status (по умолчанию —
+        текущего) или финальным, не дольше timeout секунд.
+        :return: {'status', 'changed', 'waited'}; status=None — платёж не найден
+        """
+        from services.payment_service import FINAL_PAYMENT_STATES
+
+        status = self._current_status(payment_id)
+        if known_status is None:
+            known_status = status
+        if status is None or status != known_status or status in FINAL_PAYMENT_STATES:
+            return {'status': status, 'changed': status != known_status, 'waited': False}
+
+        self._ensure_started()
+        event = threading.Event()
+        with self._lock:
+            waiting = sum(len(events) for events in self._waiters.values())
+            if waiting >= self.max_waiters:
+                self.stats['rejected'] += 1
+                return {'status': status, 'changed': False, 'waited': False}
+            self._waiters.setdefault(payment_id, set()).add(event)
+            self.stats['waits'] += 1
+
+        try:
+            deadline = time.monotonic() + min(timeout, PAYMENT_WAIT_MAX_TIMEOUT)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                interval = LISTEN_RECHECK_SECONDS if self.connected else FALLBACK_RECHECK_SECONDS
+                event.wait(min(remaining, interval))
+                event.clear()
+                status = self._current_status(payment_id)
+                if status != known_status or status in FINAL_PAYMENT_STATES:
+                    break
+        finally:
+            with self._lock:
+                events = self._waiters.get(payment_id)
+                if events is not None:
+                    events.discard(event)
+                    if not events:
+                        del self._waiters[payment_id]
+
+        return {'status': status, 'changed': status != known_status, 'waited': True}
+
+
+payment_status_listener = PaymentStatusListener()
@@ -0,0 +1,75 @@
+"""Напоминания об истечении подписки: выборка окна и отметка отправленных"""
+
+import os
+import sys
+import logging
+from datetime import datetime, timedelta, date
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger(__name__)
+
+# Уведомления за 3, 2, 1 день и в день истечения
+REMINDER_DAYS = 3
+NOTIFICATION_TYPES = {3: '3_days', 2: '2_days', 1: '1_day', 0: '0_days'}
+
+
+class ReminderService:
+    """
+    Ежедневный джоб бота берёт отсюда только пользователей, у которых подписка
+    заканчивается в окне [начало сегодняшнего дня, now + REMINDER_DAYS + 1 день)
+    и которым сегодня ещё не напоминали, — один запрос по idx_users_subscription_end_date.
+    После рассылки отправленные отмечаются одним UPDATE.
+    """
+
+    def get_due_reminders(self, now: datetime = None) -> dict:
+        from database.db_config import db
+        from database.models.user_model import User as UserModel
+
+        now = now or datetime.utcnow()
+        today = now.date()
+        window_start = datetime.combine(today, datetime.min.time())
+        window_end = now + timedelta(days=REMINDER_DAYS + 1)
+
+        rows = db.session.query(UserModel.id, UserModel.subscription_end_date).filter(
+            UserModel.subscription_end_date >= window_start,
+            UserModel.subscription_end_date < window_end,
+            UserModel.deleted_at.is_(None),
+            db.or_(
+                UserModel.last_expiration_reminder_sent.is_(None),
+                UserModel.last_expiration_reminder_sent < today
+            )
+        ).order_by(UserModel.subscription_end_date).all()
+
+        users = []
+        for user_id, end_date in rows:
+            # Как и раньше: сколько полных дней осталось, не меньше 0
+            days_left = max(0, (end_date - now).days)
+            users.append({
+                'user_id': user_id,
+                'days_left': days_left,
+                'notification_type': NOTIFICATION_TYPES[days_left]
+            })
+
+        logger.info(f"🔔 Истекающих подписок к напоминанию: {len(users)}")
+        return {"status": "success", "date": today.isoformat(), "users": users}
+
+    def mark_reminded(self, user_ids: list, day: date = None) -> dict:
+        from database.db_config import db
+        from database.models.user_model import User as UserModel
+
+        if not user_ids:
+            return {"status": "success", "updated": 0}
+
+        day = day or datetime.utcnow().date()
+        try:
+            updated = UserModel.query.filter(UserModel.id.in_(user_ids)).update(
+                {UserModel.last_expiration_reminder_sent: day},
+                synchronize_session=False
+            )
+            db.session.commit()
+            return {"status": "success", "updated": updated}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error marking expiration reminders: {e}")
+            return {"status": "error", "message": str(e)}
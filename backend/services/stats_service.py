@@ -0,0 +1,121 @@
+"""Stats rollup: счётчики и почасовая выручка для /api/stats"""
+
+import os
+import sys
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger(__name__)
+
+
+class StatsService:
+    """
+    Счётчики в stats_counters и почасовая выручка в revenue_hourly поддерживаются
+    инкрементально хуком flush-а (database/models/stats_model.py), поэтому
+    get_stats читает несколько строк вместо полных агрегатов по users/payments.
+
+    recompute() — точный пересчёт: ежедневный scripts/refresh_stats.py и засев
+    счётчиков при первом запуске. По запросу клиента /api/stats его не делает —
+    полные агрегаты по users/payments дорогие, а эндпоинт открыт без авторизации.
+    """
+
+    COUNTERS = ('users_total', 'users_active', 'payments_total', 'revenue_total')
+
+    def __init__(self, hourly_window: int = 24, daily_window: int = 30):
+        self.hourly_window = hourly_window
+        self.daily_window = daily_window
+
+    def recompute(self) -> dict:
+        from sqlalchemy import func
+        from database.db_config import db
+        from database.models.user_model import User as UserModel
+        from database.models.payment_model import Payment as PaymentModel
+        from database.models.stats_model import StatsCounter, RevenueBucket, hour_bucket
+
+        try:
+            # Блокируем строки счётчиков: параллельные flush-и дождутся пересчёта
+            # и применят свои дельты уже поверх точных значений
+            StatsCounter.query.with_for_update().all()
+
+            values = {
+                'users_total': db.session.query(func.count(UserModel.id)).scalar(),
+                'users_active': db.session.query(func.count(UserModel.id)).filter(
+                    UserModel.deleted_at.is_(None)
+                ).scalar(),
+                'payments_total': db.session.query(func.count(PaymentModel.id)).scalar(),
+                'revenue_total': db.session.query(func.sum(PaymentModel.amount)).filter(
+                    PaymentModel.paid.is_(True)
+                ).scalar() or 0,
+            }
+
+            now = datetime.utcnow()
+            for name, value in values.items():
+                db.session.merge(StatsCounter(name=name, value=value, updated_at=now))
+
+            buckets = defaultdict(lambda: [Decimal(0), 0])
+            paid_payments = db.session.query(
+                PaymentModel.amount, PaymentModel.updated_at, PaymentModel.created_at
+            ).filter(PaymentModel.paid.is_(True)).yield_per(1000)
+            for amount, updated_at, created_at in paid_payments:
+                bucket = buckets[hour_bucket(updated_at or created_at)]
+                bucket[0] += amount or 0
+                bucket[1] += 1
+
+            RevenueBucket.query.delete(synchronize_session=False)
+            db.session.bulk_insert_mappings(RevenueBucket, [
+                {'bucket_start': start, 'revenue': revenue, 'payments_count': count}
+                for start, (revenue, count) in buckets.items()
+            ])
+            db.session.commit()
+
+            logger.info(f"📊 Stats recomputed: {values}, {len(buckets)} hourly buckets")
+            return {"status": "success", "counters": values, "buckets": len(buckets)}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error recomputing stats: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def get_stats(self) -> dict:
+        from database.models.stats_model import StatsCounter, RevenueBucket
+
+        counters = {row.name: row for row in StatsCounter.query.all()}
+        if any(name not in counters for name in self.COUNTERS):
+            result = self.recompute()
+            if result["status"] != "success":
+                raise RuntimeError(result["message"])
+            counters = {row.name: row for row in StatsCounter.query.all()}
+            source = 'fresh'
+        else:
+            source = 'rollup'
+
+        now = datetime.utcnow()
+        daily_since = (now - timedelta(days=self.daily_window - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        hourly_since = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=self.hourly_window - 1)
+
+        buckets = RevenueBucket.query.filter(
+            RevenueBucket.bucket_start >= daily_since
+        ).order_by(RevenueBucket.bucket_start).all()
+
+        daily = defaultdict(lambda: [Decimal(0), 0])
+        for bucket in buckets:
+            day = daily[bucket.bucket_start.date()]
+            day[0] += bucket.revenue
+            day[1] += bucket.payments_count
+
+        return {
+            'total_users': int(counters['users_total'].value),
+            'active_users': int(counters['users_active'].value),
+            'total_payments': int(counters['payments_total'].value),
+            'total_revenue': float(counters['revenue_total'].value),
+            'revenue_hourly': [bucket.to_dict() for bucket in buckets if bucket.bucket_start >= hourly_since],
+            'revenue_daily': [
+                {'date': day.isoformat(), 'revenue': float(revenue), 'payments_count': count}
+                for day, (revenue, count) in sorted(daily.items())
+            ],
+            'source': source,
+            'updated_at': max(row.updated_at for row in counters.values()).isoformat()
+        }
@@ -8,14 +8,14 @@ import logging
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models.user import User
-from services.marzban_client import MarzbanClient
+from services.marzban_client import create_marzban_client, build_subscription_url
 
 logger = logging.getLogger(__name__)
 
 
 class VPNService:
     def __init__(self):
-        self.marzban = MarzbanClient()
+        self.marzban = create_marzban_client()
 
     def connect(self, user_id):
         try:
@@ -94,20 +94,27 @@ class VPNService:
 
     def create_marzban_user(self, user_id: int, tariff: str = "standard"):
         """Создание пользователя в Marzban (V2Ray/Trojan) - БЕСПЛАТНО И БЕСКОНЕЧНО"""
+        return self.ensure_user_provisioned(user_id)
+
+    def ensure_user_provisioned(self, user_id: int, user=None):
+        """
+        Гарантирует, что пользователь есть в Marzban, и возвращает ссылку подписки.
+
+        Не больше одной загрузки строки из БД (или ни одной, если передан user)
+        и одного чтения из Marzban: ссылка берётся из того же payload, что и expire.
+        """
         try:
-            from database.models.user_model import User as UserModel
+            from database.db_config import db
 
-            # Check if user exists in PostgreSQL
-            user = UserModel.query.filter_by(id=user_id).first()
+            if user is None:
+                user = User.get_by_id(user_id)
             if not user:
                 logger.info(f"User {user_id} not found in DB, creating...")
                 # Создаём пользователя в БД если нет
-                user_data = {
+                user = User.create({
                     'id': user_id,
                     'username': f'user_{user_id}'
-                }
-                from models.user import User
-                user = User.create(user_data)
+                })
 
             # 🔴 ПРОВЕРКА: Активна ли подписка
             if not user.subscription_end_date or user.subscription_end_date < datetime.utcnow():
@@ -118,51 +125,30 @@ class VPNService:
                     "code": "no_subscription"
                 }
 
-            # Получаем лимит трафика из БД пользователя
             username = f"user_{user_id}"
-            
-            # Проверяем существующего пользователя в БД
-            from database.db_config import db
-            from database.models.user_model import User as UserModel
-            
-            db_user = UserModel.query.filter_by(id=user_id).first()
-            data_limit_bytes = 0  # 0 = безлимитный трафик
-            
-            if db_user and db_user.data_limit_gb and db_user.data_limit_gb > 0:
-                data_limit_bytes = int(db_user.data_limit_gb * 1024**3)
-                logger.info(f"Using data limit from DB: {db_user.data_limit_gb}GB")
-            else:
-                # Безлимитный трафик по умолчанию
-                data_limit_bytes = 0
-                logger.info(f"Using unlimited traffic (data_limit = 0)")
 
+            # Лимит трафика из БД, 0 = безлимитный трафик
+            data_limit_bytes = 0
+            if user.data_limit_gb and user.data_limit_gb > 0:
+                data_limit_bytes = int(user.data_limit_gb * 1024**3)
             logger.info(f"Data limit for user {user_id}: {'Безлимитный' if data_limit_bytes == 0 else f'{data_limit_bytes} bytes'}")
 
-
-            # 🔴 Добавляем inbounds для пользователя
-            inbounds = {
-                "vless": ["VLESS Reality"],
-                "trojan": ["Trojan TLS"]
-            }
-
             # Проверка, существует ли уже пользователь
             existing_user = self.marzban.get_user(username)
             if existing_user.get("status") == "success":
-                # Пользователь уже существует, получаем данные
                 user_data = existing_user.get("data", {})
                 expire_timestamp = user_data.get("expire")
-                subscription_url = self.marzban.get_subscription_url(username)
+                subscription_url = build_subscription_url(user_data, self.marzban.base_url)
 
                 if subscription_url:
                     # 🆕 СИНХРОНИЗАЦИЯ С POSTGRESQL для существующего пользователя
-                    from database.db_config import db
-                    from database.models.user_model import User as UserModel
-
-                    user = UserModel.query.filter_by(id=user_id).first()
-                    if user and expire_timestamp and expire_timestamp > 0:
+                    if expire_timestamp and expire_timestamp > 0:
                         user.subscription_end_date = datetime.fromtimestamp(expire_timestamp)
-                        db.session.commit()
-                        logger.info(f"✅ Синхронизировано subscription_end_date для existing user_{user_id}: {user.subscription_end_date}")
+                        # Дата пришла из Marzban — повторно отправлять её не нужно
+                        user.marzban_synced_at = datetime.utcnow()
+                    self._store_subscription_url(user, subscription_url)
+                    db.session.commit()
+                    logger.info(f"✅ Синхронизировано subscription_end_date для existing user_{user_id}: {user.subscription_end_date}")
 
                     return {
                         "status": "success",
@@ -172,67 +158,52 @@ class VPNService:
                         "message": "Existing user, retrieved subscription",
                         "expire_timestamp": expire_timestamp
                     }
-                else:
-                    # Пользователь есть, но ссылки нет - продлеваем
-                    result = self.marzban.extend_user(username, 3650)
-                    subscription_url = self.marzban.get_subscription_url(username)
-
-                    # 🆕 СИНХРОНИЗАЦИЯ С POSTGRESQL после продления
-                    from database.db_config import db
-                    from database.models.user_model import User as UserModel
-
-                    user = UserModel.query.filter_by(id=user_id).first()
-                    if user:
-                        new_expire = int(datetime.utcnow().timestamp()) + (3650 * 86400)
-                        user.subscription_end_date = datetime.fromtimestamp(new_expire)
-                        db.session.commit()
-                        logger.info(f"✅ Синхронизировано subscription_end_date для extended user_{user_id}: {user.subscription_end_date}")
 
-                    return {
-                        "status": "success",
-                        "protocol": "v2ray",
-                        "subscription_url": subscription_url,
-                        "username": username,
-                        "message": "Extended existing user"
-                    }
+                # Пользователь есть, но ссылки нет - продлеваем
+                result = self.marzban.extend_user(username, 3650)
+                subscription_url = build_subscription_url(result.get("data"), self.marzban.base_url)
 
-            # Вычисляем expire timestamp из БД
-            from database.db_config import db
-            from database.models.user_model import User as UserModel
-            
-            db_user = UserModel.query.filter_by(id=user_id).first()
-            if db_user and db_user.subscription_end_date:
-                expire_timestamp = int(db_user.subscription_end_date.timestamp())
-            else:
-                # Default: 1 год от сейчас
-                import time
-                expire_timestamp = int(time.time()) + (365 * 86400)
+                # 🆕 СИНХРОНИЗАЦИЯ С POSTGRESQL после продления
+                new_expire = int(datetime.utcnow().timestamp()) + (3650 * 86400)
+                user.subscription_end_date = datetime.fromtimestamp(new_expire)
+                user.marzban_synced_at = datetime.utcnow()
+                self._store_subscription_url(user, subscription_url)
+                db.session.commit()
+                logger.info(f"✅ Синхронизировано subscription_end_date для extended user_{user_id}: {user.subscription_end_date}")
 
-            logger.info(f"Expire timestamp: {expire_timestamp}")
+                return {
+                    "status": "success",
+                    "protocol": "v2ray",
+                    "subscription_url": subscription_url,
+                    "username": username,
+                    "message": "Extended existing user"
+                }
 
-            # Конвертируем timestamp в дни
-            import time
-            expire_days = max(1, (expire_timestamp - int(time.time())) // 86400)
-            logger.info(f"Expire days: {expire_days}")
+            # Expire берём из БД как есть — дата в Marzban совпадёт с subscription_end_date
+            expire_timestamp = int(user.subscription_end_date.timestamp())
+            logger.info(f"Expire timestamp: {expire_timestamp}")
 
             # Создание пользователя с лимитом трафика
             result = self.marzban.create_user(
                 username=username,
                 data_limit=data_limit_bytes,
-                expire_days=expire_days,
+                expire_days=None,
                 protocols={"vless": {}, "trojan": {}},
-                inbounds=inbounds
+                inbounds={
+                    "vless": ["VLESS Reality"],
+                    "trojan": ["Trojan TLS"]
+                },
+                expire=expire_timestamp
             )
 
             if result.get("status") == "success":
-                subscription_url = self.marzban.get_subscription_url(username)
+                # Marzban возвращает созданного пользователя вместе с subscription_url
+                subscription_url = build_subscription_url(result.get("data"), self.marzban.base_url)
 
-                # 🆕 СИНХРОНИЗАЦИЯ С POSTGRESQL
-                user = UserModel.query.filter_by(id=user_id).first()
-                if user:
-                    user.subscription_end_date = datetime.fromtimestamp(expire_timestamp)
-                    db.session.commit()
-                    logger.info(f"✅ Синхронизировано subscription_end_date для user_{user_id}: {user.subscription_end_date}")
+                user.marzban_synced_at = datetime.utcnow()
+                self._store_subscription_url(user, subscription_url)
+                db.session.commit()
+                logger.info(f"✅ Создан user_{user_id} в Marzban, подписка до {user.subscription_end_date}")
 
                 return {
                     "status": "success",
@@ -249,13 +220,38 @@ class VPNService:
             logger.error(f"Error creating Marzban user: {e}")
             return {"status": "error", "message": str(e)}
 
+    @staticmethod
+    def _store_subscription_url(user, subscription_url: str):
+        """Сохраняет ссылку в users.subscription_url (коммит — на вызывающей стороне)"""
+        if subscription_url:
+            user.subscription_url = subscription_url
+            user.vpn_key_generated = True
+
     def get_marzban_subscription(self, user_id: int):
-        """Получение подписки пользователя из Marzban"""
+        """
+        Получение подписки пользователя (read-through через users.subscription_url)
+
+        Ссылка в Marzban меняется только при удалении, продлении и перевыпуске ключа —
+        эти операции сбрасывают сохранённое значение, остальные чтения идут из БД.
+        """
         try:
+            from database.db_config import db
+
             username = f"user_{user_id}"
+            user = User.get_by_id(user_id)
+            if user and user.subscription_url and user.vpn_key_generated:
+                return {
+                    "status": "success",
+                    "subscription_url": user.subscription_url,
+                    "username": username
+                }
+
             subscription_url = self.marzban.get_subscription_url(username)
 
             if subscription_url:
+                if user:
+                    self._store_subscription_url(user, subscription_url)
+                    db.session.commit()
                 return {
                     "status": "success",
                     "subscription_url": subscription_url,
@@ -267,11 +263,28 @@ class VPNService:
             logger.error(f"Error getting Marzban subscription: {e}")
             return {"status": "error", "message": str(e)}
 
+    def _refresh_subscription_url(self, user_id: int, user_data: dict = None):
+        """Инвалидация сохранённой ссылки; если Marzban вернул пользователя — сразу записываем новую"""
+        from database.db_config import db
+        from database.models.user_model import User as UserModel
+
+        subscription_url = build_subscription_url(user_data, self.marzban.base_url)
+        if subscription_url:
+            UserModel.query.filter_by(id=user_id).update(
+                {UserModel.subscription_url: subscription_url, UserModel.vpn_key_generated: True},
+                synchronize_session='fetch'
+            )
+        else:
+            UserModel.invalidate_subscription_url([user_id])
+        db.session.commit()
+
     def remove_marzban_user(self, user_id: int):
         """Удаление пользователя из Marzban"""
         try:
             username = f"user_{user_id}"
             result = self.marzban.remove_user(username)
+            if result.get("status") == "success":
+                self._refresh_subscription_url(user_id)
             return result
         except Exception as e:
             logger.error(f"Error removing Marzban user: {e}")
@@ -281,12 +294,32 @@ class VPNService:
         """Продление подписки пользователя в Marzban"""
         try:
             username = f"user_{user_id}"
-            result = self.marzban.modify_user(username, expire_days=days)
+            result = self.marzban.extend_user(username, days)
+            if result.get("status") == "success":
+                self._refresh_subscription_url(user_id, result.get("data"))
             return result
         except Exception as e:
             logger.error(f"Error extending Marzban user: {e}")
             return {"status": "error", "message": str(e)}
 
+    def reissue_marzban_key(self, user_id: int):
+        """Перевыпуск ссылки подписки: старая ссылка перестаёт работать"""
+        try:
+            username = f"user_{user_id}"
+            result = self.marzban.revoke_subscription(username)
+            if result.get("status") != "success":
+                return result
+
+            self._refresh_subscription_url(user_id, result.get("data"))
+            return {
+                "status": "success",
+                "subscription_url": build_subscription_url(result.get("data"), self.marzban.base_url),
+                "username": username
+            }
+        except Exception as e:
+            logger.error(f"Error reissuing Marzban key: {e}")
+            return {"status": "error", "message": str(e)}
+
     def create_marzban_user_with_payload(self, user_id: int, payload: dict):
         """
         Создание пользователя в Marzban с готовым payload
@@ -345,81 +378,17 @@ class VPNService:
             logger.error(f"Error creating Marzban user with payload: {e}")
             return {"status": "error", "message": str(e)}
 
-    def sync_all_users_with_marzban(self):
+    def sync_all_users_with_marzban(self, mode: str = 'auto'):
         """
         Синхронизация всех пользователей с активной подпиской в Marzban
+
+        Выполняется пакетно через MarzbanReconciler: по умолчанию отправляются только
+        пользователи с изменённым биллингом, полная сверка — раз в MARZBAN_FULL_SYNC_INTERVAL.
         """
         try:
-            from database.models.user_model import User as UserModel
-            from sqlalchemy import and_
-            import time
-
-            # Получаем всех пользователей с активной подпиской
-            active_users = UserModel.query.filter(
-                and_(
-                    UserModel.subscription_end_date > datetime.utcnow(),
-                    UserModel.deleted_at.is_(None)
-                )
-            ).all()
-
-            logger.info(f"Found {len(active_users)} users with active subscriptions")
-
-            synced_count = 0
-            errors_count = 0
-
-            for user in active_users:
-                try:
-                    user_id = user.id
-                    username = f"user_{user_id}"
-
-                    # Проверяем, существует ли в Marzban
-                    marzban_user = self.marzban.get_user(username)
-
-                    if marzban_user.get("status") == "success":
-                        # Пользователь существует, проверяем срок действия
-                        user_data = marzban_user.get("data", {})
-                        expire_timestamp = user_data.get("expire")
-
-                        if expire_timestamp and expire_timestamp > 0:
-                            marzban_expire_date = datetime.fromtimestamp(expire_timestamp)
-                            db_expire_date = user.subscription_end_date
-
-                            # Если в БД дата больше, чем в Marzban - обновляем
-                            if db_expire_date > marzban_expire_date:
-                                logger.info(f"Extending user {username} in Marzban from {marzban_expire_date} to {db_expire_date}")
-                                new_expire = int(db_expire_date.timestamp())
-                                result = self.marzban.modify_user(username, {"expire": new_expire})
-                                if result.get("status") == "success":
-                                    synced_count += 1
-                                else:
-                                    errors_count += 1
-                                    logger.warning(f"Failed to extend user {username}: {result.get('message')}")
-                            else:
-                                synced_count += 1
-                        else:
-                            synced_count += 1
-                    else:
-                        # Пользователя нет в Marzban - создаём
-                        logger.info(f"Creating user {username} in Marzban")
-                        result = self.create_marzban_user(user_id, "standard")
-                        if result.get("status") == "success":
-                            synced_count += 1
-                        else:
-                            errors_count += 1
-                            logger.warning(f"Failed to create user {username}: {result.get('message')}")
-
-                except Exception as e:
-                    errors_count += 1
-                    logger.error(f"Error syncing user {user.id}: {e}")
-
-            logger.info(f"Sync completed: {synced_count} synced, {errors_count} errors")
+            from services.marzban_sync import MarzbanReconciler
 
-            return {
-                "status": "success",
-                "synced_count": synced_count,
-                "errors_count": errors_count,
-                "total_users": len(active_users)
-            }
+            return MarzbanReconciler(marzban=self.marzban).run(mode)
 
         except Exception as e:
             logger.error(f"Error in sync_all_users_with_marzban: {e}")
@@ -0,0 +1,51 @@
+"""Общие фикстуры: приложение на sqlite-файле с теми же blueprint-ами, что и server.py"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import BigInteger
+from sqlalchemy.ext.compiler import compiles
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@compiles(BigInteger, 'sqlite')
+def _sqlite_bigint(type_, compiler, **kw):
+    # В sqlite автоинкремент есть только у INTEGER PRIMARY KEY (connection_logs.id — BIGINT)
+    return 'INTEGER'
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    from flask import Flask
+    from database.db_config import db
+    from utils.limiter import limiter
+    import utils.request_context as request_context
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        # Файл, а не :memory: — фоновые потоки видят ту же базу
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        RATELIMIT_ENABLED=False
+    )
+    db.init_app(app)
+    limiter.init_app(app)
+
+    monkeypatch.setattr(request_context, 'QUERY_COUNT_HEADER', True)
+    request_context.init_request_context(app)
+
+    from routes import routes_bp
+    app.register_blueprint(routes_bp)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
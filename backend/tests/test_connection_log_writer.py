@@ -0,0 +1,110 @@
+"""Фоновая запись connection_logs (services/connection_log_writer.py)"""
+
+import time
+import threading
+
+import pytest
+
+from database.db_config import db
+from database.models.connection_log_model import ConnectionLog
+from database.models.user_model import User as UserModel
+from services.connection_log_writer import ConnectionLogWriter
+
+
+@pytest.fixture
+def writer(app):
+    db.session.add(UserModel(id=1, username='user_1'))
+    db.session.commit()
+    return ConnectionLogWriter(batch_size=100, flush_interval=1, max_queue=1000, durability='async')
+
+
+def logged() -> int:
+    count = ConnectionLog.query.count()
+    db.session.commit()
+    return count
+
+
+def test_flush_does_not_wait_for_flush_interval(writer):
+    writer.enqueue(1, '10.0.0.1')
+    # Фоновый поток уже ждёт следующего цикла — flush() не должен ждать его
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    writer.flush()
+
+    assert time.monotonic() - started < 0.5
+    assert logged() == 1
+
+
+def test_flush_is_not_blocked_by_concurrent_enqueues(writer, app):
+    stop = threading.Event()
+
+    def producer():
+        with app.app_context():
+            while not stop.is_set():
+                writer.enqueue(1, '10.0.0.2')
+                time.sleep(0.001)
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    try:
+        time.sleep(0.2)
+        durations = []
+        for _ in range(5):
+            started = time.monotonic()
+            writer.flush()
+            durations.append(time.monotonic() - started)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert max(durations) < 0.5
+    writer.flush()
+    assert logged() == writer.stats['enqueued']
+
+
+def test_background_thread_writes_after_flush_interval(writer):
+    for _ in range(3):
+        writer.enqueue(1, '10.0.0.3')
+
+    deadline = time.monotonic() + 3
+    while logged() < 3 and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    assert logged() == 3
+
+
+def test_failed_batch_is_retried(writer, monkeypatch):
+    original = ConnectionLogWriter._write
+    failures = {'left': 2}
+
+    def flaky(self, rows):
+        if failures['left']:
+            failures['left'] -= 1
+            return False
+        return original(self, rows)
+
+    monkeypatch.setattr(ConnectionLogWriter, '_write', flaky)
+    for _ in range(5):
+        writer.enqueue(1, '10.0.0.4')
+    writer.flush()
+    assert logged() == 0
+
+    deadline = time.monotonic() + 5
+    while logged() < 5 and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    assert logged() == 5
+    assert writer.stats['failed'] == 0
+
+
+def test_batch_is_dropped_after_max_retries(writer, monkeypatch):
+    monkeypatch.setattr('services.connection_log_writer.CONNECTION_LOG_MAX_RETRIES', 1)
+    monkeypatch.setattr(ConnectionLogWriter, '_write', lambda self, rows: False)
+
+    writer.enqueue(1, '10.0.0.5')
+    writer.flush()
+    writer._write_retries()
+
+    assert writer.stats['failed'] == 1
+    assert not writer._retries
@@ -0,0 +1,52 @@
+"""Проверка нового IP в MemoryFingerprintTracker (services/fingerprint_tracker.py)"""
+
+import pytest
+
+from database.db_config import db
+from database.models.user_model import User as UserModel
+from services import connection_log_writer as writer_module
+from services.connection_log_writer import ConnectionLogWriter
+from services.fingerprint_tracker import MemoryFingerprintTracker
+
+
+@pytest.fixture
+def writer(app, monkeypatch):
+    for user_id in (1, 2):
+        db.session.add(UserModel(id=user_id, username=f'user_{user_id}'))
+    db.session.commit()
+    writer = ConnectionLogWriter(batch_size=100, flush_interval=60, max_queue=1000, durability='async')
+    monkeypatch.setattr(writer_module, 'connection_log_writer', writer)
+    return writer
+
+
+def test_new_ip_check_does_not_flush_log_queue(writer, monkeypatch):
+    monkeypatch.setattr(writer, 'flush', lambda: pytest.fail('check() не должен сбрасывать очередь'))
+    # Чужие строки в очереди остаются там
+    writer.enqueue(2, '10.0.0.9')
+
+    allowed, distinct, new_ip = MemoryFingerprintTracker().check(1, '10.0.0.1')
+
+    assert (allowed, distinct, new_ip) == (True, 0, True)
+    assert writer._queue.qsize() == 1
+
+
+def test_limit_is_shared_between_workers_through_db(writer):
+    first, second = MemoryFingerprintTracker(), MemoryFingerprintTracker()
+
+    for ip in ('10.0.0.1', '10.0.0.2'):
+        allowed, _, new_ip = first.check(1, ip)
+        assert allowed and new_ip
+        # Как check_fingerprint: новый IP пишется сразу
+        writer.enqueue(1, ip, sync=True)
+
+    allowed, distinct, _ = second.check(1, '10.0.0.3')
+    assert (allowed, distinct) == (False, 2)
+
+
+def test_own_queued_rows_are_counted(writer):
+    writer.enqueue(1, '10.0.0.1')
+    writer.enqueue(1, '10.0.0.2')
+
+    allowed, distinct, _ = MemoryFingerprintTracker().check(1, '10.0.0.3')
+
+    assert (allowed, distinct) == (False, 2)
@@ -0,0 +1,50 @@
+"""Long-poll /api/payment/wait (services/payment_status_listener.py)"""
+
+import pytest
+
+from database.db_config import db
+from database.models.payment_model import Payment as PaymentModel
+from database.models.user_model import User as UserModel
+from services import payment_status_listener as listener_module
+from services.payment_status_listener import payment_status_listener, PAYMENT_WAIT_RETRY_AFTER
+
+
+@pytest.fixture
+def payment(app):
+    db.session.add(UserModel(id=7, username='user_7'))
+    db.session.add(PaymentModel(id='pay_1', amount=100, user_id=7, status='pending'))
+    db.session.commit()
+    return 'pay_1'
+
+
+def test_rejected_waiter_backs_off_no_faster_than_old_poll(client, payment, monkeypatch):
+    monkeypatch.setattr(payment_status_listener, 'max_waiters', 0)
+
+    data = client.get(f'/api/payment/wait/{payment}?status=pending').get_json()
+
+    assert data['changed'] is False and data['final'] is False
+    assert data['retry_after'] == PAYMENT_WAIT_RETRY_AFTER
+    assert PAYMENT_WAIT_RETRY_AFTER >= 10
+
+
+def test_changed_status_is_returned_without_waiting(client, payment):
+    data = client.get(f'/api/payment/wait/{payment}?status=succeeded').get_json()
+
+    assert data['status'] == 'pending'
+    assert data['changed'] is True
+    assert 'retry_after' not in data
+
+
+@pytest.mark.parametrize('env, expected', [
+    ({}, 6),
+    ({'GUNICORN_THREADS': '16'}, 14),
+    ({'GUNICORN_WORKER_CLASS': 'gevent'}, 50),
+    ({'GUNICORN_WORKER_CLASS': 'sync'}, 0),
+])
+def test_default_max_waiters_follows_gunicorn_concurrency(monkeypatch, env, expected):
+    for name in ('GUNICORN_WORKER_CLASS', 'GUNICORN_THREADS', 'GUNICORN_WORKER_CONNECTIONS'):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+
+    assert listener_module._default_max_waiters() == expected
@@ -0,0 +1,65 @@
+"""Количество SQL-запросов на горячих роутах (utils/request_context.py)"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from database.db_config import db
+from database.models.user_model import User as UserModel
+
+USER_ID = 5
+
+
+def query_count(response) -> int:
+    return int(response.headers['X-Query-Count'])
+
+
+@pytest.fixture
+def user(app):
+    user = UserModel(
+        id=USER_ID,
+        username=f'user_{USER_ID}',
+        subscription_end_date=datetime.utcnow() + timedelta(days=3),
+        subscription_url='https://vpn.example/sub/token',
+        vpn_key_generated=True
+    )
+    db.session.add(user)
+    db.session.commit()
+    # Каждый HTTP-запрос начинается с пустой сессии, как в gunicorn
+    db.session.remove()
+    return user
+
+
+def test_vpn_connect_loads_user_once(client, user):
+    response = client.post('/api/vpn/connect', json={'user_id': USER_ID})
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'success'
+    assert query_count(response) == 1
+
+
+def test_vpn_status_loads_user_once(client, user):
+    response = client.get(f'/api/vpn/status/{USER_ID}')
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'success'
+    assert query_count(response) == 1
+
+
+def test_unknown_user_is_not_cached(client, app):
+    response = client.get(f'/api/vpn/status/{USER_ID}')
+    assert response.get_json()['status'] == 'error'
+
+    user = UserModel(id=USER_ID, username=f'user_{USER_ID}')
+    db.session.add(user)
+    db.session.commit()
+
+    response = client.get(f'/api/vpn/status/{USER_ID}')
+    assert response.get_json()['status'] == 'success'
+
+
+def test_query_count_outside_request_is_zero(app):
+    from utils.request_context import query_count as current_query_count
+
+    UserModel.query.filter_by(id=USER_ID).first()
+    assert current_query_count() == 0
@@ -60,7 +60,8 @@ def require_active_subscription(user_model_class):
             user_id = kwargs.get('user_id')
             if not user_id:
                 return jsonify({'status': 'error', 'error': 'user_id is required'}), 400
-            user = user_model_class.query.filter_by(id=user_id).first()
+            from utils.request_context import load
+            user = load(user_model_class, user_id)
             if not user:
                 return jsonify({'status': 'error', 'error': 'User not found'}), 404
             if not user.is_subscription_active():
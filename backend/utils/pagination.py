@@ -0,0 +1,83 @@
+"""Keyset (cursor) pagination helpers"""
+
+import json
+import base64
+from decimal import Decimal
+from datetime import datetime
+
+from sqlalchemy import table
+
+from database.db_config import db
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+    return value
+
+
+def encode_cursor(data: dict) -> str:
+    """Непрозрачный курсор: base64(json) с сериализацией datetime/Decimal"""
+    payload = json.dumps({key: _encode_value(value) for key, value in data.items()}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Обратное к encode_cursor; ValueError на повреждённый курсор"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(data, dict):
+        raise ValueError('Invalid cursor')
+    return {key: _decode_value(value) for key, value in data.items()}
+
+
+def get_limit(args, default: int = DEFAULT_LIMIT, maximum: int = MAX_LIMIT) -> int:
+    """limit (или per_page для старых клиентов) из query string, в пределах 1..maximum"""
+    limit = args.get('limit', type=int) or args.get('per_page', default, type=int)
+    return max(1, min(limit, maximum))
+
+
+def keyset_condition(sort_expr, sort_value, id_column, last_id, descending: bool = False):
+    """Условие «после последней строки страницы» для ORDER BY sort_expr, id (одного направления)"""
+    if sort_expr is None:
+        return id_column < last_id if descending else id_column > last_id
+    if descending:
+        return db.or_(sort_expr < sort_value, db.and_(sort_expr == sort_value, id_column < last_id))
+    return db.or_(sort_expr > sort_value, db.and_(sort_expr == sort_value, id_column > last_id))
+
+
+def approximate_count(table_name: str):
+    """
+    Количество строк без полного COUNT(*): pg_class.reltuples (обновляется ANALYZE/autovacuum).
+    Возвращает (count, is_estimate); вне PostgreSQL или до первого ANALYZE — точный подсчёт.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(
+            db.text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)"),
+            {'table_name': table_name}
+        ).scalar()
+        if estimate is not None and estimate >= 0:
+            return int(estimate), True
+
+    return exact_count(table(table_name)), False
+
+
+def exact_count(from_clause) -> int:
+    return db.session.execute(db.select(db.func.count()).select_from(from_clause)).scalar()
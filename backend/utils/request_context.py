@@ -0,0 +1,54 @@
+"""Per-request row lookups through the session identity map and query counter"""
+
+import os
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# X-Query-Count в каждом ответе — для отладки и проверки количества запросов
+QUERY_COUNT_HEADER = os.getenv('QUERY_COUNT_HEADER', 'false').lower() == 'true'
+
+
+def load(model, pk):
+    """
+    Строка model по id не больше одного SELECT за запрос: db.session.get берёт
+    объект из identity map сессии, поэтому роуты, сервисы и декораторы получают
+    один и тот же объект. После commit атрибуты перечитываются как обычно
+    (expire_on_commit); identity map держит объекты по слабым ссылкам и в
+    долгоживущих фоновых обработчиках не растёт.
+    """
+    from database.db_config import db
+    return db.session.get(model, pk)
+
+
+def load_user(user_id):
+    from database.models.user_model import User as UserModel
+    return load(UserModel, user_id)
+
+
+def load_payment(payment_id):
+    from database.models.payment_model import Payment as PaymentModel
+    return load(PaymentModel, payment_id)
+
+
+def query_count() -> int:
+    """Сколько SQL-запросов выполнил текущий HTTP-запрос"""
+    return g.get('query_count', 0) if has_request_context() else 0
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    # Фоновый поток записи connection_logs работает вне запроса и не учитывается
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def init_request_context(app):
+    if not QUERY_COUNT_HEADER:
+        return
+
+    @app.after_request
+    def add_query_count_header(response):
+        response.headers['X-Query-Count'] = str(query_count())
+        return response
@@ -0,0 +1,82 @@
+"""Thread-safe TTL cache with per-key single-flight loading"""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class _Flight:
+    """Загрузка, которую ждут остальные потоки с тем же ключом"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Кэш на процесс для внешних вызовов (YooKassa, ...).
+
+    - значение живёт ttl секунд, ключей не больше maxsize (вытесняется давний);
+    - single-flight: пока один поток загружает ключ, остальные ждут его результата,
+      поэтому N одновременных запросов дают один внешний вызов;
+    - ошибки не кэшируются: ожидающие получают то же исключение, следующий
+      запрос попробует снова.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.stats['hits'] += 1
+                self._data.move_to_end(key)
+                return entry[0]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            with self._lock:
+                self._data[key] = (flight.value, time.monotonic() + self.ttl)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -1,11 +1,11 @@
+import os
 import asyncio
 import logging
 import signal
-import ssl
 import sys
 from datetime import datetime, time
 from telegram import Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ChatMemberHandler, ContextTypes
 
 from config import BOT_TOKEN, BACKEND_URL, MINI_APP_URL, ADMIN_IDS, CHANNEL_NEWS_URL, CHANNEL_WIN_MAC_URL, CHANNEL_ANDROID_IOS_URL
 
@@ -25,29 +25,69 @@ def is_user_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
 
-async def check_subscription(user_id: int) -> bool:
+# Кэш бота: горячие запросы к backend и Telegram API
+from utils.cache import AsyncTTLCache, cached
+
+BOT_CACHE_SIZE = int(os.getenv('BOT_CACHE_SIZE', '10000'))
+PLANS_CACHE_TTL = int(os.getenv('PLANS_CACHE_TTL', '300'))
+STATUS_CACHE_TTL = int(os.getenv('STATUS_CACHE_TTL', '30'))
+MEMBERSHIP_CACHE_TTL = int(os.getenv('MEMBERSHIP_CACHE_TTL', '21600'))
+MEMBERSHIP_NEGATIVE_TTL = int(os.getenv('MEMBERSHIP_NEGATIVE_TTL', '300'))
+
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+
+plans_cache = AsyncTTLCache(maxsize=1, ttl=PLANS_CACHE_TTL, stale_ttl=PLANS_CACHE_TTL * 12, name='plans')
+status_cache = AsyncTTLCache(maxsize=BOT_CACHE_SIZE, ttl=STATUS_CACHE_TTL, name='vpn_status')
+# Изменения подписки приходят push-ом (channel_member_update), TTL — страховка на случай
+# пропущенного обновления. Неподписанных помним короче: они как раз сейчас подписываются
+membership_cache = AsyncTTLCache(
+    maxsize=BOT_CACHE_SIZE,
+    ttl=lambda member_status: MEMBERSHIP_CACHE_TTL if member_status in MEMBER_STATUSES else MEMBERSHIP_NEGATIVE_TTL,
+    name='membership'
+)
+
+
+@cached(membership_cache, key=lambda bot, user_id: user_id)
+async def get_channel_member_status(bot, user_id: int) -> str:
+    """Статус участника канала новостей (member, left, administrator, ...)"""
+    chat_member = await bot.get_chat_member(chat_id=CHANNEL_NEWS_ID, user_id=user_id)
+    return chat_member.status
+
+
+async def channel_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    ChatMemberHandler: Telegram сам сообщает о вступлении/выходе из канала новостей
+    (chat_member) и об изменении прав бота (my_chat_member) — кэш обновляется без
+    запросов get_chat_member. Бот получает chat_member, только будучи админом канала.
+    """
+    member_update = update.chat_member or update.my_chat_member
+    if (member_update.chat.username or '').lower() != CHANNEL_NEWS_ID.lower():
+        return
+
+    new_member = member_update.new_chat_member
+    membership_cache.set(new_member.user.id, new_member.status)
+    logger.info(f"📰 user_{new_member.user.id} в канале новостей: {member_update.old_chat_member.status} → {new_member.status}")
+
+
+async def check_subscription(bot, user_id: int, recheck: bool = False) -> bool:
     """
     Проверка подписки пользователя на канал новостей
+    :param bot: бот приложения (context.bot)
     :param user_id: ID пользователя в Telegram
+    :param recheck: не доверять закэшированному «не подписан» (кнопка «Проверить ещё раз»)
     :return: True если подписан, False если нет
     """
+    if recheck and membership_cache.get(user_id) not in MEMBER_STATUSES:
+        membership_cache.invalidate(user_id)
     try:
-        from telegram import Bot
-        bot = Bot(token=BOT_TOKEN)
-        chat_member = await bot.get_chat_member(chat_id=CHANNEL_NEWS_ID, user_id=user_id)
-        
-        # Проверяем статус участника
-        if chat_member.status in ['member', 'administrator', 'creator']:
-            return True
-        return False
+        return await get_channel_member_status(bot, user_id) in MEMBER_STATUSES
     except Exception as e:
         logger.error(f"Ошибка проверки подписки для user_{user_id}: {e}")
-        # В случае ошибки считаем что пользователь не подписан
+        # В случае ошибки считаем что пользователь не подписан (ошибка не кэшируется)
         return False
 
 
 # Импорты для асинхронной работы
-import aiohttp
 from utils.validation import validate_user_id, sanitize_input
 
 # Импорты обработчиков VPN ключей
@@ -56,22 +96,33 @@ from handlers.vpn_key_handler import get_vpn_key, renew_vpn_key, handle_renew_se
 # Импорты уведомлений
 from notifications import send_expiration_reminder
 
-# SSL context with certificate verification (MITM protection)
-_ssl_context = None
+# Общий клиент backend (keep-alive пул, SSL с проверкой сертификатов — MITM protection)
+from utils.api_client import backend_client
 
 
-def _get_ssl_context():
-    global _ssl_context
-    if _ssl_context is None:
-        _ssl_context = ssl.create_default_context()
-    return _ssl_context
+@cached(status_cache, key=lambda user_id: user_id,
+        ttl=lambda result: STATUS_CACHE_TTL if result[0] == 200 and result[1].get('status') == 'success' else 0)
+async def get_vpn_status(user_id: int) -> tuple:
+    """(HTTP-статус, ответ) /api/vpn/status; кэшируются только успешные ответы"""
+    response = await backend_client.get(f"/api/vpn/status/{user_id}")
+    return response.status, (response.json() if response.status == 200 else None)
 
 
-def _create_session(timeout=30):
-    return aiohttp.ClientSession(
-        timeout=aiohttp.ClientTimeout(total=timeout, connect=10),
-        connector=aiohttp.TCPConnector(ssl=_get_ssl_context())
-    )
+@cached(plans_cache, key=lambda: 'plans', ttl=lambda result: PLANS_CACHE_TTL if result[0] == 200 else 0)
+async def get_payment_plans() -> tuple:
+    """(HTTP-статус, тарифы) /api/payment/plans — общие для всех пользователей"""
+    response = await backend_client.get("/api/payment/plans")
+    return response.status, (response.json() if response.status == 200 else None)
+
+
+async def on_startup(application: Application):
+    """post_init: сессия к backend создаётся один раз на всё приложение"""
+    await backend_client.start()
+
+
+async def on_shutdown(application: Application):
+    """post_shutdown: закрываем пул соединений к backend"""
+    await backend_client.close()
 
 
 async def handle_payment_success(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -83,19 +134,18 @@ async def handle_payment_success(update: Update, context: ContextTypes.DEFAULT_T
     subscription_status = 'unknown'
 
     try:
-        async with _create_session(10) as session:
-            # Получаем баланс
-            async with session.get(f"{BACKEND_URL}/api/users/{user_id}/balance") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    balance = data.get('balance', 0)
-
-            # Получаем статус подписки
-            async with session.get(f"{BACKEND_URL}/api/vpn/status/{user_id}") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    subscription = data.get('subscription', {})
-                    subscription_status = subscription.get('status', 'unknown')
+        # Баланс и статус подписки — параллельно по соединениям из общего пула
+        balance_response, status_response = await asyncio.gather(
+            backend_client.get(f"/api/users/{user_id}/balance", timeout=10),
+            backend_client.get(f"/api/vpn/status/{user_id}", timeout=10)
+        )
+        if balance_response.status == 200:
+            balance = balance_response.json().get('balance', 0)
+        # Подписка только что изменилась — закэшированный статус устарел
+        get_vpn_status.invalidate(user_id)
+        if status_response.status == 200:
+            subscription = status_response.json().get('subscription', {})
+            subscription_status = subscription.get('status', 'unknown')
     except Exception as e:
         logger.error(f"Error getting user info: {e}")
     
@@ -155,10 +205,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     }
 
     try:
-        async with _create_session(30) as session:
-            async with session.post(f"{BACKEND_URL}/api/users", json=user_data) as response:
-                if response.status != 201:
-                    logger.warning(f"Failed to register user {user_id}: {await response.text()}")
+        response = await backend_client.post("/api/users", json=user_data)
+        if response.status != 201:
+            logger.warning(f"Failed to register user {user_id}: {response.text}")
     except Exception as e:
         logger.error(f"Error registering user {user_id}: {e}")
 
@@ -194,26 +243,23 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        async with _create_session(30) as session:
-            async with session.get(f"{BACKEND_URL}/api/vpn/status/{user_id}") as response:
-                if response.status == 200:
-                    data = await response.json()
-
-                    if data.get('status') == 'success':
-                        sub_status = data['subscription']['status']
-                        days_left = data['subscription']['days_left']
-
-                        status_text = (
-                            "📊 Статус VPN-подключения:\n\n"
-                            f"Статус подписки: {'✅ Активна' if sub_status == 'active' else '❌ Просрочена'}\n"
-                            f"Осталось дней: {days_left}\n"
-                            f"VPN подключен: {'Да' if data['vpn']['connected'] else 'Нет'}"
-                        )
-                    else:
-                        status_text = f"⚠️ Ошибка получения статуса: {data.get('message', 'Неизвестная ошибка')}"
-                else:
-                    logger.warning(f"Server returned status {response.status} for user {user_id}")
-                    status_text = f"⚠️ Не удалось получить статус из-за ошибки сервера"
+        response_status, data = await get_vpn_status(user_id)
+        if response_status == 200:
+            if data.get('status') == 'success':
+                sub_status = data['subscription']['status']
+                days_left = data['subscription']['days_left']
+
+                status_text = (
+                    "📊 Статус VPN-подключения:\n\n"
+                    f"Статус подписки: {'✅ Активна' if sub_status == 'active' else '❌ Просрочена'}\n"
+                    f"Осталось дней: {days_left}\n"
+                    f"VPN подключен: {'Да' if data['vpn']['connected'] else 'Нет'}"
+                )
+            else:
+                status_text = f"⚠️ Ошибка получения статуса: {data.get('message', 'Неизвестная ошибка')}"
+        else:
+            logger.warning(f"Server returned status {response_status} for user {user_id}")
+            status_text = f"⚠️ Не удалось получить статус из-за ошибки сервера"
     except Exception as e:
         logger.error(f"Error getting status for user {user_id}: {e}")
         status_text = f"⚠️ Произошла ошибка при получении статуса"
@@ -232,24 +278,24 @@ async def connect(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        async with _create_session(30) as session:
-            async with session.post(f"{BACKEND_URL}/api/vpn/connect", json={'user_id': user_id}) as response:
-                if response.status == 200:
-                    data = await response.json()
-
-                    if data.get('status') == 'success':
-                        connect_text = (
-                            "🔌 Подключаюсь к VPN...\n\n"
-                            "✅ Подключение успешно инициировано!\n"
-                            "Пожалуйста, подождите несколько секунд для установки соединения.\n\n"
-                            f"Сервер: {data['connection_details']['server_ip']}:{data['connection_details']['server_port']}"
-                        )
-                    else:
-                        logger.warning(f"Connection failed for user {user_id}: {data.get('message', 'Unknown error')}")
-                        connect_text = f"❌ Ошибка подключения: {data.get('message', 'Неизвестная ошибка')}"
-                else:
-                    logger.warning(f"Server returned status {response.status} for connection request from user {user_id}")
-                    connect_text = "❌ Не удалось подключиться к VPN из-за ошибки сервера"
+        response = await backend_client.post("/api/vpn/connect", json={'user_id': user_id})
+        get_vpn_status.invalidate(user_id)
+        if response.status == 200:
+            data = response.json()
+
+            if data.get('status') == 'success':
+                connect_text = (
+                    "🔌 Подключаюсь к VPN...\n\n"
+                    "✅ Подключение успешно инициировано!\n"
+                    "Пожалуйста, подождите несколько секунд для установки соединения.\n\n"
+                    f"Сервер: {data['connection_details']['server_ip']}:{data['connection_details']['server_port']}"
+                )
+            else:
+                logger.warning(f"Connection failed for user {user_id}: {data.get('message', 'Unknown error')}")
+                connect_text = f"❌ Ошибка подключения: {data.get('message', 'Неизвестная ошибка')}"
+        else:
+            logger.warning(f"Server returned status {response.status} for connection request from user {user_id}")
+            connect_text = "❌ Не удалось подключиться к VPN из-за ошибки сервера"
     except Exception as e:
         logger.error(f"Error connecting user {user_id} to VPN: {e}")
         connect_text = "❌ Произошла ошибка при попытке подключения к VPN"
@@ -268,17 +314,17 @@ async def disconnect(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        async with _create_session(30) as session:
-            async with session.post(f"{BACKEND_URL}/api/vpn/disconnect", json={'user_id': user_id}) as response:
-                if response.status == 200:
-                    disconnect_text = (
-                        "🔌 Отключаюсь от VPN...\n\n"
-                        "✅ Отключение успешно инициировано!\n"
-                        "Соединение будет разорвано в течение нескольких секунд."
-                    )
-                else:
-                    logger.warning(f"Server returned status {response.status} for disconnection request from user {user_id}")
-                    disconnect_text = "❌ Не удалось отключиться от VPN из-за ошибки сервера"
+        response = await backend_client.post("/api/vpn/disconnect", json={'user_id': user_id})
+        get_vpn_status.invalidate(user_id)
+        if response.status == 200:
+            disconnect_text = (
+                "🔌 Отключаюсь от VPN...\n\n"
+                "✅ Отключение успешно инициировано!\n"
+                "Соединение будет разорвано в течение нескольких секунд."
+            )
+        else:
+            logger.warning(f"Server returned status {response.status} for disconnection request from user {user_id}")
+            disconnect_text = "❌ Не удалось отключиться от VPN из-за ошибки сервера"
     except Exception as e:
         logger.error(f"Error disconnecting user {user_id} from VPN: {e}")
         disconnect_text = "❌ Произошла ошибка при попытке отключения от VPN"
@@ -291,33 +337,31 @@ async def payments(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     try:
-        async with _create_session(30) as session:
-            async with session.get(f"{BACKEND_URL}/api/payment/plans") as response:
-                if response.status == 200:
-                    plans = await response.json()
-
-                    # Create inline keyboard with subscription options
-                    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-                    keyboard = [
-                        [InlineKeyboardButton("💳 Тарифы подписки", callback_data="show_subscription_plans")],
-                    ]
-
-                    for plan in plans:
-                        keyboard.append([InlineKeyboardButton(
-                            f"{plan['name']} - {plan['price']}₽ ({plan['description']})",
-                            callback_data=f"plan_{plan['id']}"
-                        )])
-
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    await update.message.reply_text(
-                        f"💳 Тарифы подписки\n\n"
-                        f"Выберите тариф для оплаты:",
-                        reply_markup=reply_markup
-                    )
-                else:
-                    await update.message.reply_text(
-                        "❌ Не удалось получить тарифные планы из-за ошибки сервера"
-                    )
+        response_status, plans = await get_payment_plans()
+        if response_status == 200:
+
+            # Create inline keyboard with subscription options
+            from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+            keyboard = [
+                [InlineKeyboardButton("💳 Тарифы подписки", callback_data="show_subscription_plans")],
+            ]
+
+            for plan in plans:
+                keyboard.append([InlineKeyboardButton(
+                    f"{plan['name']} - {plan['price']}₽ ({plan['description']})",
+                    callback_data=f"plan_{plan['id']}"
+                )])
+
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            await update.message.reply_text(
+                f"💳 Тарифы подписки\n\n"
+                f"Выберите тариф для оплаты:",
+                reply_markup=reply_markup
+            )
+        else:
+            await update.message.reply_text(
+                "❌ Не удалось получить тарифные планы из-за ошибки сервера"
+            )
     except Exception as e:
         logger.error(f"Error in payments command for user {user_id}: {e}")
         await update.message.reply_text(
@@ -347,16 +391,16 @@ async def reset_device(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     try:
-        async with _create_session(10) as session:
-            async with session.post(f"{BACKEND_URL}/api/users/{user_id}/reset-device") as response:
-                if response.status == 200:
-                    await update.message.reply_text(
-                        "✅ Устройство сброшено!\n\n"
-                        "Теперь вы можете подключиться с нового устройства.\n\n"
-                        "Если у вас возникли проблемы - напишите в поддержку."
-                    )
-                else:
-                    await update.message.reply_text("❌ Ошибка при сбросе устройства. Попробуйте позже.")
+        response = await backend_client.post(f"/api/users/{user_id}/reset-device", timeout=10)
+        get_vpn_status.invalidate(user_id)
+        if response.status == 200:
+            await update.message.reply_text(
+                "✅ Устройство сброшено!\n\n"
+                "Теперь вы можете подключиться с нового устройства.\n\n"
+                "Если у вас возникли проблемы - напишите в поддержку."
+            )
+        else:
+            await update.message.reply_text("❌ Ошибка при сбросе устройства. Попробуйте позже.")
     except Exception as e:
         logger.error(f"Error in reset_device: {e}")
         await update.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
@@ -386,6 +430,105 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast <текст> — рассылка всем пользователям (только для админов)"""
+    from utils.broadcast import BroadcastEngine, create_broadcast
+
+    if not is_user_admin(update.effective_user.id):
+        await update.message.reply_text("❌ У вас нет прав администратора.")
+        return
+
+    message_text = update.message.text.partition(' ')[2].strip()
+    if not message_text:
+        await update.message.reply_text("Использование: /broadcast <текст сообщения>")
+        return
+
+    broadcast_id = await asyncio.to_thread(create_broadcast, message_text, True)
+    context.application.create_task(BroadcastEngine(context.bot).run(broadcast_id))
+    await update.message.reply_text(
+        f"📢 Рассылка #{broadcast_id} запущена (если идёт другая рассылка — начнётся после неё).\n"
+        f"Прогресс: /broadcast_status {broadcast_id}, остановить: /broadcast_cancel {broadcast_id}"
+    )
+
+
+async def broadcast_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast_status <id> — прогресс, скорость и ETA рассылки"""
+    from utils.broadcast import active_broadcasts, get_broadcast
+
+    if not is_user_admin(update.effective_user.id):
+        return
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Использование: /broadcast_status <id>")
+        return
+
+    broadcast_id = int(context.args[0])
+    engine = active_broadcasts.get(broadcast_id)
+    if engine:
+        progress = engine.progress()
+        status = 'running'
+    else:
+        progress = await asyncio.to_thread(get_broadcast, broadcast_id)
+        if not progress:
+            await update.message.reply_text(f"Рассылка #{broadcast_id} не найдена")
+            return
+        status = progress['status']
+        progress['processed'] = progress['sent'] + progress['failed'] + progress['blocked']
+
+    lines = [
+        f"📢 Рассылка #{broadcast_id}: {status}",
+        f"Обработано: {progress['processed']}/{progress['total'] or '?'}",
+        f"✅ {progress['sent']}  🚫 {progress['blocked']}  ❌ {progress['failed']}"
+    ]
+    if engine:
+        eta = progress['eta_seconds']
+        lines.append(f"⚡ {progress['rate']} msg/s, осталось ~{eta // 60 if eta is not None else '?'} мин")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def cache_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/cache_stats — попадания и промахи кэшей бота (только для админов)"""
+    if not is_user_admin(update.effective_user.id):
+        return
+
+    lines = ["🗄️ Кэш бота:"]
+    for cache in (plans_cache, status_cache, membership_cache):
+        m = cache.metrics()
+        lines.append(
+            f"{m['name']}: {m['size']} ключей, hit {m['hit_ratio']:.0%} "
+            f"({m['hits']}+{m['stale_hits']} stale / {m['misses']} miss), "
+            f"загрузок {m['loads']}, ошибок {m['errors']}, вытеснено {m['evictions']}"
+        )
+    await update.message.reply_text("\n".join(lines))
+
+
+async def broadcast_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast_cancel <id> — остановить рассылку после текущей страницы"""
+    from utils.broadcast import cancel_broadcast
+
+    if not is_user_admin(update.effective_user.id):
+        return
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Использование: /broadcast_cancel <id>")
+        return
+
+    cancelled = await asyncio.to_thread(cancel_broadcast, int(context.args[0]))
+    await update.message.reply_text("🛑 Рассылка остановлена" if cancelled else "Рассылка уже завершена или не найдена")
+
+
+async def _resume_broadcasts(bot):
+    try:
+        from utils.broadcast import resume_broadcasts
+        await resume_broadcasts(bot)
+    except Exception as e:
+        logger.error(f"❌ Ошибка продолжения рассылок: {e}", exc_info=True)
+
+
+async def resume_broadcasts_job(context: ContextTypes.DEFAULT_TYPE):
+    """Рассылки без живого владельца: прерванные рестартом и ждущие в очереди"""
+    # Рассылка идёт часами — job не ждёт её, следующий запуск увидит active_broadcasts
+    context.application.create_task(_resume_broadcasts(context.bot))
+
+
 async def key_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /key command for getting VPN keys"""
     await get_vpn_key(update, context)
@@ -498,7 +641,7 @@ async def check_subscription_callback(update: Update, context: ContextTypes.DEFA
 
     # Проверяем подписку
     try:
-        is_subscribed = True if is_admin_user else await check_subscription(user_id)
+        is_subscribed = True if is_admin_user else await check_subscription(context.bot, user_id, recheck=True)
         logger.info(f"{'✅' if is_subscribed else '❌'} Результат проверки: {'подписан' if is_subscribed else 'не подписан'}")
     except Exception as e:
         logger.error(f"❌ Исключение при проверке подписки: {e}")
@@ -537,11 +680,9 @@ async def check_subscription_callback(update: Update, context: ContextTypes.DEFA
         # Проверяем, является ли бот администратором канала
         bot_is_admin = False
         try:
-            from telegram import Bot
-            bot = Bot(token=BOT_TOKEN)
-            bot_member = await bot.get_chat_member(chat_id=CHANNEL_NEWS_ID, user_id=bot.id)
-            bot_is_admin = bot_member.status == 'administrator'
-            logger.info(f"🤖 Статус бота в канале: {bot_member.status}")
+            bot_status = await get_channel_member_status(context.bot, context.bot.id)
+            bot_is_admin = bot_status == 'administrator'
+            logger.info(f"🤖 Статус бота в канале: {bot_status}")
         except Exception as e:
             logger.error(f"❌ Не удалось проверить статус бота: {e}")
         
@@ -644,33 +785,108 @@ async def sync_marzban_with_db(context):
     Запускается каждые 5 минут через backend API
     """
     try:
-        import aiohttp
         from config import BACKEND_URL
 
         logger.info(f"🔄 Синхронизация Marzban: BACKEND_URL={BACKEND_URL}")
 
-        async with aiohttp.ClientSession() as session:
-            # Вызвать backend API для синхронизации с заголовком Host
-            async with session.post(
-                f"{BACKEND_URL}/api/sync/marzban",
-                headers={"Host": "localhost"}
-            ) as response:
-                response_text = await response.text()
-                logger.info(f"📡 Ответ backend: status={response.status}, body={response_text[:200]}")
-                if response.status == 200:
-                    result = await response.json()
-                    updated = result.get('updated', 0)
-                    if updated > 0:
-                        logger.info(f"✅ Синхронизация: обновлено {updated} пользователей")
-                    else:
-                        logger.info("ℹ️ Синхронизация: изменений нет")
-                else:
-                    logger.error(f"❌ Ошибка синхронизации: {response.status}")
+        # Вызвать backend API для синхронизации с заголовком Host
+        response = await backend_client.post(
+            "/api/sync/marzban",
+            headers={"Host": "localhost"},
+            timeout=300
+        )
+        logger.info(f"📡 Ответ backend: status={response.status}, body={response.text[:200]}")
+        if response.status == 200:
+            result = response.json()
+            updated = result.get('updated', 0)
+            if updated > 0:
+                logger.info(f"✅ Синхронизация: обновлено {updated} пользователей")
+            else:
+                logger.info("ℹ️ Синхронизация: изменений нет")
+        else:
+            logger.error(f"❌ Ошибка синхронизации: {response.status}")
 
     except Exception as e:
         logger.error(f"❌ Ошибка синхронизации: {e}", exc_info=True)
 
 
+def build_application(with_jobs: bool = True, webhook: bool = False) -> Application:
+    """
+    Application со всеми обработчиками.
+    :param with_jobs: регистрировать фоновые задачи (в webhook-режиме — только в первом воркере)
+    :param webhook: обновления приходят через webhook_server, Updater не нужен
+    """
+    from utils.update_processor import build_update_processor
+
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(build_update_processor())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
+
+    # Register command handlers
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("key", key_command))
+    application.add_handler(CommandHandler("app", app_command))
+    application.add_handler(CommandHandler("reset_device", reset_device))
+    application.add_handler(CommandHandler("admin", admin_command))
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
+    application.add_handler(CommandHandler("broadcast_status", broadcast_status_command))
+    application.add_handler(CommandHandler("broadcast_cancel", broadcast_cancel_command))
+    application.add_handler(CommandHandler("cache_stats", cache_stats_command))
+    
+    # Register callback query handler for instructions (сначала более специфичные)
+    application.add_handler(CallbackQueryHandler(handle_instructions_callback, pattern='^instructions$'))
+
+    # Register callback query handler for subscription check
+    application.add_handler(CallbackQueryHandler(check_subscription_callback, pattern='^check_subscription$'))
+
+    # Подписки/отписки от канала новостей — push-инвалидация кэша membership
+    application.add_handler(ChatMemberHandler(channel_member_update, ChatMemberHandler.ANY_CHAT_MEMBER))
+
+    # Register callback query handler for menu (общий обработчик - в конце)
+    application.add_handler(CallbackQueryHandler(handle_plan_selection))
+
+    if with_jobs:
+        register_jobs(application)
+    return application
+
+
+def register_jobs(application: Application):
+    """Фоновые задачи JobQueue: должны работать ровно в одном процессе бота"""
+    logger.info("Setting up JobQueue for automatic notifications...")
+
+    # Ежедневная проверка подписок в 10:00
+    application.job_queue.run_daily(
+        send_expiration_reminder,
+        time=time(10, 0),  # 10:00 утра
+        name="expiration_reminder"
+    )
+    logger.info("✅ JobQueue настроен: уведомления об истечении в 10:00")
+    
+    # Синхронизация Marzban → PostgreSQL каждые 15 минут
+    application.job_queue.run_repeating(
+        sync_marzban_with_db,
+        interval=900,  # 900 секунд = 15 минут
+        first=15,      # Первый запуск через 60 секунд после старта
+        name="marzban_sync"
+    )
+    logger.info("✅ JobQueue настроен: синхронизация Marzban каждые 15 минут")
+
+    # Прерванные рестартом рассылки продолжаются с сохранённого места — после
+    # истечения аренды упавшего процесса, поэтому проверка повторяется
+    from utils.broadcast import BROADCAST_LEASE_SECONDS
+    application.job_queue.run_repeating(
+        resume_broadcasts_job, interval=BROADCAST_LEASE_SECONDS, first=30, name="resume_broadcasts"
+    )
+
+
 def main():
     """Start the bot"""
     logger.info("Initializing VPN Bot...")
@@ -689,46 +905,15 @@ def main():
     logger.info(f"🖥️ CHANNEL_WIN_MAC_URL: {CHANNEL_WIN_MAC_URL}")
     logger.info(f"📱 CHANNEL_ANDROID_IOS_URL: {CHANNEL_ANDROID_IOS_URL}")
 
+    # polling — один процесс с long polling; webhook — aiohttp-сервер за nginx (webhook_server.py)
+    if os.getenv('BOT_RUNTIME', 'polling') == 'webhook':
+        from webhook_server import run_webhook
+        run_webhook(build_application)
+        return
+
     try:
         logger.info("Creating application with bot token...")
-        application = Application.builder().token(BOT_TOKEN).build()
-
-        # Register command handlers
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("key", key_command))
-        application.add_handler(CommandHandler("app", app_command))
-        application.add_handler(CommandHandler("reset_device", reset_device))
-        application.add_handler(CommandHandler("admin", admin_command))
-        
-        # Register callback query handler for instructions (сначала более специфичные)
-        application.add_handler(CallbackQueryHandler(handle_instructions_callback, pattern='^instructions$'))
-
-        # Register callback query handler for subscription check
-        application.add_handler(CallbackQueryHandler(check_subscription_callback, pattern='^check_subscription$'))
-
-        # Register callback query handler for menu (общий обработчик - в конце)
-        application.add_handler(CallbackQueryHandler(handle_plan_selection))
-
-        # Setup JobQueue for automatic notifications
-        logger.info("Setting up JobQueue for automatic notifications...")
-
-        # Ежедневная проверка подписок в 10:00
-        application.job_queue.run_daily(
-            send_expiration_reminder,
-            time=time(10, 0),  # 10:00 утра
-            name="expiration_reminder"
-        )
-        logger.info("✅ JobQueue настроен: уведомления об истечении в 10:00")
-        
-        # Синхронизация Marzban → PostgreSQL каждые 15 минут
-        application.job_queue.run_repeating(
-            sync_marzban_with_db,
-            interval=900,  # 900 секунд = 15 минут
-            first=15,      # Первый запуск через 60 секунд после старта
-            name="marzban_sync"
-        )
-        logger.info("✅ JobQueue настроен: синхронизация Marzban каждые 15 минут")
+        application = build_application()
 
         # Start the bot with graceful shutdown
         logger.info("Starting VPN Bot polling...")
@@ -744,7 +929,8 @@ def main():
         signal.signal(signal.SIGINT, signal_handler)
 
         try:
-            application.run_polling(drop_pending_updates=True)
+            # chat_member не входит в обновления по умолчанию — запрашиваем все типы
+            application.run_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
         except KeyboardInterrupt:
             logger.info("🛑 Keyboard interrupt received. Stopping bot...")
         finally:
@@ -760,4 +946,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
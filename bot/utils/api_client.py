@@ -1,16 +1,24 @@
 """
 Module containing API client functions for the VPN bot
 """
+import os
 import asyncio
+import json
 import logging
 import ssl
 import aiohttp
-from typing import Optional
+from typing import Any, Optional
 
 logger = logging.getLogger(__name__)
 
 _ssl_context = None
 
+# Пул соединений к backend: keep-alive, лимит на хост, кэш DNS
+BACKEND_POOL_SIZE = int(os.getenv('BACKEND_POOL_SIZE', '20'))
+BACKEND_RETRIES = int(os.getenv('BACKEND_RETRIES', '2'))
+RETRY_DELAY = 0.5  # seconds
+RETRY_STATUSES = (502, 503, 504)
+
 
 def get_ssl_context() -> ssl.SSLContext:
     """Create and reuse SSL context with certificate verification"""
@@ -20,63 +28,108 @@ def get_ssl_context() -> ssl.SSLContext:
     return _ssl_context
 
 
-def create_connector() -> aiohttp.TCPConnector:
-    return aiohttp.TCPConnector(ssl=get_ssl_context())
+class BackendResponse:
+    """Прочитанный ответ backend: соединение уже возвращено в пул"""
 
+    def __init__(self, status: int, text: str):
+        self.status = status
+        self.text = text
 
-def create_session(timeout: int = 30) -> aiohttp.ClientSession:
-    return aiohttp.ClientSession(
-        timeout=aiohttp.ClientTimeout(total=timeout, connect=10),
-        connector=create_connector()
-    )
+    def json(self) -> Any:
+        return json.loads(self.text) if self.text else None
 
 
-async def make_request(method: str, url: str, **kwargs) -> Optional[aiohttp.ClientResponse]:
+class BackendClient:
     """
-    Make HTTP request with retry logic and error handling
+    Один aiohttp.ClientSession на всё приложение бота: соединения к backend
+    переиспользуются (keep-alive), DNS кэшируется, на хост — не больше
+    BACKEND_POOL_SIZE соединений.
+
+    Создаётся в post_init Application и закрывается в post_shutdown; если
+    запрос пришёл раньше, сессия создаётся лениво. Сессия привязана к циклу
+    событий, в котором создана: из другого цикла (отдельный asyncio.run) создаётся
+    новая, а старая просто отбрасывается — закрыть её можно только из её цикла.
+
+    Повторы с экспоненциальной задержкой: при ошибке соединения — для любого
+    метода (запрос ещё не ушёл), при таймауте и 502/503/504 — только для GET.
     """
-    max_retries = 3
-    retry_delay = 1  # seconds
-
-    timeout = aiohttp.ClientTimeout(total=30, connect=10)
-    connector = aiohttp.TCPConnector(ssl=get_ssl_context())
-
-    for attempt in range(max_retries):
-        client_session = None
-        try:
-            client_session = aiohttp.ClientSession(timeout=timeout, connector=connector)
-            async with client_session:
-                async with getattr(client_session, method.lower())(url, **kwargs) as response:
-                    return response
-        except aiohttp.ClientConnectorError as e:
-            logger.warning(f"Connection error on attempt {attempt + 1}/{max_retries} for {url}: {e}")
-            if client_session:
-                await client_session.close()
-            if attempt < max_retries - 1:
-                await asyncio.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
-            else:
-                raise
-        except aiohttp.ServerTimeoutError as e:
-            logger.warning(f"Server timeout on attempt {attempt + 1}/{max_retries} for {url}: {e}")
-            if client_session:
-                await client_session.close()
-            if attempt < max_retries - 1:
-                await asyncio.sleep(retry_delay * (2 ** attempt))
-            else:
-                raise
-        except aiohttp.ClientError as e:
-            logger.warning(f"Client error on attempt {attempt + 1}/{max_retries} for {url}: {e}")
-            if client_session:
-                await client_session.close()
-            if attempt < max_retries - 1:
-                await asyncio.sleep(retry_delay * (2 ** attempt))
-            else:
-                raise
-        except Exception as e:
-            logger.error(f"Unexpected error on attempt {attempt + 1}/{max_retries} for {url}: {e}")
-            if client_session:
-                await client_session.close()
-            if attempt < max_retries - 1:
-                await asyncio.sleep(retry_delay * (2 ** attempt))
-            else:
-                raise
+
+    def __init__(self, base_url: str = None, timeout: int = 30, retries: int = None):
+        self.base_url = base_url
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=10)
+        self.retries = BACKEND_RETRIES if retries is None else retries
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(
+                    ssl=get_ssl_context(),
+                    limit=BACKEND_POOL_SIZE * 2,
+                    limit_per_host=BACKEND_POOL_SIZE,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=30
+                )
+            )
+        return self._session
+
+    async def start(self):
+        if self.base_url is None:
+            from config import BACKEND_URL
+            self.base_url = BACKEND_URL
+        _ = self.session
+        logger.info(f"🔌 Backend client started: {self.base_url}, pool {BACKEND_POOL_SIZE}")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed \
+                and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    async def request(self, method: str, path: str, timeout: int = None, retries: int = None, **kwargs) -> BackendResponse:
+        if self.base_url is None:
+            await self.start()
+
+        url = path if path.startswith('http') else f"{self.base_url}{path}"
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout, connect=min(timeout, 10))
+        retries = self.retries if retries is None else retries
+        idempotent = method.upper() == 'GET'
+
+        for attempt in range(retries + 1):
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    text = await response.text()
+                    if response.status in RETRY_STATUSES and idempotent and attempt < retries:
+                        logger.warning(f"Backend {response.status} on attempt {attempt + 1}/{retries + 1} for {url}")
+                    else:
+                        return BackendResponse(response.status, text)
+            except aiohttp.ClientConnectorError as e:
+                logger.warning(f"Connection error on attempt {attempt + 1}/{retries + 1} for {url}: {e}")
+                if attempt >= retries:
+                    raise
+            except (asyncio.TimeoutError, aiohttp.ServerDisconnectedError) as e:
+                logger.warning(f"Timeout on attempt {attempt + 1}/{retries + 1} for {url}: {e!r}")
+                if not idempotent or attempt >= retries:
+                    raise
+            await asyncio.sleep(RETRY_DELAY * (2 ** attempt))
+
+    async def get(self, path: str, **kwargs) -> BackendResponse:
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> BackendResponse:
+        return await self.request('POST', path, **kwargs)
+
+
+backend_client = BackendClient()
+
+
+async def make_request(method: str, url: str, **kwargs) -> BackendResponse:
+    """Make HTTP request through the shared backend client (retry logic and error handling)"""
+    return await backend_client.request(method, url, **kwargs)
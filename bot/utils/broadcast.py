@@ -0,0 +1,406 @@
+"""
+Рассылки с учётом лимитов Telegram: token bucket, пул воркеров, RetryAfter
+и прогресс в таблице broadcasts, чтобы прерванная рассылка продолжилась
+"""
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, NetworkError
+
+logger = logging.getLogger(__name__)
+
+# Глобальный лимит Telegram — ~30 сообщений в секунду, оставляем запас
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '16'))
+# Получатели читаются страницами по users.id; прогресс сохраняется после каждой страницы
+BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', '500'))
+# Лимит на один чат — ~1 сообщение в секунду: повтор в тот же чат не раньше
+PER_CHAT_INTERVAL = 1.0
+MAX_ATTEMPTS = 3
+MAX_RETRY_AFTER = 5
+PROGRESS_LOG_INTERVAL = 10
+# Аренда рассылки: владелец продлевает heartbeat_at, другой процесс может забрать
+# рассылку, только если heartbeat старше BROADCAST_LEASE_SECONDS (владелец упал)
+BROADCAST_LEASE_SECONDS = int(os.getenv('BROADCAST_LEASE_SECONDS', '120'))
+HEARTBEAT_INTERVAL = BROADCAST_LEASE_SECONDS / 4
+# pg_advisory_xact_lock для захвата: две рассылки одновременно превысили бы лимит Telegram
+BROADCAST_CLAIM_LOCK = 7_301_001
+
+# Рассылки, которые идут в этом процессе: {broadcast_id: BroadcastEngine}
+active_broadcasts: Dict[int, 'BroadcastEngine'] = {}
+
+_engine = None
+_owner = None
+
+
+def get_engine():
+    """SQLAlchemy engine для DATABASE_URL (создаётся при первом обращении)"""
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine
+
+        url = os.getenv('DATABASE_URL', '')
+        if url.startswith('postgres://'):
+            url = 'postgresql://' + url[len('postgres://'):]
+        _engine = create_engine(url, pool_size=2, max_overflow=2, pool_pre_ping=True)
+    return _engine
+
+
+def _text(sql: str):
+    from sqlalchemy import text
+    return text(sql)
+
+
+def create_broadcast(message_text: str, exclude_admins: bool = True) -> int:
+    now = datetime.utcnow()
+    with get_engine().begin() as connection:
+        return connection.execute(_text(
+            "INSERT INTO broadcasts (text, exclude_admins, status, last_user_id, sent, failed, blocked, created_at, updated_at) "
+            "VALUES (:text, :exclude_admins, 'pending', 0, 0, 0, 0, :now, :now) RETURNING id"
+        ), {'text': message_text, 'exclude_admins': exclude_admins, 'now': now}).scalar()
+
+
+def get_broadcast(broadcast_id: int) -> Optional[dict]:
+    with get_engine().connect() as connection:
+        row = connection.execute(_text(
+            "SELECT id, text, exclude_admins, status, last_user_id, total, sent, failed, blocked "
+            "FROM broadcasts WHERE id = :id"
+        ), {'id': broadcast_id}).mappings().first()
+    return dict(row) if row else None
+
+
+def get_owner() -> str:
+    """Идентификатор процесса-владельца аренды (свой у каждого воркера после fork)"""
+    global _owner
+    if _owner is None or _owner[0] != os.getpid():
+        _owner = (os.getpid(), f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+    return _owner[1]
+
+
+def _stale_before() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=BROADCAST_LEASE_SECONDS)
+
+
+def get_resumable_broadcasts() -> List[int]:
+    """Незавершённые рассылки без живого владельца"""
+    with get_engine().connect() as connection:
+        return list(connection.execute(_text(
+            "SELECT id FROM broadcasts WHERE status IN ('pending', 'running') "
+            "AND (owner IS NULL OR heartbeat_at < :stale) ORDER BY id"
+        ), {'stale': _stale_before()}).scalars())
+
+
+def claim_broadcast(broadcast_id: int) -> bool:
+    """
+    Атомарно берёт рассылку в аренду этому процессу. False — её отправляет живой
+    владелец или идёт другая рассылка (во всех процессах бота — одна за раз)
+    """
+    now = datetime.utcnow()
+    with get_engine().begin() as connection:
+        connection.execute(_text("SELECT pg_advisory_xact_lock(:key)"), {'key': BROADCAST_CLAIM_LOCK})
+        return connection.execute(_text(
+            "UPDATE broadcasts SET owner = :owner, heartbeat_at = :now, updated_at = :now "
+            "WHERE id = :id AND status IN ('pending', 'running') "
+            "AND (owner IS NULL OR owner = :owner OR heartbeat_at < :stale) "
+            "AND NOT EXISTS ("
+            "    SELECT 1 FROM broadcasts other WHERE other.id <> :id "
+            "    AND other.status IN ('pending', 'running') "
+            "    AND other.owner IS NOT NULL AND other.heartbeat_at >= :stale"
+            ") RETURNING id"
+        ), {'id': broadcast_id, 'owner': get_owner(), 'now': now, 'stale': _stale_before()}).first() is not None
+
+
+def _heartbeat(broadcast_id: int) -> Optional[str]:
+    """Продлевает аренду; None — рассылку забрал другой процесс"""
+    with get_engine().begin() as connection:
+        return connection.execute(_text(
+            "UPDATE broadcasts SET heartbeat_at = :now WHERE id = :id AND owner = :owner RETURNING status"
+        ), {'id': broadcast_id, 'owner': get_owner(), 'now': datetime.utcnow()}).scalar()
+
+
+def cancel_broadcast(broadcast_id: int) -> bool:
+    """Рассылка остановится после текущей страницы"""
+    with get_engine().begin() as connection:
+        return connection.execute(_text(
+            "UPDATE broadcasts SET status = 'cancelled', updated_at = :now "
+            "WHERE id = :id AND status IN ('pending', 'running')"
+        ), {'id': broadcast_id, 'now': datetime.utcnow()}).rowcount > 0
+
+
+def _recipients_query(limit: bool):
+    from sqlalchemy import bindparam
+
+    sql = "FROM users WHERE deleted_at IS NULL AND id > :last_user_id AND id NOT IN :excluded"
+    if limit:
+        sql = f"SELECT id {sql} ORDER BY id LIMIT :limit"
+    else:
+        sql = f"SELECT count(*) {sql}"
+    return _text(sql).bindparams(bindparam('excluded', expanding=True))
+
+
+def _count_recipients(last_user_id: int, excluded: list) -> int:
+    with get_engine().connect() as connection:
+        return connection.execute(
+            _recipients_query(limit=False), {'last_user_id': last_user_id, 'excluded': excluded}
+        ).scalar()
+
+
+def _fetch_recipients(last_user_id: int, excluded: list, limit: int) -> list:
+    # Keyset-страница по первичному ключу: короткий запрос вместо курсора,
+    # который держал бы транзакцию (и соединение pgbouncer) всю рассылку
+    with get_engine().connect() as connection:
+        return list(connection.execute(
+            _recipients_query(limit=True),
+            {'last_user_id': last_user_id, 'excluded': excluded, 'limit': limit}
+        ).scalars())
+
+
+def _save_progress(broadcast_id: int, values: dict) -> Optional[str]:
+    """
+    Обновляет прогресс (и heartbeat) и возвращает текущий статус, чтобы заметить
+    отмену. None — аренду забрал другой процесс
+    """
+    assignments = ', '.join(f"{column} = :{column}" for column in values)
+    now = datetime.utcnow()
+    with get_engine().begin() as connection:
+        return connection.execute(_text(
+            f"UPDATE broadcasts SET {assignments}, heartbeat_at = :now, updated_at = :now "
+            f"WHERE id = :id AND owner = :owner RETURNING status"
+        ), {**values, 'id': broadcast_id, 'owner': get_owner(), 'now': now}).scalar()
+
+
+def _seconds(retry_after) -> float:
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+
+class TokenBucket:
+    """Token bucket на rate сообщений в секунду; pause() — глобальная пауза после RetryAfter"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Общий на процесс бота: рассылки и напоминания об истечении подписки делят
+# один лимит Telegram и одну паузу после RetryAfter
+telegram_bucket = TokenBucket(BROADCAST_RATE)
+
+
+async def deliver_message(bot, chat_id: int, text: str, bucket: TokenBucket = None) -> str:
+    """
+    Отправка одного сообщения через token bucket: 'sent', 'blocked' (пользователь
+    заблокировал бота) или 'failed'. RetryAfter ставит на паузу весь bucket и
+    повторяет отправку, NetworkError повторяется с back-off
+    """
+    bucket = bucket or telegram_bucket
+    attempts = retry_afters = 0
+    while True:
+        await bucket.acquire()
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+            return 'sent'
+        except RetryAfter as e:
+            # Флуд-контроль действует на весь бот: останавливаем всех отправителей
+            retry_afters += 1
+            delay = max(PER_CHAT_INTERVAL, _seconds(e.retry_after))
+            logger.warning(f"⏳ RetryAfter {delay:.0f}s (chat {chat_id})")
+            bucket.pause(delay)
+            if retry_afters > MAX_RETRY_AFTER:
+                return 'failed'
+        except Forbidden:
+            return 'blocked'
+        except BadRequest as e:
+            logger.error(f"Не удалось отправить пользователю {chat_id}: {e}")
+            return 'failed'
+        except NetworkError as e:
+            attempts += 1
+            if attempts >= MAX_ATTEMPTS:
+                logger.error(f"Не удалось отправить пользователю {chat_id}: {e}")
+                return 'failed'
+            await asyncio.sleep(max(PER_CHAT_INTERVAL, 2 ** attempts))
+        except Exception as e:
+            logger.error(f"Не удалось отправить пользователю {chat_id}: {e}")
+            return 'failed'
+
+
+class BroadcastEngine:
+    """
+    Рассылка одного сообщения всем активным пользователям.
+
+    Получатели идут страницами по возрастанию users.id в ограниченную очередь,
+    BROADCAST_WORKERS воркеров отправляют сообщения, каждый берёт токен из общего
+    bucket-а. После страницы в broadcasts сохраняются счётчики и last_user_id —
+    после рестарта рассылка продолжается с него (повторно может уйти не больше
+    одной страницы).
+    """
+
+    def __init__(self, bot, rate: float = None, workers: int = None, chunk_size: int = None):
+        self.bot = bot
+        self.bucket = TokenBucket(rate) if rate else telegram_bucket
+        self.workers = workers or BROADCAST_WORKERS
+        self.chunk_size = chunk_size or BROADCAST_CHUNK_SIZE
+        self.counts = {'sent': 0, 'failed': 0, 'blocked': 0}
+        self.total = 0
+        self._processed_before = 0
+        self._started = None
+
+    async def _deliver(self, chat_id: int, text: str) -> str:
+        return await deliver_message(self.bot, chat_id, text, self.bucket)
+
+    async def _worker(self, queue: asyncio.Queue, text: str):
+        while True:
+            chat_id = await queue.get()
+            try:
+                self.counts[await self._deliver(chat_id, text)] += 1
+            finally:
+                queue.task_done()
+
+    def progress(self) -> dict:
+        """Текущая скорость (сообщений в секунду) и оценка оставшегося времени"""
+        processed = sum(self.counts.values())
+        elapsed = time.monotonic() - self._started if self._started else 0
+        rate = (processed - self._processed_before) / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - processed)
+        return {
+            **self.counts,
+            'processed': processed,
+            'total': self.total,
+            'rate': round(rate, 1),
+            'eta_seconds': int(remaining / rate) if rate > 0 else None
+        }
+
+    async def _keep_lease(self, broadcast_id: int):
+        # Страница может идти дольше аренды (RetryAfter) — heartbeat отдельно от прогресса
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                if await asyncio.to_thread(_heartbeat, broadcast_id) is None:
+                    logger.warning(f"⚠️ Рассылку #{broadcast_id} забрал другой процесс")
+                    return
+            except Exception as e:
+                logger.error(f"Broadcast #{broadcast_id} heartbeat error: {e}")
+
+    async def run(self, broadcast_id: int) -> dict:
+        """
+        Берёт рассылку в аренду и отправляет её. {'status': 'busy'} — рассылку
+        уже отправляет другой процесс или идёт другая рассылка: она останется
+        в очереди и её подхватит resume_broadcasts
+        """
+        if active_broadcasts:
+            return {'status': 'busy', 'broadcast_id': broadcast_id}
+        # Место занимается до первого await: второй run в этом процессе не пройдёт
+        active_broadcasts[broadcast_id] = self
+        try:
+            if not await asyncio.to_thread(claim_broadcast, broadcast_id):
+                return {'status': 'busy', 'broadcast_id': broadcast_id}
+            return await self._run(broadcast_id)
+        finally:
+            active_broadcasts.pop(broadcast_id, None)
+
+    async def _run(self, broadcast_id: int) -> dict:
+        from config import ADMIN_IDS
+
+        broadcast = await asyncio.to_thread(get_broadcast, broadcast_id)
+        if not broadcast or broadcast['status'] not in ('pending', 'running'):
+            return {'status': 'skipped', 'broadcast_id': broadcast_id}
+
+        excluded = list(ADMIN_IDS) if broadcast['exclude_admins'] else []
+        last_user_id = broadcast['last_user_id']
+        self.counts = {key: broadcast[key] for key in ('sent', 'failed', 'blocked')}
+        self._processed_before = sum(self.counts.values())
+        remaining = await asyncio.to_thread(_count_recipients, last_user_id, excluded)
+        self.total = self._processed_before + remaining
+
+        values = {'status': 'running', 'total': self.total}
+        if broadcast['status'] == 'pending':
+            values['started_at'] = datetime.utcnow()
+        if await asyncio.to_thread(_save_progress, broadcast_id, values) is None:
+            return {'status': 'lost', 'broadcast_id': broadcast_id}
+        logger.info(f"📢 Рассылка #{broadcast_id}: {remaining} получателей, {self.bucket.rate:g} msg/s")
+
+        self._started = time.monotonic()
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._worker(queue, broadcast['text'])) for _ in range(self.workers)]
+        workers.append(asyncio.create_task(self._keep_lease(broadcast_id)))
+        status = 'running'
+        last_log = time.monotonic()
+        try:
+            while status == 'running':
+                chat_ids = await asyncio.to_thread(_fetch_recipients, last_user_id, excluded, self.chunk_size)
+                if not chat_ids:
+                    status = 'done'
+                    break
+                for chat_id in chat_ids:
+                    await queue.put(chat_id)
+                await queue.join()
+
+                last_user_id = chat_ids[-1]
+                status = await asyncio.to_thread(
+                    _save_progress, broadcast_id, {'last_user_id': last_user_id, **self.counts}
+                ) or 'lost'
+
+                if time.monotonic() - last_log >= PROGRESS_LOG_INTERVAL:
+                    last_log = time.monotonic()
+                    progress = self.progress()
+                    logger.info(
+                        f"📢 Рассылка #{broadcast_id}: {progress['processed']}/{progress['total']}, "
+                        f"{progress['rate']} msg/s, ETA {progress['eta_seconds']}s"
+                    )
+
+            if status == 'done':
+                await asyncio.to_thread(
+                    _save_progress, broadcast_id, {'status': 'done', 'finished_at': datetime.utcnow()}
+                )
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+        progress = self.progress()
+        logger.info(
+            f"✅ Рассылка #{broadcast_id} {status}: отправлено {progress['sent']}, "
+            f"заблокировали бота {progress['blocked']}, ошибок {progress['failed']}"
+        )
+        return {'status': status, 'broadcast_id': broadcast_id, **progress}
+
+
+async def resume_broadcasts(bot):
+    """
+    Продолжает рассылки без живого владельца: прерванные рестартом или ждущие
+    в очереди за другой рассылкой. Рассылки идут по одной
+    """
+    for broadcast_id in await asyncio.to_thread(get_resumable_broadcasts):
+        if active_broadcasts:
+            return
+        result = await BroadcastEngine(bot).run(broadcast_id)
+        if result['status'] == 'busy':
+            return
+        logger.info(f"🔁 Рассылка #{broadcast_id} из очереди: {result['status']}")
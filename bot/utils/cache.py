@@ -1,42 +1,175 @@
 """
-Module containing utility functions for the VPN bot
+Module containing caching utilities for the VPN bot
 """
 import time
-from typing import Dict, Any, Optional
 import asyncio
 import logging
-import re
-import aiohttp
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Union
 
 logger = logging.getLogger(__name__)
 
-# Global cache for frequently accessed data
-cache_data: Dict[str, Any] = {}
 CACHE_TIMEOUT = 300  # 5 minutes cache timeout
 
+Ttl = Union[float, Callable[[Any], float]]
 
-def is_cache_valid(cache_key: str) -> bool:
-    """Check if cached data is still valid"""
-    if cache_key not in cache_data:
-        return False
-    
-    cached_at = cache_data[cache_key].get('cached_at', 0)
-    ttl = cache_data[cache_key].get('ttl', CACHE_TIMEOUT)
-    
-    return time.time() - cached_at < ttl
+
+class AsyncTTLCache:
+    """
+    Ограниченный LRU+TTL кэш для asyncio.
+
+    - не больше maxsize ключей, при переполнении вытесняется давно не читавшийся;
+    - single-flight: одновременные промахи по одному ключу ждут одну загрузку;
+    - stale-while-revalidate: в течение stale_ttl после истечения TTL отдаётся
+      старое значение, а обновление идёт в фоне;
+    - ttl может быть функцией от значения (например, короче для отрицательных
+      ответов); ttl <= 0 — значение не кэшируется. Исключения не кэшируются;
+    - invalidate/clear отменяют запись от загрузок, начатых до сброса: у каждой
+      загрузки своё поколение, и значение кладётся, только если поколение ключа
+      не сменилось. Ожидающие такой загрузки получат её результат, а следующий
+      промах запустит новую.
+
+    Кэш не потокобезопасен: пользоваться им нужно из одного цикла событий.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Ttl = CACHE_TIMEOUT, stale_ttl: float = 0, name: str = 'cache'):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # Поколение текущей загрузки ключа; номера не повторяются, поэтому
+        # отвязанная загрузка не совпадёт с поколением более поздней
+        self._generations: Dict[Hashable, int] = {}
+        self._next_generation = 0
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'loads': 0, 'errors': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self._data)
+
+    def _ttl_for(self, value: Any, ttl: Optional[Ttl]) -> float:
+        ttl = self.ttl if ttl is None else ttl
+        return ttl(value) if callable(ttl) else ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Свежее значение без загрузки"""
+        entry = self._data.get(key)
+        if entry is None or time.monotonic() >= entry[1]:
+            return default
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[Ttl] = None):
+        seconds = self._ttl_for(value, ttl)
+        if seconds <= 0:
+            self._data.pop(key, None)
+            return
+        expires_at = time.monotonic() + seconds
+        self._data[key] = (value, expires_at, expires_at + self.stale_ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _detach(self, key: Hashable):
+        """Загрузка, начатая до сброса, не запишет результат и не будет выдана новым промахам"""
+        self._inflight.pop(key, None)
+        self._generations.pop(key, None)
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+        self._detach(key)
+
+    def clear(self):
+        self._data.clear()
+        for key in list(self._inflight):
+            self._detach(key)
+
+    def metrics(self) -> dict:
+        lookups = self.stats['hits'] + self.stats['stale_hits'] + self.stats['misses']
+        hit_ratio = (self.stats['hits'] + self.stats['stale_hits']) / lookups if lookups else 0.0
+        return {'name': self.name, 'size': len(self._data), 'hit_ratio': round(hit_ratio, 3), **self.stats}
+
+    def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: Optional[Ttl]) -> asyncio.Task:
+        """Одна задача загрузки на ключ; результат кладётся в кэш по завершении"""
+        task = self._inflight.get(key)
+        if task is not None:
+            return task
+
+        self._next_generation += 1
+        generation = self._next_generation
+
+        async def load():
+            self.stats['loads'] += 1
+            value = await loader()
+            if self._generations.get(key) == generation:
+                self.set(key, value, ttl)
+            return value
+
+        def done(finished: asyncio.Task):
+            if self._inflight.get(key) is finished:
+                self._detach(key)
+            if not finished.cancelled() and finished.exception() is not None:
+                self.stats['errors'] += 1
+
+        task = asyncio.ensure_future(load())
+        task.add_done_callback(done)
+        self._inflight[key] = task
+        self._generations[key] = generation
+        return task
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: Optional[Ttl] = None) -> Any:
+        entry = self._data.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            value, expires_at, stale_until = entry
+            if now < expires_at:
+                self.stats['hits'] += 1
+                self._data.move_to_end(key)
+                return value
+            if now < stale_until:
+                self.stats['stale_hits'] += 1
+                self._data.move_to_end(key)
+                self._load(key, loader, ttl)
+                return value
+
+        self.stats['misses'] += 1
+        # shield: отмена одного ожидающего не отменяет загрузку для остальных
+        return await asyncio.shield(self._load(key, loader, ttl))
+
+
+def cached(cache: AsyncTTLCache, key: Callable[..., Hashable] = None, ttl: Optional[Ttl] = None):
+    """
+    Декоратор для async-функций: результат кэшируется в cache по key(*args, **kwargs)
+    (по умолчанию — по всем аргументам). wrapper.invalidate(*args, **kwargs) сбрасывает ключ.
+    """
+    def decorator(func):
+        def make_key(*args, **kwargs):
+            if key is not None:
+                return key(*args, **kwargs)
+            return (func.__qualname__, args, tuple(sorted(kwargs.items())))
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await cache.get_or_load(make_key(*args, **kwargs), lambda: func(*args, **kwargs), ttl)
+
+        wrapper.cache = cache
+        wrapper.invalidate = lambda *args, **kwargs: cache.invalidate(make_key(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+# Кэш общего назначения для простых значений
+default_cache = AsyncTTLCache(maxsize=1024, ttl=CACHE_TIMEOUT, name='default')
 
 
 def get_cached_data(cache_key: str) -> Optional[Any]:
     """Get data from cache if it's still valid"""
-    if is_cache_valid(cache_key):
-        return cache_data[cache_key]['data']
-    return None
+    return default_cache.get(cache_key)
 
 
 def set_cached_data(cache_key: str, data: Any, ttl: int = CACHE_TIMEOUT) -> None:
     """Store data in cache with TTL"""
-    cache_data[cache_key] = {
-        'data': data,
-        'cached_at': time.time(),
-        'ttl': ttl
-    }
\ No newline at end of file
+    default_cache.set(cache_key, data, ttl)
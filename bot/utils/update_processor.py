@@ -0,0 +1,88 @@
+"""
+Module containing the update processing policy for the VPN bot
+"""
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor, SimpleUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# sequential — по одному обновлению (как раньше); per_chat — параллельно, но по порядку
+# внутри одного чата; concurrent — параллельно без ограничений по чатам
+BOT_UPDATE_POLICY = os.getenv('BOT_UPDATE_POLICY', 'sequential')
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '64'))
+
+
+class ChatSerializedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обновления обрабатываются параллельно (не больше max_concurrent_updates),
+    но обновления одного чата — строго по очереди: двойное нажатие кнопки или
+    /start сразу после /key не обгоняют друг друга.
+
+    Порядок гарантируется внутри одного процесса бота.
+
+    Слот из max_concurrent_updates берётся уже под замком чата: обновления,
+    которые ждут свой чат, не занимают слоты — чат, заваливающий бота нажатиями,
+    держит не больше одного слота и не тормозит остальных пользователей.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._waiters: Dict[int, int] = {}
+
+    @staticmethod
+    def _chat_id(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Базовый process_update берёт общий семафор до do_process_update,
+        # то есть ещё до замка чата — ограничение применяется в do_process_update
+        await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat_id = self._chat_id(update)
+        if chat_id is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._waiters[chat_id] = self._waiters.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                async with self._slots:
+                    await coroutine
+        finally:
+            # Замок чата живёт, пока его кто-то ждёт — словарь не растёт бесконечно
+            self._waiters[chat_id] -= 1
+            if not self._waiters[chat_id]:
+                del self._waiters[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def build_update_processor(policy: str = None, max_concurrent: int = None):
+    """Политика обработки обновлений для ApplicationBuilder.concurrent_updates()"""
+    policy = policy or BOT_UPDATE_POLICY
+    max_concurrent = max_concurrent or BOT_CONCURRENT_UPDATES
+
+    if policy == 'per_chat':
+        return ChatSerializedUpdateProcessor(max_concurrent)
+    if policy == 'concurrent':
+        return SimpleUpdateProcessor(max_concurrent)
+    if policy != 'sequential':
+        logger.warning(f"Unknown BOT_UPDATE_POLICY={policy!r}, using sequential")
+    return False
@@ -0,0 +1,176 @@
+"""
+Webhook-режим бота (BOT_RUNTIME=webhook): aiohttp-сервер за nginx вместо long polling.
+
+- Telegram присылает обновления на BOT_WEBHOOK_URL (nginx: location /telegram/),
+  сервер проверяет secret token (BOT_WEBHOOK_SECRET обязателен, без него не стартует), кладёт обновление в очередь Application и сразу
+  отвечает 200 — обработка идёт параллельно по политике BOT_UPDATE_POLICY;
+- BOT_WORKERS процессов слушают один порт (SO_REUSEPORT), ядро распределяет
+  соединения Telegram между ними; webhook регистрирует и фоновые задачи
+  (напоминания, синхронизация, рассылки) выполняет только воркер 0;
+- /healthz — процесс жив, /readyz — Application запущен и принимает обновления.
+"""
+import os
+import re
+import sys
+import hmac
+import time
+import signal
+import asyncio
+import logging
+import multiprocessing
+from typing import Callable
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+BOT_WEBHOOK_URL = os.getenv('BOT_WEBHOOK_URL', '')  # https://delron.ru/telegram/webhook
+BOT_WEBHOOK_SECRET = os.getenv('BOT_WEBHOOK_SECRET', '')
+BOT_WEBHOOK_LISTEN = os.getenv('BOT_WEBHOOK_LISTEN', '0.0.0.0')
+BOT_WEBHOOK_PORT = int(os.getenv('BOT_WEBHOOK_PORT', '8081'))
+BOT_WEBHOOK_MAX_CONNECTIONS = int(os.getenv('BOT_WEBHOOK_MAX_CONNECTIONS', '40'))
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+
+WEBHOOK_PATH = '/telegram/webhook'
+# Формат secret_token, который принимает setWebhook
+WEBHOOK_SECRET_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,256}')
+
+
+def create_web_app(application: Application) -> web.Application:
+    """aiohttp-приложение: приём обновлений и проверки здоровья"""
+
+    async def webhook(request: web.Request) -> web.Response:
+        # /telegram/ открыт наружу: без секрета любой мог бы прислать Update от имени админа
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not BOT_WEBHOOK_SECRET or not hmac.compare_digest(token, BOT_WEBHOOK_SECRET):
+            return web.Response(status=403)
+
+        if not application.running:
+            # Telegram повторит доставку — обновление не потеряется
+            return web.Response(status=503)
+
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except ValueError:
+            return web.Response(status=400)
+
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'pid': os.getpid()})
+
+    async def readyz(request: web.Request) -> web.Response:
+        ready = application.running
+        return web.json_response(
+            {'status': 'ready' if ready else 'not_ready', 'pending_updates': application.update_queue.qsize()},
+            status=200 if ready else 503
+        )
+
+    app = web.Application(client_max_size=1024 * 1024)
+    app.router.add_post(WEBHOOK_PATH, webhook)
+    app.router.add_get('/healthz', healthz)
+    app.router.add_get('/readyz', readyz)
+    return app
+
+
+async def serve(build_application: Callable[..., Application], worker: int = 0):
+    """Один воркер: Application без Updater + HTTP-сервер до SIGTERM/SIGINT"""
+    primary = worker == 0
+    application = build_application(with_jobs=primary, webhook=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    # post_init/post_shutdown вызывает только run_polling/run_webhook — здесь вручную
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    if primary:
+        if BOT_WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=BOT_WEBHOOK_URL,
+                secret_token=BOT_WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=BOT_WEBHOOK_MAX_CONNECTIONS
+            )
+            logger.info(f"🔗 Webhook установлен: {BOT_WEBHOOK_URL}")
+        else:
+            logger.warning("BOT_WEBHOOK_URL not set, webhook must be registered manually")
+
+    runner = web.AppRunner(create_web_app(application), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, BOT_WEBHOOK_LISTEN, BOT_WEBHOOK_PORT, reuse_port=BOT_WORKERS > 1)
+    await site.start()
+    logger.info(f"🚀 Bot webhook worker {worker} (pid {os.getpid()}) listening on {BOT_WEBHOOK_LISTEN}:{BOT_WEBHOOK_PORT}")
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info(f"🛑 Stopping webhook worker {worker}...")
+        # Сначала перестаём принимать обновления, потом дорабатываем очередь
+        await runner.cleanup()
+        await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
+        logger.info(f"✅ Webhook worker {worker} stopped")
+
+
+def _run_worker(build_application: Callable[..., Application], worker: int):
+    asyncio.run(serve(build_application, worker))
+
+
+def run_webhook(build_application: Callable[..., Application]):
+    """
+    Запуск webhook-режима. При BOT_WORKERS > 1 текущий процесс становится
+    супервизором: запускает воркеры, перезапускает упавшие и передаёт им SIGTERM.
+    """
+    if not WEBHOOK_SECRET_PATTERN.fullmatch(BOT_WEBHOOK_SECRET):
+        raise RuntimeError(
+            "BOT_WEBHOOK_SECRET is required in webhook mode (1-256 characters: A-Z, a-z, 0-9, _ and -)"
+        )
+
+    if BOT_WORKERS <= 1:
+        _run_worker(build_application, 0)
+        return
+
+    context = multiprocessing.get_context('fork')
+    workers = {}
+    stopping = False
+
+    def start_worker(index: int):
+        process = context.Process(target=_run_worker, args=(build_application, index), name=f"bot-worker-{index}")
+        process.start()
+        workers[index] = process
+
+    def handle_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+        logger.info(f"🛑 Received signal {signum}, stopping {len(workers)} bot workers...")
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    for index in range(BOT_WORKERS):
+        start_worker(index)
+
+    while not stopping:
+        for index, process in list(workers.items()):
+            if not process.is_alive() and not stopping:
+                logger.error(f"❌ Bot worker {index} exited with code {process.exitcode}, restarting")
+                start_worker(index)
+        time.sleep(1)
+
+    for process in workers.values():
+        process.join(timeout=30)
+    sys.exit(0)